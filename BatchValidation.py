@@ -0,0 +1,282 @@
+"""
+Non-interactive entry point for validating many CSV files in one process.
+
+    python BatchValidation.py --rules rules.json data/*.csv
+    python BatchValidation.py --mapping mapping.json --workers 8 "incoming/*.csv"
+
+A mapping file is a JSON object from file name patterns (fnmatch style, e.g. "sales_*.csv") to rules
+files; the first pattern that matches a CSV's name decides its rules. Each rules file is parsed once
+and its ConstraintSet is reused for every CSV that uses it. One error log is written per CSV, plus a summary
+"""
+import argparse
+import datetime
+import fnmatch
+import glob
+import json
+import os
+import sys
+
+import ConstraintModule
+import CSVWrapper
+import Encodings
+import ErrorLogging
+
+
+class BatchValidator:
+    def __init__(self, rules: dict[str, str], *, workers: int = 1, engine: str = 'python', streaming: bool = False, directory: str = '.',
+                 caps: dict[str, int] = None, output_format: str = 'text', limits: dict[str, int] = None, sample: dict = None, mapped: bool = False,
+                 incremental: bool = False, fused: bool = False, verdict_cache: int = None, stats_format: str = None, stats_memory: bool = False,
+                 snapshot: bool = False, group_memory: int = None, encoding: str = 'UTF-8', fallbacks: tuple = Encodings.FALLBACKS,
+                 categorical: bool = False):
+        # rules maps file name patterns to rules files
+        self.rules = rules
+        self.workers = workers
+        self.engine = engine
+        self.streaming = streaming
+        self.directory = directory
+        # Keyword arguments for ErrorLogging.CappedSink, e.g. {'perColumn': 1000}
+        self.caps = caps or {}
+        self.output_format = output_format
+        # Keyword arguments for validateAll / validateStream, e.g. {'failFast': True}
+        self.limits = limits or {}
+        # Keyword arguments for validateSample; when set, files are only sampled
+        self.sample = sample
+        # Memory-map each file and keep only cell offsets instead of loading its columns as lists
+        self.mapped = mapped
+        # Only check rows appended since the last run, using the checkpoint that run left behind
+        self.incremental = incremental
+        # Check loaded files in one row-major pass instead of building and checking columns
+        self.fused = fused
+        # Size of the per-column verdict cache, None to check every value afresh
+        self.verdict_cache = verdict_cache
+        # 'json' or 'prometheus' to write the time and memory of each stage next to each error log, None for no stats
+        self.stats_format = stats_format
+        # Include the peak memory of each stage, which makes the run itself much slower
+        self.stats_memory = stats_memory
+        # Keep a binary snapshot of each loaded file's columns and use it when the same file is checked again
+        self.snapshot = snapshot
+        # Dictionary-encode loaded columns with few distinct values, see EncodedColumns
+        self.categorical = categorical
+        # Budget in bytes for the unique group keys of a file, beyond which they are spilled to disk. None keeps them in memory
+        self.group_memory = group_memory
+        # The encoding of every file, or 'auto' to sniff each one with the fallbacks chain, see Encodings.sniff
+        self.encoding = encoding
+        self.fallbacks = fallbacks
+        self.constraint_sets: dict[str, ConstraintModule.ConstraintSet] = {}
+        # Problems found in a rules file are repeated in the log of every CSV checked against it
+        self.rule_errors: dict[str, list[str]] = {}
+        self.results: list[tuple[str, str, str]] = []
+        # With more than one worker, one process pool checks every file and is shut down by close
+        self.pool = None
+
+    def rules_for(self, csv_path: str) -> str:
+        name = os.path.basename(csv_path)
+        for pattern, rules_path in self.rules.items():
+            if fnmatch.fnmatch(name, pattern):
+                return rules_path
+        return None
+
+    def constraint_set(self, rules_path: str) -> ConstraintModule.ConstraintSet:
+        if rules_path not in self.constraint_sets:
+            with ErrorLogging.MemorySink() as sink:
+                self.constraint_sets[rules_path] = ConstraintModule.ConstraintSet(rules_path)
+            if self.verdict_cache:
+                self.constraint_sets[rules_path].enableVerdictCache(self.verdict_cache)
+            if self.group_memory is not None:
+                self.constraint_sets[rules_path].spillGroups(self.group_memory)
+            if self.workers != 1:
+                self.constraint_sets[rules_path].useWorkerPool(self.worker_pool())
+            self.rule_errors[rules_path] = [error.rstrip('\n') for error in sink.errors]
+        return self.constraint_sets[rules_path]
+
+    def worker_pool(self):
+        if self.pool is None:
+            # Imported here so the process pool machinery is only loaded when it is asked for
+            import ParallelValidation
+            self.pool = ParallelValidation.create_pool(self.workers)
+        return self.pool
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def validate(self, csv_path: str) -> None:
+        name = os.path.basename(csv_path)
+        rules_path = self.rules_for(csv_path)
+        if rules_path is None:
+            self.results.append((csv_path, '', 'no rules file matches this file'))
+            return
+
+        if not os.path.isfile(csv_path):
+            self.results.append((csv_path, rules_path, 'file not found'))
+            return
+
+        constraint_set = self.constraint_set(rules_path)
+        extension = {'text': '.txt', 'jsonl': '.jsonl', 'csv': '.csv'}[self.output_format]
+        file_sink = ErrorLogging.FileSink(ErrorLogging.logFileName(name.lower().split('.csv')[0] + ' ', self.directory, extension),
+                                          header='Error log for ' + name + ' using ' + os.path.basename(rules_path) + '\n',
+                                          outputFormat=self.output_format)
+        if self.stats_format:
+            constraint_set.enableStats(self.stats_memory)
+        try:
+            with ErrorLogging.CappedSink(file_sink, **self.caps) as sink:
+                for error in self.rule_errors[rules_path]:
+                    ErrorLogging.log(error, rule='rules file')
+                wrapper = self.run(constraint_set, csv_path)
+            if self.stats_format:
+                self.write_stats(constraint_set.collectStats(), file_sink.fileName, name)
+        finally:
+            # The set is kept for the next file, but its columns and stats are not, even when this file failed
+            for constraint in constraint_set.constraints:
+                constraint.column = []
+            if self.stats_format:
+                constraint_set.disableStats()
+
+        if not wrapper.loaded:
+            status = 'could not be read'
+        else:
+            status = str(sink.count) + ' errors'
+        self.results.append((csv_path, rules_path, status))
+
+    def open(self, csv_path: str, **options) -> CSVWrapper.CSVWrapper:
+        return CSVWrapper.CSVWrapper(csv_path, encoding=self.encoding, fallbacks=self.fallbacks, **options)
+
+    def run(self, constraint_set: ConstraintModule.ConstraintSet, csv_path: str) -> CSVWrapper.CSVWrapper:
+        if self.incremental:
+            with constraint_set.measure('load'):
+                wrapper = self.open(csv_path, streaming=True)
+            if wrapper.loaded:
+                constraint_set.validateIncremental(wrapper)
+        elif self.streaming:
+            with constraint_set.measure('load'):
+                wrapper = self.open(csv_path, streaming=True)
+            if wrapper.loaded:
+                constraint_set.validateStream(wrapper, **self.limits)
+        elif self.fused and not self.sample:
+            with constraint_set.measure('load'):
+                wrapper = self.open(csv_path)
+            if wrapper.loaded:
+                constraint_set.validateFused(wrapper, **self.limits)
+        else:
+            with constraint_set.measure('load'):
+                wrapper = self.open(csv_path, mapped=self.mapped, snapshot=self.snapshot, categorical=self.categorical)
+            if wrapper.loaded:
+                with constraint_set.measure('split') as record:
+                    wrapper.loadColumns()
+                    record.rows = len(wrapper.columns[0]) if wrapper.columns else 0
+                constraint_set.matchToColumns(wrapper)
+                if self.sample:
+                    constraint_set.validateSample(**self.sample)
+                else:
+                    constraint_set.validateAll(self.engine, self.workers, **self.limits)
+        return wrapper
+
+    def write_stats(self, stats, log_name: str, csv_name: str) -> None:
+        base = os.path.splitext(log_name)[0]
+        if self.stats_format == 'prometheus':
+            stats.write_prometheus(base + '.prom', {'file': csv_name})
+        else:
+            stats.write_json(base + '.stats.json')
+
+    def write_summary(self) -> str:
+        file_name = self.directory + '/' + 'validation summary ' + str(datetime.datetime.now()).replace(':', '.') + '.txt'
+        lines = [f'{csv_path}: {status}' + (f' (rules: {rules_path})' if rules_path else '') for csv_path, rules_path, status in self.results]
+        for rules_path, constraint_set in self.constraint_sets.items():
+            for column, stats in constraint_set.verdictCacheStats().items():
+                lines.append(f'Verdict cache for {column} ({os.path.basename(rules_path)}): {stats["hits"]} hits, '
+                             f'{stats["misses"]} misses, {stats["hit_rate"]:.1%} hit rate')
+        with open(file_name, 'w', encoding='UTF-8') as file:
+            file.write('Validated ' + str(len(self.results)) + ' files\n' + '\n'.join(lines) + '\n')
+        return file_name
+
+    def failed(self) -> bool:
+        return any(status != '0 errors' for _, _, status in self.results)
+
+
+def expand_paths(patterns: list[str]) -> list[str]:
+    """
+    Expands globs here as well, since not every shell does it
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches if matches else [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Validate many CSV files against JSON rules files in one run.')
+    rules_group = parser.add_mutually_exclusive_group(required=True)
+    rules_group.add_argument('-r', '--rules', help='rules file used for every CSV')
+    rules_group.add_argument('-m', '--mapping', help='JSON file mapping file name patterns to rules files')
+    parser.add_argument('csv', nargs='+', help='CSV files or glob patterns')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='processes used per file, 0 for every core')
+    parser.add_argument('-o', '--output', default='.', help='directory for the error logs and summary')
+    parser.add_argument('--engine', choices=('python', 'numpy'), default='python', help='engine used for the column checks')
+    parser.add_argument('--stream', action='store_true', help='read files in chunks instead of loading them whole')
+    parser.add_argument('--mmap', action='store_true', help='memory-map files and decode cells only when they are checked')
+    parser.add_argument('--fused', action='store_true', help='run every check in one pass over the rows instead of column by column')
+    parser.add_argument('--snapshot', action='store_true', help='cache the parsed columns of each file and reuse them when it is checked again')
+    parser.add_argument('--categorical', action='store_true', help='dictionary-encode columns with few distinct values so each value is checked once')
+    parser.add_argument('--verdict-cache', type=int, metavar='SIZE', help='remember the verdicts for this many distinct values per column')
+    parser.add_argument('--group-memory', type=int, metavar='MB', help='spill unique group keys to disk when they would take more than this')
+    parser.add_argument('--incremental', action='store_true', help='only check rows appended since the last run of the same file and rules')
+    parser.add_argument('--format', choices=('text', 'jsonl', 'csv'), default='text', help='format of the error logs')
+    parser.add_argument('--encoding', default='UTF-8', help="encoding of the files, or 'auto' to work it out from the first few KB of each")
+    parser.add_argument('--fallback-encodings', default=','.join(Encodings.FALLBACKS), metavar='LIST',
+                        help='comma-separated encodings --encoding auto tries in turn')
+    parser.add_argument('--stats', choices=('json', 'prometheus'), help='write the time spent in each stage and column next to each error log')
+    parser.add_argument('--stats-memory', action='store_true', help='include the peak memory of each stage in --stats (slows the run down)')
+    parser.add_argument('--fail-fast', action='store_true', help='stop checking a file at its first error')
+    parser.add_argument('--stop-after', type=int, help='stop checking a file after this many errors')
+    parser.add_argument('--stop-after-per-column', type=int, help='stop checking a column after this many errors')
+    parser.add_argument('--sample', type=int, help='only check this many randomly chosen rows and estimate the error rate')
+    parser.add_argument('--stratified', action='store_true', help='spread the sampled rows evenly through the file')
+    parser.add_argument('--max-errors', type=int, help='stop logging after this many errors per file, only count the rest')
+    parser.add_argument('--max-errors-per-column', type=int, help='the same, per column')
+    parser.add_argument('--max-errors-per-rule', type=int, help='the same, per kind of check')
+    args = parser.parse_args(argv)
+    if args.sample and args.stream:
+        parser.error('--sample needs the whole file loaded, so it cannot be used with --stream')
+    if args.incremental and (args.sample or args.fail_fast or args.stop_after or args.stop_after_per_column):
+        parser.error('--incremental checks every new row, so it cannot be used with --sample or the --stop options')
+    if args.stats_memory and not args.stats:
+        parser.error('--stats-memory needs --stats')
+
+    if args.rules:
+        rules = {'*': args.rules}
+    else:
+        rules = json.load(open(args.mapping, encoding='UTF-8'))
+        # Relative rules paths are relative to the mapping file, not to wherever this is run from
+        mapping_dir = os.path.dirname(os.path.abspath(args.mapping))
+        rules = {pattern: os.path.join(mapping_dir, path) for pattern, path in rules.items()}
+
+    caps = {'total': args.max_errors, 'perColumn': args.max_errors_per_column, 'perRule': args.max_errors_per_rule}
+    limits = {'failFast': args.fail_fast, 'maxErrors': args.stop_after, 'maxErrorsPerColumn': args.stop_after_per_column}
+    sample = {'sampleSize': args.sample, 'stratified': args.stratified} if args.sample else None
+    with BatchValidator(rules, workers=args.workers or None, engine=args.engine, streaming=args.stream, directory=args.output,
+                        caps=caps, output_format=args.format, limits=limits, sample=sample, mapped=args.mmap,
+                        incremental=args.incremental, fused=args.fused, verdict_cache=args.verdict_cache,
+                        stats_format=args.stats, stats_memory=args.stats_memory, snapshot=args.snapshot,
+                        group_memory=args.group_memory and args.group_memory << 20, encoding=args.encoding,
+                        fallbacks=tuple(args.fallback_encodings.split(',')), categorical=args.categorical) as validator:
+        for csv_path in expand_paths(args.csv):
+            try:
+                validator.validate(csv_path)
+            except Exception as error:
+                # One file that can't be checked, e.g. against a broken rules file, mustn't cost the summary of the rest
+                print(f'Could not validate {csv_path}: {error!r}', file=sys.stderr)
+                validator.results.append((csv_path, validator.rules_for(csv_path) or '', f'failed: {error!r}'))
+        print('Summary written to ' + validator.write_summary())
+    return 1 if validator.failed() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+The CSV parser shared by CSVWrapper and FileHandler.Handler.
+Parsing is done by the csv module's C reader (RFC 4180 quoting, delimiters and newlines inside quoted fields)
+and rows are poured straight into per-column lists a block at a time, so no dict or per-field Python work is
+needed for well-formed rows.
+"""
+import csv
+import itertools
+
+# Rows are transposed into the columns this many at a time
+BLOCK_SIZE = 4096
+
+
+class Reader:
+    def __init__(self, delimiter: str = ',', quotechar: str = '"', trim_trailing: bool = True, skip_blank: bool = False):
+        # trim_trailing drops the block of empty or delimiter-only rows at the end of the file, as CSVWrapper always has
+        # skip_blank drops completely empty lines wherever they are, as csv.DictReader does
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.trim_trailing = trim_trailing
+        self.skip_blank = skip_blank
+
+    def reader(self, file):
+        if self.quotechar:
+            return csv.reader(file, delimiter=self.delimiter, quotechar=self.quotechar, strict=False)
+        return csv.reader(file, delimiter=self.delimiter, quoting=csv.QUOTE_NONE)
+
+    @staticmethod
+    def split_header(fields: list[str]) -> list[str]:
+        # Find the length of the header (ignoring empties that come after it)
+        header = list(fields) or ['']
+        while len(header) > 1 and header[-1] == '':
+            header.pop()
+        return header
+
+    @staticmethod
+    def fit(fields: list[str], column_count: int) -> list[str]:
+        # Ignore the possibly empty columns at the end; keep popping until there are column_count of them
+        # Or until a non-empty string is encountered
+        while len(fields) > column_count and fields[-1] == '':
+            fields.pop()
+        return fields
+
+    def rows(self, file):
+        """
+        Yields (row number, fields) for every record, the header being row 1.
+        A blank line comes out as a single empty field, the same as splitting it on the delimiter would give
+        """
+        # Trivial rows are held back until a non-trivial row shows they are not part of the trailing block
+        pending = []
+        for row_number, fields in enumerate(self.reader(file), 1):
+            if not fields:
+                if self.skip_blank:
+                    continue
+                fields = ['']
+            if self.trim_trailing and not any(fields):
+                pending.append((row_number, fields))
+                continue
+            if pending:
+                yield from pending
+                pending = []
+            yield row_number, fields
+
+    def read_columns(self, file, header: list[str] = None, on_mismatch=None) -> tuple[list[str], list[list[str]]]:
+        """
+        Reads the whole file into one list per column. header, if given, is used instead of reading the file's first row.
+        on_mismatch(row number, fields, column count) is called for rows with the wrong number of fields
+        and returns the fields to use instead, or None to leave the row out
+        """
+        records = self.reader(file)
+        row_number = 0
+        if header is None:
+            header = []
+            for header in records:
+                row_number += 1
+                if header or not self.skip_blank:
+                    break
+            if self.trim_trailing:
+                header = self.split_header(header)
+        column_count = len(header)
+        columns = [[] for _ in range(column_count)]
+        pending = []
+
+        while True:
+            chunk = list(itertools.islice(records, BLOCK_SIZE))
+            if not chunk:
+                break
+            # Blocks where every row has the right length go straight into the columns. A trivial last row could be
+            # the start of the trailing block, so that case goes through the row by row path instead
+            if not pending and any(chunk[-1]) and all(len(fields) == column_count for fields in chunk):
+                row_number += len(chunk)
+                block = chunk
+            else:
+                block = []
+                for fields in chunk:
+                    row_number += 1
+                    if not fields:
+                        if self.skip_blank:
+                            continue
+                        fields = ['']
+                    if self.trim_trailing and not any(fields):
+                        pending.append((row_number, fields))
+                        continue
+                    for pending_number, pending_fields in pending:
+                        self._add_row(block, pending_number, pending_fields, column_count, on_mismatch)
+                    pending = []
+                    self._add_row(block, row_number, fields, column_count, on_mismatch)
+            for column, values in zip(columns, zip(*block)):
+                column.extend(values)
+        return header, columns
+
+    def _add_row(self, block: list, row_number: int, fields: list[str], column_count: int, on_mismatch) -> None:
+        if len(fields) != column_count:
+            fields = self.fit(fields, column_count)
+            if len(fields) != column_count:
+                fields = on_mismatch(row_number, fields, column_count) if on_mismatch else None
+                if fields is None:
+                    return
+        block.append(fields)
@@ -1,54 +1,196 @@
-import ErrorLogging
-
-class CSVWrapper:
-
-    def __init__(self, filePath, delimiter='|', encoding='UTF-8'):
-        self.filePath = filePath
-        self.delimiter = delimiter
-        self.lines = []
-        self.encoding = encoding
-        self.columns = []
-        self.loaded = False
-        self.loadFile(filePath)
-
-    def loadFile(self, filePath):
-        try:
-            self.lines = open(filePath, encoding=self.encoding).read().split('\n')
-            # Remove trailing lines that are either empty of just contain the delimter multiple times
-            # This will keep going until the first non-trivial line is encountered
-            # Anything above that will be checked normally
-            while(self.lines[-1].replace('|', '') == ''):
-                self.lines.pop()
-            self.loaded = True
-        except UnicodeError:
-            # If the file cannot be read properly, there is not point contuning.
-            # Log this error and shut down the app
-            ErrorLogging.log("The file: " + filePath + " does not appear to be encoded in the UTF-8 standard so it cannot be checked.")
-            
-
-    def loadColumns(self):
-        # Find the leangth of the header (ignoring empties that come after it)
-        tempHeader = self.lines[0].split(self.delimiter)
-        while tempHeader[-1] == '':
-            tempHeader.pop()
-        numberOfColumns = len(tempHeader)
-        self.columns = []
-        for i in range(numberOfColumns):
-            self.columns.append([])
-
-        rowCounter = 1
-        while rowCounter < len(self.lines):
-            separatedLine = self.lines[rowCounter].split(self.delimiter)
-            # Ignore the possibly empty columns at the end; keep popping until len(separatedLines) == noOfColumns
-            # Or until a non-empty string is encountered
-            while len(separatedLine) > numberOfColumns and separatedLine[-1] == '':
-                separatedLine.pop()
-            
-            if len(separatedLine) != numberOfColumns:
-                ErrorLogging.log("Row: " + str(rowCounter + 1) + " has " + str(len(separatedLine)) + " columns but the header has " + str(numberOfColumns) + ".")
-            else:
-                for col in range(numberOfColumns):
-                    self.columns[col].append(separatedLine[col])
-
-            rowCounter += 1
-
+import ColumnSnapshots
+import CSVReader
+import EncodedColumns
+import Encodings
+import ErrorLogging
+import MappedColumns
+import io
+
+class CSVWrapper:
+
+    def __init__(self, filePath, delimiter='|', encoding='UTF-8', streaming=False, chunkSize=1 << 20, quotechar='"', mapped=False, categorical=False, snapshot=False,
+                 fallbacks=Encodings.FALLBACKS):
+        self.filePath = filePath
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.text = None
+        # encoding='auto' picks the first encoding in fallbacks that the start of the file decodes in, see Encodings.sniff
+        # Bytes that aren't valid in the encoding are logged with their row and read as U+FFFD, the rest is checked as usual
+        self.encoding = Encodings.sniff_file(filePath, fallbacks) if encoding == Encodings.AUTO else encoding
+        self.columns = []
+        self.header = []
+        self.loaded = False
+        # Fields are parsed by the shared CSVReader, which understands quoting; quotechar=None splits on every delimiter
+        self.reader = CSVReader.Reader(delimiter, quotechar)
+        # In streaming mode the file is never held in memory; it is read through a buffer of chunkSize bytes
+        self.streaming = streaming
+        self.chunkSize = chunkSize
+        # In mapped mode the file is memory-mapped and the columns only hold the offsets of their cells, see MappedColumns
+        # Files that can't be mapped (empty, or in an encoding like UTF-16) are loaded into lists as usual
+        self.mapped = mapped and not streaming and MappedColumns.can_map(filePath, self.encoding, delimiter, quotechar)
+        self.source = None
+        # With categorical, loaded columns with few distinct values are dictionary-encoded, see EncodedColumns
+        # The columns are then EncodedColumns rather than lists, which anything reading them directly has to allow for
+        self.categorical = categorical
+        # With snapshot the parsed columns are saved to a binary file keyed by the file's content, see ColumnSnapshots
+        # Loading the same bytes again, e.g. to check them against another rules file, then skips decoding and splitting
+        self.snapshot = snapshot and not self.mapped and not streaming
+        self.snapshotKey = None
+        self.snapshotFile = None
+        # (row, byte offset) of every byte that couldn't be decoded, kept for the snapshot
+        self.badBytes = []
+        if streaming:
+            self.loadHeader(filePath)
+        else:
+            self.loadFile(filePath)
+
+    def loadFile(self, filePath):
+        if self.mapped:
+            self.mapFile(filePath)
+            return
+        try:
+            if self.snapshot:
+                if self.loadSnapshot(filePath):
+                    return
+            else:
+                # The whole file is decoded up front so an encoding problem is found before anything is checked
+                self.text = self.decode(open(filePath, 'rb').read())
+            self.header = self.readHeader(io.StringIO(self.text))
+            self.loaded = True
+        except UnicodeError:
+            # If the file cannot be read properly, there is not point contuning.
+            # Log this error and shut down the app
+            self.logEncodingError(filePath)
+
+    def loadSnapshot(self, filePath):
+        # Returns True if the file has a snapshot. Otherwise the bytes read to find it are decoded as loadFile would
+        content = open(filePath, 'rb').read()
+        self.snapshotKey = ColumnSnapshots.snapshot_key(content, (self.delimiter, self.quotechar, self.encoding, self.categorical))
+        self.snapshotFile = ColumnSnapshots.load(self.snapshotKey)
+        if self.snapshotFile is not None:
+            # The file decoded when the snapshot was made, and its bytes haven't changed since
+            for rowNumber, offset in self.snapshotFile.bad_bytes:
+                self.logBadByte(rowNumber, offset)
+            self.header = self.snapshotFile.header
+            self.loaded = True
+            return True
+        self.text = self.decode(content)
+        return False
+
+    def decode(self, content):
+        # Bytes that can't be decoded are logged with the row they are in and the rest of the file is checked as usual
+        # Encodings.decode raises UnicodeError when there are so many that the file must be in another encoding
+        text, badBytes = Encodings.decode(content, self.encoding)
+        if badBytes:
+            rows = Encodings.rows_of(text, [position for position, offset in badBytes], self.reader.reader)
+            self.badBytes = [(rowNumber, offset) for rowNumber, (position, offset) in zip(rows, badBytes)]
+            for rowNumber, offset in self.badBytes:
+                self.logBadByte(rowNumber, offset)
+        return text
+
+    def mapFile(self, filePath):
+        try:
+            self.source = MappedColumns.MappedFile(filePath, self.encoding)
+            # Decoded once in chunks so an encoding problem is still found before anything is checked
+            self.source.check_decodes()
+            self.header = MappedColumns.read_header(self.source, self.delimiter, self.quotechar)[0]
+            self.loaded = True
+        except UnicodeError:
+            # Cells are decoded whenever they are read, so a file with bad bytes is loaded instead, which reports them
+            self.source.close()
+            self.source = None
+            self.mapped = False
+            self.loadFile(filePath)
+
+    def loadHeader(self, filePath):
+        # Only the first row is read here, the rest of the file is read by iterRows when it is needed
+        try:
+            with self.openFile() as fileObject:
+                self.header = self.readHeader(fileObject)
+                for offset in fileObject.bad:
+                    self.logBadByte(1, offset)
+            self.loaded = True
+        except UnicodeError:
+            self.logEncodingError(filePath)
+
+    def openFile(self):
+        # The lines of the file, decoded chunkSize bytes at a time
+        return Encodings.LineDecoder(open(self.filePath, 'rb'), self.encoding, self.chunkSize)
+
+    def readHeader(self, fileObject):
+        first = next(self.reader.rows(fileObject), None)
+        return self.reader.split_header(first[1] if first else [])
+
+    def logEncodingError(self, filePath):
+        ErrorLogging.log("The file: " + filePath + " does not appear to be encoded in the " + self.encoding + " standard so it cannot be checked.", rule='encoding')
+
+    def logBadByte(self, rowNumber, offset):
+        ErrorLogging.record('encoding', rowNumber, None, None, {'offset': offset, 'encoding': self.encoding}, formatBadByte)
+
+    def logMismatch(self, rowNumber, fields, numberOfColumns):
+        # Rows with the wrong number of columns are logged and left out
+        ErrorLogging.record('column count', rowNumber, None, None, {'columns': len(fields), 'expected': numberOfColumns}, formatColumnCount)
+        return None
+
+    def loadColumns(self):
+        if self.mapped:
+            self.header, self.columns = MappedColumns.read_columns(self.source, self.delimiter, self.quotechar, on_mismatch=self.logMismatch)
+            return
+        if self.snapshotFile is not None:
+            # Only the rows left out are logged now, each column is read from the snapshot when it is first used
+            for rowNumber, count in self.snapshotFile.mismatches:
+                self.logMismatch(rowNumber, [None] * count, len(self.snapshotFile.header))
+            self.header, self.columns = self.snapshotFile.header, self.snapshotFile.columns()
+            return
+        mismatches = []
+
+        def onMismatch(rowNumber, fields, numberOfColumns):
+            mismatches.append((rowNumber, len(fields)))
+            return self.logMismatch(rowNumber, fields, numberOfColumns)
+
+        # Trailing empty or delimiter-only rows are dropped by the reader, anything above them is checked normally
+        self.header, self.columns = self.reader.read_columns(io.StringIO(self.text), on_mismatch=onMismatch)
+        if self.categorical:
+            self.columns = [EncodedColumns.encode(column) for column in self.columns]
+        if self.snapshot:
+            ColumnSnapshots.save(self.snapshotKey, self.header, self.columns, mismatches, self.badBytes)
+        # The columns hold everything that is needed from here on
+        self.text = None
+
+    def iterRows(self):
+        # Streaming equivalent of loadColumns: yields (rowNumber, fields) for every row after the header
+        # Rows with the wrong number of columns are logged and skipped, exactly as loadColumns does
+        # A loaded file is read from the text already decoded, a streaming one from disk
+        numberOfColumns = len(self.header)
+        rowNumber = 1
+        try:
+            with (io.StringIO(self.text) if self.text is not None else self.openFile()) as fileObject:
+                # A file read from disk notes the bad bytes in each line as it is read. Those in the header were logged by loadHeader
+                badBytes = getattr(fileObject, 'bad', None)
+                rows = self.reader.rows(fileObject)
+                next(rows, None)
+                if badBytes:
+                    badBytes.clear()
+                for rowNumber, fields in rows:
+                    # Rows that are held back for being empty can't have a bad byte in them, so any belong to this one
+                    if badBytes and any(fields):
+                        for offset in badBytes:
+                            self.logBadByte(rowNumber, offset)
+                        badBytes.clear()
+                    if len(fields) != numberOfColumns:
+                        fields = self.reader.fit(fields, numberOfColumns)
+                        if len(fields) != numberOfColumns:
+                            self.logMismatch(rowNumber, fields, numberOfColumns)
+                            continue
+                    yield rowNumber, fields
+        except UnicodeError:
+            # Anything already yielded has been checked, but the rest of the file cannot be read
+            ErrorLogging.log("The file: " + self.filePath + " could not be decoded after row " + str(rowNumber) + " so the rest of it cannot be checked.", rule='encoding')
+            self.loaded = False
+
+
+def formatColumnCount(record):
+    return "Row: " + str(record.row) + " has " + str(record.params['columns']) + " columns but the header has " + str(record.params['expected']) + "."
+
+def formatBadByte(record):
+    return "Row: " + str(record.row) + " has a byte at offset " + str(record.params['offset']) + " that is not valid " + record.params['encoding'] + ". It was read as \ufffd."
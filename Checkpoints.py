@@ -0,0 +1,134 @@
+"""
+Checkpoints for ConstraintSet.validateIncremental.
+A checkpoint records how far into a CSV file the last run got (a byte offset on a record boundary), the SHA-256 of
+everything before that offset, and the unique group and one to one indexes as they were at that point. The next
+run re-hashes the prefix to make sure it wasn't edited, then only reads what comes after it
+"""
+import dataclasses
+import hashlib
+import os
+import pickle
+
+import Encodings
+import RulePlan
+import UniqueGroups
+
+# Bump this whenever Checkpoint changes so that old checkpoints are ignored rather than misread
+CHECKPOINT_VERSION = 4
+# The prefix is hashed this many bytes at a time
+HASH_CHUNK = 1 << 20
+
+
+@dataclasses.dataclass
+class Checkpoint:
+    # Anything that changes how rows are read or checked: the rules file's hash, delimiter, quote character, encoding
+    settings: tuple
+    group_index: UniqueGroups.UniqueGroupIndex
+    # Pair name to the OneToOne.PairIndex built by the one to one check
+    pair_records: dict
+    offset: int = 0
+    # Rows read so far, the header included
+    row_number: int = 0
+    prefix_hash: str = hashlib.sha256().hexdigest()
+
+
+def default_path(csv_path: str, rules_path: str) -> str:
+    # One checkpoint per CSV and rules file pair, kept alongside the cached rule plans
+    key = hashlib.sha256((os.path.abspath(csv_path) + '\0' + os.path.abspath(rules_path)).encode('UTF-8')).hexdigest()[:32]
+    return os.path.join(RulePlan.CACHE_DIR, 'checkpoints', key + '.pickle')
+
+
+def load(path: str) -> Checkpoint:
+    try:
+        with open(path, 'rb') as file:
+            record = pickle.load(file)
+        if record['version'] == CHECKPOINT_VERSION:
+            return record['checkpoint']
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError, TypeError):
+        pass
+    return None
+
+
+def save(path: str, checkpoint: Checkpoint) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and then renamed so a crash never leaves half a checkpoint behind
+        temp_path = path + '.' + str(os.getpid())
+        with open(temp_path, 'wb') as file:
+            pickle.dump({'version': CHECKPOINT_VERSION, 'checkpoint': checkpoint}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except OSError:
+        # Without a checkpoint the next run simply checks the whole file again
+        pass
+
+
+def remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def resume(file, checkpoint: Checkpoint, settings: tuple):
+    """
+    Returns the hash of file up to the checkpoint's offset if the checkpoint can be carried on from, otherwise None.
+    It can't if the settings differ, the file is shorter than the offset or any byte before the offset has changed
+    """
+    if checkpoint is None or checkpoint.settings != settings or os.fstat(file.fileno()).st_size < checkpoint.offset:
+        return None
+    digest = hashlib.sha256()
+    file.seek(0)
+    remaining = checkpoint.offset
+    while remaining > 0:
+        chunk = file.read(min(HASH_CHUNK, remaining))
+        if not chunk:
+            return None
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest if digest.hexdigest() == checkpoint.prefix_hash else None
+
+
+def committed_records(file, checkpoint: Checkpoint, digest, reader, encoding: str):
+    """
+    Yields (fields, bad byte offsets) for every complete record after the checkpoint, moving its offset and the hash
+    past each one. Lines are decoded by Encodings.complete_lines, so bytes that aren't valid in encoding are read as
+    U+FFFD and reported rather than ending the run, and go through reader, a csv reader factory, so the checkpoint only
+    ever stops between records and never inside a quoted field that spans several lines. A record that the end of the
+    file cuts short may still be being written, and empty or delimiter-only records at the end may be followed by more
+    rows later, so both are left for the next run
+    """
+    if checkpoint.offset > 0:
+        # A codec that reads a byte order mark has to be told what the mark at the start of the file said
+        file.seek(0)
+        encoding = Encodings.resumed(encoding, file.read(4))
+    file.seek(checkpoint.offset)
+    # The (bytes, bad byte offsets) of each line the reader has taken since its last record, and whether it has run
+    # out of complete lines
+    taken = []
+    state = {'exhausted': False}
+
+    def lines():
+        for line, data, bad in Encodings.complete_lines(file, encoding):
+            taken.append((data, bad))
+            yield line
+        state['exhausted'] = True
+
+    # Trivial records held back, and the bytes of the lines they and the records after them came from
+    pending = []
+    pending_data = []
+    for fields in reader(lines()):
+        if state['exhausted']:
+            # The reader only gives out a record once it has run out of lines when a quoted field was left open
+            break
+        pending.append((fields, [offset for data, bad in taken for offset in bad]))
+        pending_data.extend(data for data, bad in taken)
+        taken.clear()
+        if not any(fields):
+            continue
+        for data in pending_data:
+            digest.update(data)
+            checkpoint.offset += len(data)
+        yield from pending
+        pending = []
+        pending_data = []
+    checkpoint.prefix_hash = digest.hexdigest()
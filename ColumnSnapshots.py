@@ -0,0 +1,217 @@
+"""
+Binary columnar snapshots of parsed CSV files, so a file that has been checked before doesn't have to be decoded and
+split again, e.g. when it is re-checked against an edited rules file.
+
+A snapshot is keyed by the SHA-256 of the file's bytes and the settings it was parsed with, and holds the header,
+the rows that had the wrong number of columns, the bytes that couldn't be decoded and every column in the most
+compact of these forms:
+    encoded     an EncodedColumn's one byte codes and its distinct values
+    dictionary  wider codes and the distinct values, for other columns whose values repeat
+    int         64-bit integers, for columns of plain integers
+    text        every value, as one UTF-8 block and the length of each value
+Columns are only read from the snapshot when they are first used, one at a time.
+
+    python ColumnSnapshots.py inspect data.csv [delimiter]   # describe the snapshot of a file, if there is one
+    python ColumnSnapshots.py clear                          # delete every snapshot
+"""
+import array
+import collections.abc
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+
+import EncodedColumns
+import RulePlan
+
+MAGIC = b'CSVSNAP\x01'
+# Bump this whenever the layout changes so that old snapshots are parsed again rather than misread
+SNAPSHOT_VERSION = 2
+# Columns with no more than this share of distinct values are stored as a dictionary
+DICTIONARY_SHARE = 0.5
+# Integers that survive a round trip through int() unchanged and fit in 64 bits
+PLAIN_INT = re.compile(r'0|-?[1-9][0-9]{0,17}')
+
+
+def snapshot_dir() -> str:
+    return os.path.join(RulePlan.CACHE_DIR, 'snapshots')
+
+
+def snapshot_key(content: bytes, settings: tuple) -> str:
+    # settings is everything that changes how the bytes are parsed: delimiter, quote character, encoding...
+    digest = hashlib.sha256(content)
+    digest.update(repr((SNAPSHOT_VERSION,) + tuple(settings)).encode('UTF-8'))
+    return digest.hexdigest()
+
+
+def snapshot_path(key: str) -> str:
+    return os.path.join(snapshot_dir(), key[:32] + '.colsnap')
+
+
+def _text_parts(values: list) -> list:
+    lengths = array.array('I', map(len, values))
+    return [lengths, ''.join(values).encode('UTF-8', 'surrogatepass')]
+
+
+def _read_text(lengths: array.array, blob: bytes) -> list[str]:
+    text = blob.decode('UTF-8', 'surrogatepass')
+    ends = list(itertools.accumulate(lengths))
+    return [text[start:end] for start, end in zip(itertools.chain((0,), ends), ends)]
+
+
+def _column_parts(column) -> tuple[str, list]:
+    """
+    (kind, arrays and byte strings to write) for a column, see the module docstring for the kinds
+    """
+    if isinstance(column, EncodedColumns.EncodedColumn):
+        return 'encoded', [column.codes] + _text_parts(column.values)
+    codes = {}
+    for value in column:
+        codes.setdefault(value, len(codes))
+    if len(codes) <= len(column) * DICTIONARY_SHARE:
+        typecode = 'H' if len(codes) <= 1 << 16 else 'I'
+        return 'dictionary', [array.array(typecode, map(codes.__getitem__, column))] + _text_parts(list(codes))
+    fullmatch = PLAIN_INT.fullmatch
+    if all(fullmatch(value) for value in column):
+        return 'int', [array.array('q', map(int, column))]
+    return 'text', _text_parts(column)
+
+
+def save(key: str, header: list[str], columns: list, mismatches: list[tuple[int, int]], bad_bytes: list[tuple[int, int]] = ()) -> None:
+    """
+    Writes a snapshot. mismatches holds (row number, number of fields) for every row left out for having the wrong
+    number of columns and bad_bytes (row number, byte offset) for every byte that couldn't be decoded, so that they
+    are logged again when the snapshot is used
+    """
+    path = snapshot_path(key)
+    blocks = []
+    column_meta = []
+    position = 0
+    for column in columns:
+        kind, parts = _column_parts(column)
+        part_meta = []
+        for part in parts:
+            data = part.tobytes() if isinstance(part, array.array) else part
+            part_meta.append([position, len(data), part.typecode if isinstance(part, array.array) else None])
+            blocks.append(data)
+            position += len(data)
+        column_meta.append({'kind': kind, 'parts': part_meta})
+    meta = json.dumps({'version': SNAPSHOT_VERSION, 'key': key, 'byteorder': sys.byteorder, 'header': header,
+                       'rows': len(columns[0]) if columns else 0, 'mismatches': mismatches, 'bad_bytes': list(bad_bytes), 'columns': column_meta}).encode('UTF-8')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and then renamed so a concurrent reader never sees half a file
+        temp_path = path + '.' + str(os.getpid())
+        with open(temp_path, 'wb') as file:
+            file.write(MAGIC + len(meta).to_bytes(8, 'little') + meta)
+            file.writelines(blocks)
+        os.replace(temp_path, path)
+    except OSError:
+        # A read-only or missing cache directory only costs speed
+        pass
+
+
+class Snapshot:
+    def __init__(self, path: str, meta: dict, data_start: int):
+        self.path = path
+        self.meta = meta
+        self.data_start = data_start
+        self.header: list[str] = meta['header']
+        self.mismatches: list[tuple[int, int]] = [tuple(mismatch) for mismatch in meta['mismatches']]
+        self.bad_bytes: list[tuple[int, int]] = [tuple(bad_byte) for bad_byte in meta['bad_bytes']]
+
+    def read_column(self, position: int):
+        column_meta = self.meta['columns'][position]
+        parts = []
+        with open(self.path, 'rb') as file:
+            for offset, length, typecode in column_meta['parts']:
+                file.seek(self.data_start + offset)
+                data = file.read(length)
+                if typecode is None:
+                    parts.append(data)
+                else:
+                    part = array.array(typecode)
+                    part.frombytes(data)
+                    parts.append(part)
+        kind = column_meta['kind']
+        if kind == 'encoded':
+            return EncodedColumns.EncodedColumn(parts[0], _read_text(parts[1], parts[2]))
+        if kind == 'dictionary':
+            values = _read_text(parts[1], parts[2])
+            return list(map(values.__getitem__, parts[0]))
+        if kind == 'int':
+            return list(map(str, parts[0]))
+        return _read_text(parts[0], parts[1])
+
+    def columns(self) -> 'SnapshotColumns':
+        return SnapshotColumns(self)
+
+
+class SnapshotColumns(collections.abc.Sequence):
+    # The columns of a snapshot, each read from the file the first time it is asked for
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self.loaded = {}
+
+    def __len__(self) -> int:
+        return len(self.snapshot.meta['columns'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('column index out of range')
+        if index not in self.loaded:
+            self.loaded[index] = self.snapshot.read_column(index)
+        return self.loaded[index]
+
+
+def load(key: str) -> Snapshot:
+    """
+    The snapshot saved under key, or None if there isn't a usable one
+    """
+    path = snapshot_path(key)
+    try:
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                return None
+            length = int.from_bytes(file.read(8), 'little')
+            meta = json.loads(file.read(length).decode('UTF-8'))
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != SNAPSHOT_VERSION or meta.get('key') != key or meta.get('byteorder') != sys.byteorder:
+        return None
+    return Snapshot(path, meta, len(MAGIC) + 8 + length)
+
+
+def clear() -> None:
+    directory = snapshot_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.colsnap'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'inspect':
+        import CSVWrapper
+        wrapper = CSVWrapper.CSVWrapper(sys.argv[2], *sys.argv[3:4], snapshot=True)
+        snapshot = wrapper.snapshotFile
+        if snapshot is None:
+            print('No snapshot of ' + sys.argv[2] + ' yet')
+        else:
+            print(f'Snapshot of {sys.argv[2]} at {snapshot.path}: {snapshot.meta["rows"]} rows, {len(snapshot.mismatches)} rows left out')
+            for name, column_meta in zip(snapshot.header, snapshot.meta['columns']):
+                print(f'  {name}: {column_meta["kind"]}, {sum(part[1] for part in column_meta["parts"])} bytes')
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'clear':
+        clear()
+    else:
+        print('Usage: python ColumnSnapshots.py inspect <csv file> [delimiter] | clear')
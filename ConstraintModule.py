@@ -1,329 +1,738 @@
-# Module for parsing json files to detect constraints for manual inputs
-
-import json
-import ErrorLogging
-import CSVWrapper
-import time
-
-class ConstraintSet:
-
-    def __init__(self):
-        self.constraints = []
-        self.uniqueGroups = {}
-        self.oneToOnePairs = {}
-        self.filePath = ''
-
-        
-    def __init__(self, filePath):
-        self.constraints = []
-        self.uniqueGroups = {}
-        self.oneToOnePairs = {}
-        self.loadConstraints(filePath)
-        self.filePath = filePath
-
-    def loadConstraints(self, filePath):
-        loadedJSON = json.load(open(filePath, encoding="UTF-8"))
-        for i in loadedJSON:
-            newConstraint = Constraint()
-            self.constraints.append(newConstraint)
-            
-            try:
-                newConstraint.colName = i['Column']
-            except KeyError:
-                # If the column constraint doesn't even have a name, skip it and tell the user
-                ErrorLogging.log(filePath + ' contains a column that has not been named. Please fix this.')
-                self.constraints.pop()
-                continue
-            
-            try:
-                newConstraint.essential = eval(i['Essential'])
-            except KeyError:
-                newConstraint.essential = False
-
-            try:
-                newConstraint.hashable = eval(i['Hashable'])
-            except KeyError:
-                newConstraint.Hashable = False
-
-            try:
-                newConstraint.minimum = float(i['Minimum'])
-            except KeyError:
-                newConstraint.minimum = -float('inf')
-
-            try:
-                newConstraint.maximum = float(i['Maximum'])
-            except KeyError:
-                newConstraint.maximum = float('inf')
-
-            try:
-                newConstraint.possibleValues = i['Values']
-                newConstraint.validate = Constraint.validateFinitePossibilities
-            except KeyError:
-                pass
-
-            try:
-                if i['Unique Group'].upper() != 'NONE':
-                    if i['Unique Group'] in self.uniqueGroups:
-                        self.uniqueGroups[i['Unique Group']].append(newConstraint)
-                        newConstraint.uniqueGroup = i['Unique Group']
-                    else:
-                        self.uniqueGroups[i['Unique Group']] = []
-                        self.uniqueGroups[i['Unique Group']].append(newConstraint)
-                        newConstraint.uniqueGroup = i['Unique Group']
-            except KeyError:
-                pass
-
-            try:
-                newConstraint.trimmed = eval(i['Trimmed'])
-            except KeyError:
-                newConstraint.trimmed = False
-
-            # If a type isn't specified let the script fail completely, that should never be allowed
-            if i['Type'].upper() == 'INT' or i['Type'].upper() == 'INTEGER':
-                newConstraint.colType = int
-                newConstraint.decimalPlaces = 0
-                newConstraint.validate = newConstraint.validateNumber
-                newConstraint.validateList = newConstraint.validateNumList
-            elif i['Type'].upper() == 'FLOAT' or i['Type'].upper() == 'DECIMAL':
-                newConstraint.colType = float
-                newConstraint.decimalPlaces = int(i['Decimal Places'])
-                newConstraint.validate = newConstraint.validateNumber
-                newConstraint.validateList = newConstraint.validateNumList
-            elif i['Type'].upper() == 'TEXT' or i['Type'].upper() == 'STRING':
-                newConstraint.colType = str
-                newConstraint.decimalPlaces = 0
-                newConstraint.validate = newConstraint.validateString
-                newConstraint.validate = newConstraint.validateStringList
-
-            # If a finite range of vaues has been given, that should supercede everything else
-            try:
-                newConstraint.values = i['Values']
-                newConstraint.validate = newConstraint.validateFinitePossibilities
-                newConstraint.validateList = newConstraint.validatePossibilitiesList
-            except KeyError:
-                # If no values were given, then use the standard validation by type method
-                pass
-
-            # Check for one to one properties and pair up the appropriate constraint objects as necessary
-            try:
-                newConstraint.oneToOne = i['One To One']
-                if i['One To One'] in self.oneToOnePairs:
-                    if len(self.oneToOnePairs[i['One To One']]) == 2:
-                        ErrorLogging.log('Error with the One to One Pairing ' + i['One To One'] + '. More than 2 columns are in this pairing. This is an issue with the JSON file selected.')
-                    else:
-                        self.oneToOnePairs[i['One To One']].append(newConstraint)
-                else:
-                    self.oneToOnePairs[i['One To One']] = [newConstraint]
-            except KeyError:
-                pass
-
-            try:
-                if i['Case Sensitive'].upper() == 'TRUE':
-                    newConstraint.caseSensitive = True
-                elif i['Case Sensitive'].upper() == 'FALSE':
-                    newConstraint.caseSensitive = False
-                else:
-                    # If a non-boolean value was entered, tell the user there's a problem.
-                    ErrorLogging.log('Error with chosen json file: ' + filePath + ' . Column ' + i['Column'] + ' specifies that case sensitivity is ' + i['Case Sensitive'] + ' but only values True and False are valid. Please correct this before usinmg this json file again.')
-                if newConstraint.colType != str:
-                    ErrorLogging.log('Only columns of type string can use the Case Sensistive parameter. Please correct this before using this json file again.')
-
-            except KeyError:
-                # If Case was not defined, that's fine, it is not compulsory
-                pass
-            
-    def matchToColumns(self, wrapper):
-        if type(wrapper) != CSVWrapper.CSVWrapper:
-            print("Constraints can conly be matched to CSVWrappers.")
-            return
-
-        if len(wrapper.columns) != len(self.constraints):
-            ErrorLogging.log('The CSV file has ' + str(len(wrapper.columns)) + ' columns but there should be ' + str(len(self.constraints)) + ' columns')
-            return
-
-        for i in range(len(wrapper.columns)):
-            
-            # Apply trimming if the column has been flagged to be checked as trimmed
-            if self.constraints[i].trimmed:
-                self.constraints[i].column = [item.strip() for item in wrapper.columns[i]]
-            else:
-                self.constraints[i].column = wrapper.columns[i]
-
-            # Change the "effective case" if the json file dictates that this should be done
-            if not self.constraints[i].caseSensitive:
-                self.constraints[i].column = [item.upper() for item in self.constraints[i].column]
-                self.constraints[i].possibleValues = [item.upper() for item in self.constraints[i].possibleValues]
-
-    def validateAll(self):
-        self.validateColumns()
-        self.validateGroups()
-        self.validateOneToOne()
-
-    def validateColumns(self):
-        for constraint in self.constraints:
-            constraint.validateList(constraint.column)
-            
-    def validateGroupsFast(self):
-        # Any IndexErrors caused by this variable mean that there is an uneven number of columns
-        # This could be alleviated by taking the length for each group, but that hides a major problem
-        noOfRows = len(self.constraints[0].column)
-        
-        for group in self.uniqueGroups:
-            uniques = set() # A set always has unique values, so duplicates won't be added
-            for n in range(noOfRows):
-                uniques.add(''.join([str(constraint.column[n]) for constraint in self.uniqueGroups[group]]))
-
-            if noOfRows != len(uniques):
-                # This means this group has some duplicates
-                ErrorLogging.log('Unique group ' + str(group) + ' has ' + str(noOfRows - len(uniques)) + ' duplicate rows.')
-
-    """
-        def validateGroups(self):
-            # A newer but possibly slower version validateGroupsFast. This version allows each duplicate row to be logged
-            noOfRows = len(self.constraints[0].column)
-            
-            for group in self.uniqueGroups:
-                uniques = []
-                for n in range(noOfRows):
-                    newString = ''.join([str(constraint.column[n]) for constraint in self.uniqueGroups[group]])
-                    if newString not in uniques:
-                        uniques.append(newString)
-                    else:
-                        # The + 2 is to account for the header being removed and then Python counting from 0
-                        ErrorLogging.log('Row: ' + str(n + 2) + ' contains a duplicate entry for the unique group: ' + str(group) + '.')
-    """
-    
-    def validateGroups(self):
-        # An even newer version that shows exactly what has been duplicated
-        noOfRows = len(self.constraints[0].column)
-
-        for group in self.uniqueGroups:
-            records = []
-            for i in range(noOfRows):
-                newString = ''.join([str(constraint.column[i]) for constraint in self.uniqueGroups[group]])
-                records.append(newString)
-                # j is the first instance of newString appearing in the list, if it is different from i, then a copy of newString was already present
-                j = records.index(newString)
-                if j != i:
-                    # The + 2 is to account for the header being removed and python counting from 0 while excel starts at 1
-                    ErrorLogging.log("Row: " + str(i + 2) + " contains the same information as row " + str(j + 2) + " for the unique group: " + str(group) + ".")
-
-    def validateOneToOne(self):
-        for pair in self.oneToOnePairs:
-            if len(self.oneToOnePairs[pair]) != 2:
-                ErrorLogging.log('The one to one relationship requires columns to be in pairs. However, ' + str(len(self.oneToOnePairs[pair])) + ' columns were given the property: ' + pair + '. Check the JSON files for errors.')
-                continue
-
-            n = len(self.oneToOnePairs[pair][0].column)
-
-            # Dictionaries listing every  a to b and b to a relationship
-            # The key is a string, the value is a list
-            a_to_b = {}
-            b_to_a = {}
-            for i in range(n):
-                a = self.oneToOnePairs[pair][0].column[i]
-                b = self.oneToOnePairs[pair][1].column[i]
-
-                # If the key is new, add it to the appropriate dictionary
-                if a not in a_to_b:
-                    a_to_b[a] = []
-                if b not in b_to_a:
-                    b_to_a[b] = []
-
-                # If the value is new, add it to the list of values seen for error logging purposes
-                if b not in a_to_b[a]:
-                    a_to_b[a].append(b)
-                if a not in b_to_a[b]:
-                    b_to_a[b].append(a)
-
-            # Log errors
-            for i in a_to_b:
-                if len(a_to_b[i]) != 1:
-                    errorString = 'Columns ' + str(self.oneToOnePairs[pair][0].colName) + ' and ' + str(self.oneToOnePairs[pair][1].colName) + ' share a one to one relationship but '
-                    errorString += 'entry ' + str(i) + ' has multiple associated values: ' + str(a_to_b[i])
-                    ErrorLogging.log(errorString)
-            for i in b_to_a:
-                if len(b_to_a[i]) != 1:
-                    errorString = 'Columns ' + str(self.oneToOnePairs[pair][1].colName) + ' and ' + str(self.oneToOnePairs[pair][0].colName) + ' share a one to one relationship but '
-                    errorString += 'entry ' + str(i) + ' has multiple associated values: ' + str(b_to_a[i])
-                    ErrorLogging.log(errorString)
-
-                
-            
-
-class Constraint:
-    
-    def __init__(self):
-        self.colName = None
-        self.essential = False
-        self.hashable = False
-        self.colType = str
-        self.minimum = -float('inf')
-        self.maximum = float('inf')
-        self.decimalPlaces = 0
-        self.uniqueGroup = None
-        self.validate = self.validateString
-        self.validateList = self.validateStringList
-        self.column = []
-        self.possibleValues = []
-        self.trimmed = False # Not a constraint per se, but it affects how they will be treated
-        self.caseSensitive = True
-
-    def validateNumber(self, num):
-        if not self.essential and num == '':
-            return True
-        try:
-            valueRangeCheck = float(num) >= self.minimum and float(num) <= self.maximum
-            decimalPlacesCheck = False
-            if '.' in num:
-                decimalPlacesCheck = len(num.split(".")[1]) >= self.decimalPlaces
-            else:
-                decimalPlacesCheck = self.decimalPlaces == 0
-
-            return valueRangeCheck and decimalPlacesCheck
-        except ValueError:
-            return False
-
-    def validateString(self, string):
-        if not self.essential and string == '':
-            return True
-        if self.hashable and string == '#':
-            return True
-        return len(string) >= self.minimum and len(string) <= self.maximum
-
-    def validateFinitePossibilities(self, value):
-        return value in self.possibleValues
-
-    def validateNumList(self, target):
-        n = len(target)
-        for i in range(n):
-            if not self.validateNumber(target[i]):
-                # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
-                errorString = "Entry at Column: " + self.colName + ", Row: " + str(i + 2) + " has value: " + str(target[i]) + ". This column "
-                if self.essential:
-                    errorString += "is essential and "
-                errorString += "must be a number between " + str(self.minimum) + " and " + str(self.maximum) + " with at least " + str(self.decimalPlaces) + " decimal places."
-                ErrorLogging.log(errorString)
-
-    def validateStringList(self, target):
-        n = len(target)
-        for i in range(n):
-            if not self.validateString(target[i]):
-                # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
-                errorString = "Entry at Column: " + self.colName + ", Row: " + str(i + 2) + " has value: " + str(target[i]) + ". This column "
-                if self.essential:
-                    errorString += "is essential and "
-                errorString += "must be between " + str(self.minimum) + " and " + str(self.maximum) + " characters long."
-                ErrorLogging.log(errorString)
-
-    def validatePossibilitiesList(self, target):
-        n = len(target)
-        for i in range(n):
-            if not self.validateFinitePossibilities(target[i]):
-                # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
-                errorString = "Entry at Column: " + self.colName + ", Row: " + str(i + 2) + " has value: " + str(target[i]) + ". This column "
-                if self.essential:
-                    errorString += "is essential and "
-                errorString += "must have one of the following values: " + str(self.possibleValues) + "."
-                ErrorLogging.log(errorString)
-        
+# Module for parsing json files to detect constraints for manual inputs
+
+import Checkpoints
+import ErrorLogging
+import CSVWrapper
+import EncodedColumns
+import FusedPipeline
+import MappedColumns
+import OneToOne
+import RulePlan
+import RuleTypes
+import RunStats
+import Sampling
+import UniqueGroups
+import ValueSets
+import contextlib
+import functools
+import hashlib
+import random
+# The batched engine is optional and needs NumPy. See loadVectorEngine
+VectorEngine = None
+
+def loadVectorEngine():
+    # NumPy takes longer to import than the rest of the validator, so VectorEngine is only imported when the numpy
+    # engine is asked for. Returns None if NumPy isn't installed
+    global VectorEngine
+    if VectorEngine is None:
+        try:
+            import VectorEngine as engine
+        except ImportError:
+            VectorEngine = False
+        else:
+            VectorEngine = engine
+    return VectorEngine or None
+
+# What ConstraintSet.measure gives when stats are off. Anything written to the record it yields is ignored
+NO_STATS = contextlib.nullcontext(RunStats.StageStats())
+
+class ConstraintSet:
+
+    def __init__(self):
+        self.constraints = []
+        self.uniqueGroups = {}
+        self.oneToOnePairs = {}
+        self.filePath = ''
+        self.planHash = ''
+        self.stats = None # Set by enableStats
+        self.groupMemoryBudget = None # Set by spillGroups
+        self.groupSpillDirectory = None
+        self.workerPool = None # Set by useWorkerPool
+
+        
+    def __init__(self, filePath):
+        self.constraints = []
+        self.uniqueGroups = {}
+        self.oneToOnePairs = {}
+        self.planHash = ''
+        self.stats = None # Set by enableStats
+        self.groupMemoryBudget = None # Set by spillGroups
+        self.groupSpillDirectory = None
+        self.workerPool = None # Set by useWorkerPool
+        self.loadConstraints(filePath)
+        self.filePath = filePath
+
+    def loadConstraints(self, filePath, useCache=True):
+        # The JSON file is compiled into an immutable plan by RulePlan, which caches it on disk between runs
+        self.applyPlan(RulePlan.load(filePath, use_cache=useCache))
+
+    def applyPlan(self, plan):
+        self.planHash = plan.content_hash
+        # Problems with the rule file are logged every time it is used, even when the plan came from the cache
+        for problem in plan.problems:
+            ErrorLogging.log(problem, rule='rules file')
+
+        for rule in plan.columns:
+            newConstraint = Constraint.fromRule(rule, plan.source)
+            self.constraints.append(newConstraint)
+
+            if rule.unique_group is not None:
+                if rule.unique_group not in self.uniqueGroups:
+                    self.uniqueGroups[rule.unique_group] = []
+                self.uniqueGroups[rule.unique_group].append(newConstraint)
+
+            # Check for one to one properties and pair up the appropriate constraint objects as necessary
+            if rule.one_to_one is not None:
+                if rule.one_to_one not in self.oneToOnePairs:
+                    self.oneToOnePairs[rule.one_to_one] = []
+                self.oneToOnePairs[rule.one_to_one].append(newConstraint)
+
+    def matchToColumns(self, wrapper):
+        if type(wrapper) != CSVWrapper.CSVWrapper:
+            print("Constraints can conly be matched to CSVWrappers.")
+            return
+
+        if len(wrapper.columns) != len(self.constraints):
+            ErrorLogging.log('The CSV file has ' + str(len(wrapper.columns)) + ' columns but there should be ' + str(len(self.constraints)) + ' columns', rule='column count')
+            return
+
+        rows = len(wrapper.columns[0]) if wrapper.columns else 0
+        with self.measure('match', rows):
+            for i in range(len(wrapper.columns)):
+                with self.measure('match', rows, self.constraints[i].colName):
+                    self.matchColumn(self.constraints[i], wrapper.columns[i])
+
+    def matchColumn(self, constraint, column):
+        # Mapped columns normalise each cell as it is read and encoded columns each distinct value, instead of being copied
+        if isinstance(column, (MappedColumns.MappedColumn, EncodedColumns.EncodedColumn)):
+            constraint.column = column.normalised(constraint.trimmed, not constraint.caseSensitive)
+            return
+
+        # Apply trimming if the column has been flagged to be checked as trimmed
+        if constraint.trimmed:
+            constraint.column = [item.strip() for item in column]
+        else:
+            constraint.column = column
+
+        # Change the "effective case" if the json file dictates that this should be done
+        if not constraint.caseSensitive:
+            constraint.column = [item.upper() for item in constraint.column]
+
+    def validateAll(self, engine='python', workers=1, failFast=False, maxErrors=None, maxErrorsPerColumn=None):
+        # With more than one worker the checks are split across processes (workers=None uses every core)
+        # The log is the same as a serial run, in the same order
+        # failFast stops at the first error and maxErrors after that many; maxErrorsPerColumn stops checking a column after that many of its errors
+        # Returns the RunStats when enableStats has been called, otherwise None
+        self.runLimited(self.runChecks, 1 if failFast else maxErrors, maxErrorsPerColumn, engine, workers)
+        return self.collectStats()
+
+    def runChecks(self, engine, workers):
+        if workers != 1:
+            # Imported here so the process pool machinery is only loaded when it is asked for
+            import ParallelValidation
+            # The workers' time is spent in other processes, so only the whole stage is measured
+            with self.measure('parallel checks', self.rowCount()):
+                ParallelValidation.validate_all(self, workers, engine, pool=self.workerPool)
+            return
+        self.validateColumns(engine)
+        self.validateGroups()
+        self.validateOneToOne()
+
+    def runLimited(self, checks, maxErrors, maxErrorsPerColumn, *args):
+        if maxErrors is None and maxErrorsPerColumn is None:
+            checks(*args)
+            return
+        with ErrorLogging.LimitSink(ErrorLogging.currentSink.get(), maxErrors, maxErrorsPerColumn) as limit:
+            checks(*args)
+        if limit.stopped:
+            ErrorLogging.log('Validation stopped after ' + str(limit.count) + ' errors, the rest of the file was not checked.', rule='stopped')
+
+    def validateSample(self, sampleSize, stratified=False, seed=None, confidence=0.95):
+        # Checks a random subset of rows and estimates the share of rows in the whole file with at least one error
+        # Unique groups and one to one pairs are not checked, a sample can't show whether they hold
+        noOfRows = self.rowCount()
+        badRows = 0
+        with self.measure('sample', min(sampleSize, noOfRows)):
+            for i in Sampling.sample_rows(noOfRows, sampleSize, stratified, random.Random(seed)):
+                rowIsBad = False
+                for constraint in self.constraints:
+                    if not constraint.validate(constraint.column[i]):
+                        # The plus 2 is to match the row count seen in excel etc
+                        constraint.logInvalid(constraint.column[i], i + 2)
+                        rowIsBad = True
+                badRows += rowIsBad
+        estimate = Sampling.estimate(noOfRows, min(sampleSize, noOfRows), badRows, confidence)
+        ErrorLogging.log(estimate.describe(), rule='sample')
+        return estimate
+
+    def checkEngine(self, engine):
+        if engine == 'numpy' and loadVectorEngine() is None:
+            print("NumPy is not installed so columns will be validated row by row.")
+            return 'python'
+        return engine
+
+    def validateStream(self, wrapper, failFast=False, maxErrors=None, maxErrorsPerColumn=None):
+        # Streaming equivalent of matchToColumns followed by validateAll
+        # Rows are checked as the wrapper reads them, so no column is ever held in memory
+        # Only the unique group and one to one indexes grow, and only with the number of distinct keys
+        # Once maxErrors is reached the rest of the file is not even read
+        # Returns the RunStats when enableStats has been called, otherwise None
+        self.runLimited(self.checkStream, 1 if failFast else maxErrors, maxErrorsPerColumn, wrapper)
+        return self.collectStats()
+
+    def validateFused(self, wrapper, failFast=False, maxErrors=None, maxErrorsPerColumn=None):
+        # Replaces loadColumns, matchToColumns and validateAll with one row-major pass over a loaded or streaming wrapper
+        # Every cell is normalised once and goes through its column check, the unique groups and the one to one pairs
+        # in the same visit. The errors are those of validateAll, but logged row by row instead of column by column
+        return self.validateStream(wrapper, failFast, maxErrors, maxErrorsPerColumn)
+
+    def checkStream(self, wrapper):
+        if type(wrapper) != CSVWrapper.CSVWrapper:
+            print("Constraints can conly be matched to CSVWrappers.")
+            return
+
+        if len(wrapper.header) != len(self.constraints):
+            ErrorLogging.log('The CSV file has ' + str(len(wrapper.header)) + ' columns but there should be ' + str(len(self.constraints)) + ' columns', rule='column count')
+            return
+
+        # The length of a stream isn't known, so with a memory budget its keys are always spilled
+        groupIndex = self.groupIndex(None if self.uniqueGroups else 0)[0]
+        pairRecords = self.pairRecords()
+        # A spilling index's files are removed even when the error limit is reached part way through
+        try:
+            with self.measure('stream') as record:
+                record.rows = self.checkRows(wrapper.iterRows(), groupIndex, pairRecords)
+            if isinstance(groupIndex, UniqueGroups.SpillingGroupIndex):
+                # Spilled keys are only checked once the whole file has been read, so their duplicates are logged last
+                with self.measure('unique groups', record.rows):
+                    for rowNumber, group, key, firstRow in groupIndex.duplicates():
+                        self.logDuplicate(group, rowNumber, firstRow, key)
+        finally:
+            groupIndex.close()
+
+        for pair in self.oneToOnePairs:
+            if pair not in pairRecords:
+                self.logUnpairedOneToOne(pair)
+                continue
+            self.logOneToOne(pair, pairRecords[pair])
+
+    def pairRecords(self):
+        # An empty OneToOne.PairIndex for every complete one to one pair
+        return {pair: OneToOne.PairIndex() for pair in self.oneToOnePairs if len(self.oneToOnePairs[pair]) == 2}
+
+    def checkRows(self, rows, groupIndex, pairRecords):
+        # The single pass shared by validateStream, validateFused and validateIncremental, see FusedPipeline
+        # groupIndex and the pair indexes in pairRecords are updated in place. Returns the number of rows checked
+        return FusedPipeline.FusedPlan(self, groupIndex, pairRecords).run(rows)
+
+    def validateIncremental(self, wrapper, checkpointPath=None):
+        # For files that keep growing: only the rows added since the last run against the same rules are checked
+        # The unique group and one to one indexes carry on from the checkpoint, so new rows that clash with old ones
+        # are still found. Only one to one values that gained a partner in the new rows are logged again
+        # If anything before the checkpoint has changed, or the rules have, the whole file is checked again
+        # Returns True if the run carried on from a checkpoint and False if the whole file was checked
+        if type(wrapper) != CSVWrapper.CSVWrapper:
+            print("Constraints can conly be matched to CSVWrappers.")
+            return False
+
+        if len(wrapper.header) != len(self.constraints):
+            ErrorLogging.log('The CSV file has ' + str(len(wrapper.header)) + ' columns but there should be ' + str(len(self.constraints)) + ' columns', rule='column count')
+            return False
+
+        if checkpointPath is None:
+            checkpointPath = Checkpoints.default_path(wrapper.filePath, self.filePath)
+        settings = (self.planHash, wrapper.delimiter, wrapper.quotechar, wrapper.encoding)
+        with open(wrapper.filePath, 'rb') as fileObject:
+            checkpoint = Checkpoints.load(checkpointPath)
+            digest = Checkpoints.resume(fileObject, checkpoint, settings)
+            resumed = digest is not None
+            if not resumed:
+                checkpoint = Checkpoints.Checkpoint(settings, self.groupIndex()[0], self.pairRecords())
+                digest = hashlib.sha256()
+            # Only conflicts that involve the new rows are logged
+            for index in checkpoint.pair_records.values():
+                index.reset_changes()
+
+            records = Checkpoints.committed_records(fileObject, checkpoint, digest, wrapper.reader.reader, wrapper.encoding)
+            try:
+                with self.measure('incremental') as record:
+                    record.rows = self.checkRows(self.checkpointRows(wrapper, records, checkpoint), checkpoint.group_index, checkpoint.pair_records)
+            except UnicodeError:
+                # The checkpoint isn't moved, so the next run tries these rows again
+                ErrorLogging.log("The file: " + wrapper.filePath + " could not be decoded after row " + str(checkpoint.row_number) + " so the rest of it cannot be checked.", rule='encoding')
+                return resumed
+
+        for pair in self.oneToOnePairs:
+            if pair not in checkpoint.pair_records:
+                self.logUnpairedOneToOne(pair)
+                continue
+            self.logOneToOne(pair, checkpoint.pair_records[pair], changedOnly=True)
+        Checkpoints.save(checkpointPath, checkpoint)
+        return resumed
+
+    def checkpointRows(self, wrapper, records, checkpoint):
+        # Yields (rowNumber, fields) for the records after the checkpoint, skipping the header on a full run
+        # Rows with the wrong number of columns and bad bytes are logged, exactly as CSVWrapper.iterRows does
+        numberOfColumns = len(wrapper.header)
+        for fields, badBytes in records:
+            checkpoint.row_number += 1
+            if checkpoint.row_number == 1:
+                # Bad bytes in the header were logged when the wrapper read it
+                continue
+            for offset in badBytes:
+                wrapper.logBadByte(checkpoint.row_number, offset)
+            if not fields:
+                fields = ['']
+            if len(fields) != numberOfColumns:
+                fields = wrapper.reader.fit(fields, numberOfColumns)
+                if len(fields) != numberOfColumns:
+                    wrapper.logMismatch(checkpoint.row_number, fields, numberOfColumns)
+                    continue
+            yield checkpoint.row_number, fields
+
+    def validateColumns(self, engine='python'):
+        # engine='numpy' checks each whole column at once with VectorEngine, falling back to the row by row checks without NumPy
+        engine = self.checkEngine(engine)
+        with self.measure('columns', self.rowCount()):
+            for constraint in self.constraints:
+                with self.measure('columns', len(constraint.column), constraint.colName):
+                    self.validateColumn(constraint, engine)
+
+    def validateColumn(self, constraint, engine):
+        try:
+            if isinstance(constraint.column, EncodedColumns.EncodedColumn):
+                # Whatever the engine, an encoded column only needs each distinct value checked
+                constraint.validateEncoded(constraint.column)
+            elif isinstance(constraint.column, MappedColumns.MappedColumn) and constraint.asciiValidator() is not None and constraint.column.ascii:
+                # A mapped column with nothing but ASCII in it is checked straight from the file's bytes
+                constraint.validateAscii(constraint.column)
+            elif engine == 'numpy':
+                constraint.validateListBatched(constraint.column)
+            else:
+                constraint.validateList(constraint.column)
+        except ErrorLogging.ErrorLimitReached as limit:
+            # A column that has reached its own limit is left, the others are still checked
+            if limit.column is None:
+                raise
+            
+    def enableVerdictCache(self, size=4096):
+        # See Constraint.enableVerdictCache
+        for constraint in self.constraints:
+            constraint.enableVerdictCache(size)
+
+    def verdictCacheStats(self):
+        # Column name to the stats of its verdict cache, for every column that has one
+        # Checks run in worker processes use the workers' own caches, which aren't counted here
+        return {constraint.colName: stats for constraint in self.constraints if (stats := constraint.verdictCacheStats()) is not None}
+
+    def enableStats(self, traceMemory=False):
+        # Starts a fresh RunStats for everything this set runs from now on and returns it
+        # traceMemory adds the peak memory of each stage, at the cost of a much slower run while tracemalloc is on
+        # The caller can measure its own stages too, e.g. loading the file: with constraintSet.measure('load'): ...
+        self.stats = RunStats.RunStats(traceMemory)
+        return self.stats
+
+    def disableStats(self):
+        self.stats = None
+
+    def measure(self, stage, rows=0, column=None):
+        # A RunStats.stage when stats are enabled, otherwise a context that does nothing
+        if self.stats is None:
+            return NO_STATS
+        return self.stats.stage(stage, rows, column)
+
+    def collectStats(self):
+        # Folds the verdict cache counts into the stats and returns them, or None when stats are off
+        if self.stats is not None:
+            self.stats.verdict_caches = self.verdictCacheStats()
+        return self.stats
+
+    def rowCount(self):
+        return len(self.constraints[0].column) if self.constraints else 0
+
+    def spillGroups(self, memoryBudget, directory=None):
+        # Unique groups whose keys would take more than memoryBudget bytes are checked out of core from now on, with
+        # the keys spilled to files under directory (the system's temporary directory by default)
+        # The same duplicates are logged. Runs split across worker processes and incremental runs still check in memory
+        self.groupMemoryBudget = memoryBudget
+        self.groupSpillDirectory = directory
+
+    def useWorkerPool(self, pool):
+        # validateAll runs its workers in pool, from ParallelValidation.create_pool, instead of starting processes for
+        # each call. The pool can be shared with other sets and is shut down by whoever made it. None goes back to a pool per call
+        self.workerPool = pool
+
+    def groupIndex(self, spillRows=0):
+        # Builds one index for every unique group so they can all be checked in the same pass
+        # The returned constraints are the distinct columns used by any group, in the order the index expects them
+        # spillRows is how many rows are about to be checked, None if that isn't known. When spillGroups has set a
+        # budget that an in-memory index of that many rows could go over, a UniqueGroups.SpillingGroupIndex is returned
+        groupConstraints = []
+        groupPositions = {}
+        for group in self.uniqueGroups:
+            for constraint in self.uniqueGroups[group]:
+                if constraint not in groupConstraints:
+                    groupConstraints.append(constraint)
+            groupPositions[group] = [groupConstraints.index(constraint) for constraint in self.uniqueGroups[group]]
+        if self.groupMemoryBudget is not None and (spillRows is None or UniqueGroups.index_bytes(spillRows, len(groupPositions)) > self.groupMemoryBudget):
+            return UniqueGroups.SpillingGroupIndex(groupPositions, self.groupMemoryBudget, spillRows, self.groupSpillDirectory), groupConstraints
+        return UniqueGroups.UniqueGroupIndex(groupPositions), groupConstraints
+
+    def validateGroupsFast(self):
+        # Only counts the duplicates in each group rather than logging every duplicate row
+        # Any IndexErrors caused by this variable mean that there is an uneven number of columns
+        # This could be alleviated by taking the length for each group, but that hides a major problem
+        noOfRows = len(self.constraints[0].column)
+        index, groupConstraints = self.groupIndex()
+        for rowNumber, values in enumerate(zip(*[EncodedColumns.key_column(constraint.column) for constraint in groupConstraints])):
+            index.add(rowNumber, values)
+
+        for group in self.uniqueGroups:
+            if index.duplicate_count(group, noOfRows) != 0:
+                # This means this group has some duplicates
+                ErrorLogging.log('Unique group ' + str(group) + ' has ' + str(index.duplicate_count(group, noOfRows)) + ' duplicate rows.', rule='unique group')
+
+    def validateGroups(self):
+        # Every group is checked in one pass over the rows, logging each duplicate along with the row it first appeared on
+        if len(self.uniqueGroups) == 0:
+            return
+        with self.measure('unique groups', self.rowCount()):
+            self.checkGroups()
+
+    def checkGroups(self):
+        index, groupConstraints = self.groupIndex(self.rowCount())
+        # Encoded columns are indexed by their codes, which are turned back into values for the log
+        columns = [constraint.column for constraint in groupConstraints]
+        decoders = [EncodedColumns.decoder(column) for column in columns]
+        # The + 2 is to account for the header being removed and python counting from 0 while excel starts at 1
+        try:
+            for rowNumber, group, key, firstRow in index.add_columns([EncodedColumns.key_column(column) for column in columns], 2):
+                self.logDuplicate(group, rowNumber, firstRow, self.decodeKey(index.groups[group], key, decoders))
+        finally:
+            index.close()
+
+    @staticmethod
+    def decodeKey(positions, key, decoders):
+        # Turns a unique group key built from key columns back into the values it stands for
+        return tuple([value if decoders[position] is None else decoders[position][value] for position, value in zip(positions, key)])
+
+    def logDuplicate(self, group, rowNumber, firstRow, key=None):
+        ErrorLogging.record('unique group', rowNumber, None, key, {'group': group, 'first_row': firstRow}, formatDuplicate)
+
+    def validateOneToOne(self):
+        # Every complete pair is checked in the same pass over the rows
+        with self.measure('one to one', self.rowCount()):
+            self.checkOneToOne()
+
+    def checkOneToOne(self):
+        pairs = [pair for pair in self.oneToOnePairs if len(self.oneToOnePairs[pair]) == 2]
+        columns = [(self.oneToOnePairs[pair][0].column, self.oneToOnePairs[pair][1].column) for pair in pairs]
+        indexes = OneToOne.index_pairs([(EncodedColumns.key_column(a), EncodedColumns.key_column(b)) for a, b in columns])
+        for index, (a, b) in zip(indexes, columns):
+            index.decode(EncodedColumns.decoder(a), EncodedColumns.decoder(b))
+        indexes = dict(zip(pairs, indexes))
+        for pair in self.oneToOnePairs:
+            if pair not in indexes:
+                self.logUnpairedOneToOne(pair)
+                continue
+            self.logOneToOne(pair, indexes[pair])
+
+    def logUnpairedOneToOne(self, pair):
+        ErrorLogging.log('The one to one relationship requires columns to be in pairs. However, ' + str(len(self.oneToOnePairs[pair])) + ' columns were given the property: ' + pair + '. Check the JSON files for errors.', rule='rules file')
+
+    def logOneToOne(self, pair, index, changedOnly=False):
+        # Log errors. changedOnly limits this to values that gained a partner since index.reset_changes()
+        aName = self.oneToOnePairs[pair][0].colName
+        bName = self.oneToOnePairs[pair][1].colName
+        names = ((aName, bName), (bName, aName))
+        stoppedSides = set()
+        for side, value, partners, complete in index.conflicts(changedOnly):
+            if side in stoppedSides:
+                continue
+            column, otherColumn = names[side]
+            try:
+                ErrorLogging.record('one to one', None, column, value, {'other_column': otherColumn, 'values': partners, 'complete': complete}, formatOneToOne)
+            except ErrorLogging.ErrorLimitReached as limit:
+                if limit.column is None:
+                    raise
+                stoppedSides.add(side)
+
+
+# Formatters that turn the ErrorRecords logged in this module into the text of the classic error log
+
+def formatInvalid(record):
+    errorString = "Entry at Column: " + record.column + ", Row: " + str(record.row) + " has value: " + str(record.value) + ". This column "
+    if record.params['essential']:
+        errorString += "is essential and "
+    if record.rule == 'values':
+        errorString += "must have one of the following values: " + str(record.params['values']) + "."
+    elif 'requirement' in record.params:
+        errorString += "must be " + record.params['requirement'] + "."
+    elif record.rule == 'number':
+        errorString += "must be a number between " + str(record.params['minimum']) + " and " + str(record.params['maximum']) + " with at least " + str(record.params['decimal_places']) + " decimal places."
+    else:
+        errorString += "must be between " + str(record.params['minimum']) + " and " + str(record.params['maximum']) + " characters long."
+    return errorString
+
+def formatDuplicate(record):
+    return "Row: " + str(record.row) + " contains the same information as row " + str(record.params['first_row']) + " for the unique group: " + str(record.params['group']) + "."
+
+def formatOneToOne(record):
+    errorString = 'Columns ' + str(record.column) + ' and ' + str(record.params['other_column']) + ' share a one to one relationship but '
+    errorString += 'entry ' + str(record.value) + ' has multiple associated values: ' + str(record.params['values'])
+    if not record.params.get('complete', True):
+        # Only the first few partners of a value are kept
+        errorString += ' and possibly more'
+    return errorString
+
+
+class Constraint:
+    
+    def __init__(self):
+        self.colName = None
+        self.essential = False
+        self.hashable = False
+        self.colType = str
+        self.minimum = -float('inf')
+        self.maximum = float('inf')
+        self.decimalPlaces = 0
+        self.uniqueGroup = None
+        self.validate = self.validateString
+        self.validateList = self.validateStringList
+        self.column = []
+        self.possibleValues = [] # As written in the rule file, for error messages
+        self.allowedValues = frozenset() # What values are actually checked against, see compileValues
+        self.trimmed = False # Not a constraint per se, but it affects how they will be treated
+        self.caseSensitive = True
+        self.cachedRuleParams = None
+        self.verdictCacheSize = None # Set by enableVerdictCache
+        self.ruleType = None # A RuleTypes type for columns that are dates, patterns etc.
+
+    def validateNumber(self, num):
+        if not self.essential and num == '':
+            return True
+        try:
+            valueRangeCheck = float(num) >= self.minimum and float(num) <= self.maximum
+            decimalPlacesCheck = False
+            if '.' in num:
+                decimalPlacesCheck = len(num.split(".")[1]) >= self.decimalPlaces
+            else:
+                decimalPlacesCheck = self.decimalPlaces == 0
+
+            return valueRangeCheck and decimalPlacesCheck
+        except ValueError:
+            return False
+
+    def validateString(self, string):
+        if not self.essential and string == '':
+            return True
+        if self.hashable and string == '#':
+            return True
+        return len(string) >= self.minimum and len(string) <= self.maximum
+
+    # validateNumber and validateString for the bytes of an ASCII cell, where every byte is one character
+    def validateNumberBytes(self, num):
+        if not self.essential and num == b'':
+            return True
+        try:
+            valueRangeCheck = float(num) >= self.minimum and float(num) <= self.maximum
+        except ValueError:
+            return False
+        if b'.' in num:
+            return valueRangeCheck and len(num.split(b'.')[1]) >= self.decimalPlaces
+        return valueRangeCheck and self.decimalPlaces == 0
+
+    def validateStringBytes(self, string):
+        if not self.essential and string == b'':
+            return True
+        if self.hashable and string == b'#':
+            return True
+        return len(string) >= self.minimum and len(string) <= self.maximum
+
+    def validateRuleType(self, value):
+        if not self.essential and value == '':
+            return True
+        return self.ruleType.check(value)
+
+    def validateFinitePossibilities(self, value):
+        return value in self.allowedValues
+
+    def compileValues(self):
+        # Must be called again if possibleValues or caseSensitive are changed after loading
+        self.allowedValues = ValueSets.compile_values(self.possibleValues, self.caseSensitive)
+
+    @classmethod
+    def fromRule(cls, rule, source=''):
+        # source is the rules file, named in the problem logged if the column's type can't be set up
+        newConstraint = cls()
+        newConstraint.colName = rule.name
+        newConstraint.essential = rule.essential
+        newConstraint.hashable = rule.hashable
+        newConstraint.minimum = rule.minimum
+        newConstraint.maximum = rule.maximum
+        newConstraint.trimmed = rule.trimmed
+        newConstraint.caseSensitive = rule.case_sensitive
+        newConstraint.uniqueGroup = rule.unique_group
+        newConstraint.oneToOne = rule.one_to_one
+        newConstraint.colType = {'int': int, 'float': float}.get(rule.col_type, str)
+        newConstraint.decimalPlaces = rule.decimal_places
+
+        if rule.col_type in ('int', 'float'):
+            newConstraint.validate = newConstraint.validateNumber
+            newConstraint.validateList = newConstraint.validateNumList
+        elif rule.col_type != 'str':
+            try:
+                newConstraint.ruleType = RuleTypes.create(rule.col_type, dict(rule.type_options))
+                newConstraint.validate = newConstraint.validateRuleType
+                newConstraint.validateList = newConstraint.validateRuleTypeList
+            except (ValueError, ImportError, AttributeError) as error:
+                # A cached plan can name a type whose plugin has since gone, or that was registered by an import this
+                # process hasn't done. The column is checked as a string, as RulePlan does when it compiles such a rule
+                ErrorLogging.log('Error with chosen json file: ' + source + ' . Column ' + rule.name + ' has type ' + rule.col_type + ', which could not be set up: ' + str(error) + '. It will be checked as a string.', rule='rules file')
+
+        # If a finite range of vaues has been given, that should supercede everything else
+        if rule.values is not None:
+            newConstraint.possibleValues = list(rule.values)
+            newConstraint.validate = newConstraint.validateFinitePossibilities
+            newConstraint.validateList = newConstraint.validatePossibilitiesList
+            newConstraint.compileValues()
+        return newConstraint
+
+    def __getstate__(self):
+        # The column is left behind so constraints are cheap to send to worker processes
+        # The validators are bound methods, so they are stored by name and bound again on arrival
+        state = self.__dict__.copy()
+        state['column'] = []
+        state['validate'] = self.validate.__name__
+        state['validateList'] = self.validateList.__name__
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.validate = getattr(self, state['validate'])
+        self.validateList = getattr(self, state['validateList'])
+        if self.verdictCacheSize is not None:
+            # Each process starts with an empty cache of its own
+            self.verdictCacheSize = None
+            self.enableVerdictCache(state['verdictCacheSize'])
+
+    def enableVerdictCache(self, size=4096):
+        # Remembers the verdicts of the last size distinct values, for columns where the same values repeat a lot
+        # Only number and length checks are cached; an allowed values check is already a single set lookup
+        # The verdicts depend only on the value and the constraint, so the results are the same as without the cache
+        if self.verdictCacheSize is not None or self.ruleKind() == 'values':
+            return
+        self.verdictCacheSize = size
+        self.validate = functools.lru_cache(maxsize=size)(self.validate)
+
+    def verdictCacheStats(self):
+        # Hits, misses and the hit rate of the verdict cache, or None if it isn't enabled
+        if self.verdictCacheSize is None:
+            return None
+        info = self.validate.cache_info()
+        lookups = info.hits + info.misses
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize,
+                'hit_rate': info.hits / lookups if lookups else 0.0}
+
+    def normalise(self, value):
+        # Applies the same trimming and case changes to a single value that matchToColumns applies to a column
+        if self.trimmed:
+            value = value.strip()
+        if not self.caseSensitive:
+            value = value.upper()
+        return value
+
+    def ruleKind(self):
+        # Which of the column checks this constraint runs: 'values', 'number', 'string' or the name of its RuleTypes type
+        if self.validateList == self.validatePossibilitiesList:
+            return 'values'
+        if self.validateList == self.validateNumList:
+            return 'number'
+        if self.validateList == self.validateRuleTypeList:
+            return self.ruleType.name
+        return 'string'
+
+    def ruleParams(self):
+        # The kind of check and the settings reported with each of its errors, built once and shared by every error
+        if self.cachedRuleParams is None:
+            kind = self.ruleKind()
+            params = {'essential': self.essential}
+            if kind == 'values':
+                params['values'] = self.possibleValues
+            elif self.validateList == self.validateRuleTypeList:
+                params['requirement'] = self.ruleType.describe()
+            else:
+                params['minimum'] = self.minimum
+                params['maximum'] = self.maximum
+            if kind == 'number':
+                params['decimal_places'] = self.decimalPlaces
+            self.cachedRuleParams = (kind, params)
+        return self.cachedRuleParams
+
+    def logInvalid(self, value, rowNumber):
+        kind, params = self.ruleParams()
+        ErrorLogging.record(kind, rowNumber, self.colName, value, params, formatInvalid)
+
+    def validateListBatched(self, target):
+        # Same verdicts as validateList, but the checks run over the whole column and only failing rows are formatted
+        for i in loadVectorEngine().failing_rows(self, target):
+            # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
+            self.logInvalid(target[i], i + 2)
+
+    def asciiValidator(self):
+        # The check validate makes, for the undecoded bytes of an ASCII cell. None if the check needs the text,
+        # as RuleTypes checks do, or if the verdict cache is on so that the cached validate is used as usual
+        if self.verdictCacheSize is not None:
+            return None
+        kind = self.ruleKind()
+        if kind == 'values':
+            # An allowed value with anything outside ASCII in it can't match an ASCII cell
+            return frozenset(value.encode('ascii') for value in self.allowedValues if value.isascii()).__contains__
+        if kind == 'number':
+            return self.validateNumberBytes
+        if kind == 'string':
+            return self.validateStringBytes
+        return None
+
+    def validateAscii(self, target):
+        # Same verdicts as validateList for a MappedColumn whose ascii is True, without decoding the cells that pass
+        for i in target.failing_rows(self.asciiValidator()):
+            self.logInvalid(target[i], i + 2)
+
+    def validateEncoded(self, target):
+        # Same verdicts as validateList for an EncodedColumn, but each distinct value is only checked once
+        for i in target.failing_rows(self.validate):
+            self.logInvalid(target[i], i + 2)
+
+    # The list validators go through self.validate so the verdict cache is used when it is enabled
+    def validateNumList(self, target):
+        validate = self.validate
+        n = len(target)
+        for i in range(n):
+            if not validate(target[i]):
+                # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
+                self.logInvalid(target[i], i + 2)
+
+    def validateStringList(self, target):
+        validate = self.validate
+        n = len(target)
+        for i in range(n):
+            if not validate(target[i]):
+                # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
+                self.logInvalid(target[i], i + 2)
+
+    def validateRuleTypeList(self, target):
+        if self.verdictCacheSize is not None:
+            self.validateStringList(target)
+            return
+        # Each RuleTypes type has a batched check that is faster than calling validate for every value
+        for i in self.ruleType.failing_rows(target, self.essential):
+            self.logInvalid(target[i], i + 2)
+
+    def validatePossibilitiesList(self, target):
+        n = len(target)
+        for i in range(n):
+            if not self.validateFinitePossibilities(target[i]):
+                # The plus 2 is to match the row count seen in excel etc. Here the header is skipped and counting starts from 0 so 2 rows aren't counted
+                self.logInvalid(target[i], i + 2)
+        
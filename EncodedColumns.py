@@ -0,0 +1,94 @@
+"""
+Dictionary-encoded columns for low-cardinality data such as country codes, status flags or currencies.
+A column with at most MAX_DISTINCT distinct values is stored as one byte per row plus the list of its distinct
+values. Normalising and checking an encoded column only touches the distinct values, and the unique group and one
+to one checks can index the codes instead of the strings
+"""
+import array
+import collections.abc
+import itertools
+
+# Codes are single bytes
+MAX_DISTINCT = 256
+# A column is given up on after this many rows if they already hold too many distinct values
+PROBE_ROWS = 4096
+# After the probe, the distinct values are counted this many rows at a time
+BLOCK_ROWS = 65536
+
+
+class EncodedColumn(collections.abc.Sequence):
+    def __init__(self, codes: array.array, values: list):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EncodedColumn(self.codes[index], self.values)
+        return self.values[self.codes[index]]
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+    def normalised(self, trimmed: bool = False, upper: bool = False) -> 'EncodedColumn':
+        """
+        The same trimming and upper-casing matchToColumns applies to a list column, done once per distinct value
+        """
+        values = self.values
+        if trimmed:
+            values = [value.strip() for value in values]
+        if upper:
+            values = [value.upper() for value in values]
+        if len(set(values)) == len(values):
+            return EncodedColumn(self.codes, values)
+        # Values that became equal share a code, so the codes can still be used as keys
+        codes = {}
+        mapping = bytes([codes.setdefault(value, len(codes)) for value in values])
+        return EncodedColumn(array.array('B', self.codes.tobytes().translate(mapping.ljust(256, b'\0'))), list(codes))
+
+    def failing_rows(self, validate) -> list[int]:
+        """
+        Indices of the rows whose value fails validate, which is called once per distinct value
+        """
+        failing = bytes([not validate(value) for value in self.values])
+        if not any(failing):
+            return []
+        flags = self.codes.tobytes().translate(failing.ljust(256, b'\0'))
+        rows = []
+        row = flags.find(1)
+        while row != -1:
+            rows.append(row)
+            row = flags.find(1, row + 1)
+        return rows
+
+
+def encode(column: list, max_distinct: int = MAX_DISTINCT):
+    """
+    Returns column as an EncodedColumn if it has few enough distinct values, otherwise returns it unchanged
+    """
+    if len(set(itertools.islice(column, PROBE_ROWS))) > max_distinct:
+        return column
+    # Codes follow the order values are first seen in. The distinct values are gathered a block at a time, so a
+    # column that only turns out to have too many late on is given up on there instead of after a pass over all of it
+    codes = dict.fromkeys(itertools.islice(column, PROBE_ROWS))
+    for start in range(PROBE_ROWS, len(column), BLOCK_ROWS):
+        codes.update(dict.fromkeys(column[start:start + BLOCK_ROWS]))
+        if len(codes) > max_distinct:
+            return column
+    if len(codes) > max_distinct:
+        return column
+    for code, value in enumerate(codes):
+        codes[value] = code
+    return EncodedColumn(array.array('B', map(codes.__getitem__, column)), list(codes))
+
+
+def key_column(column):
+    # What the unique group and one to one indexes should use for a column: its codes when it is encoded
+    return column.codes if isinstance(column, EncodedColumn) else column
+
+
+def decoder(column):
+    # The inverse of key_column for single values, or None when key_column gave the values themselves
+    return column.values if isinstance(column, EncodedColumn) else None
@@ -0,0 +1,241 @@
+"""
+Works out which encoding a CSV file is in and decodes it without giving up at the first bad byte.
+sniff looks at the first few KB: a byte order mark decides it outright, otherwise the first encoding in the fallback
+chain that can decode the sample is used. decode and LineDecoder turn each byte that can't be decoded into U+FFFD
+and say where it was, so the rest of the file can still be checked.
+
+    encoding = Encodings.sniff_file('vendor.csv', ('UTF-8', 'cp1252'))
+    text, bad_bytes = Encodings.decode(content, encoding)
+"""
+import codecs
+import io
+import itertools
+import re
+import sys
+
+# The encoding name that asks for the encoding to be sniffed
+AUTO = 'auto'
+# Tried in order when no chain is given. Most files that aren't UTF-8 are cp1252 spreadsheet exports
+FALLBACKS = ('UTF-8', 'cp1252')
+# How much of the start of a file sniff_file looks at
+SAMPLE_SIZE = 64 << 10
+# With more bad bytes than MAX_BAD_BYTES, or more than a few and over one in every BAD_BYTE_SHARE bytes, the file is
+# taken to be in another encoding altogether and UnicodeError is raised, as a strict decode would
+MAX_BAD_BYTES = 1000
+BAD_BYTE_SHARE = 100
+# UTF-32 LE has to come before UTF-16 LE, whose mark it starts with
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+        (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+# What each bad byte is read as
+REPLACEMENT = '\ufffd'
+# Decoding with surrogateescape turns each bad byte into one of these lone surrogates
+BAD_BYTE = re.compile('[\udc80-\udcff]')
+
+
+def sniff(sample: bytes, fallbacks: tuple = FALLBACKS, complete: bool = False) -> str:
+    """
+    The encoding sample is in. complete says sample is the whole file, otherwise a character cut off at its end is
+    not held against an encoding. If no encoding in the chain fits, the last one is used and its bad bytes reported
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in fallbacks:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=complete)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return fallbacks[-1]
+
+
+def sniff_file(file_path: str, fallbacks: tuple = FALLBACKS, sample_size: int = SAMPLE_SIZE) -> str:
+    with open(file_path, 'rb') as file:
+        sample = file.read(sample_size)
+    return sniff(sample, fallbacks, len(sample) < sample_size)
+
+
+def _encoder(encoding: str):
+    # Encodes text after the start of a file: the byte order mark some codecs begin with is written and dropped first
+    encoder = codecs.getincrementalencoder(encoding)('surrogateescape')
+    encoder.encode('')
+    return encoder.encode
+
+
+def _bad_offsets(text: str, start: int, encode) -> list[int]:
+    # The byte offset of every bad byte in text, which starts start bytes into the file
+    offsets = []
+    position = 0
+    for match in BAD_BYTE.finditer(text):
+        start += len(encode(text[position:match.start()]))
+        offsets.append(start)
+        start += 1
+        position = match.end()
+    return offsets
+
+
+def _check_count(count: int, size: int) -> None:
+    # size is the number of bytes read so far
+    if count > min(MAX_BAD_BYTES, max(10, size // BAD_BYTE_SHARE)):
+        raise UnicodeError(f'{count} of the first {size} bytes could not be decoded')
+
+
+def decode(content: bytes, encoding: str) -> tuple[str, list[tuple[int, int]]]:
+    """
+    Decodes a whole file, replacing each byte that isn't valid in encoding with U+FFFD.
+    Returns the text and (character position, byte offset) of every byte that was replaced
+    """
+    text = content.decode(encoding, 'surrogateescape')
+    if BAD_BYTE.search(text) is None:
+        return text, []
+    positions = [match.start() for match in itertools.islice(BAD_BYTE.finditer(text), MAX_BAD_BYTES + 1)]
+    _check_count(len(positions), len(content))
+    encode = _encoder(encoding)
+    # Whatever comes before the text, i.e. a byte order mark the decoder skipped, is counted in the offsets
+    start = len(content) - len(encode(text))
+    return BAD_BYTE.sub(REPLACEMENT, text), list(zip(positions, _bad_offsets(text, start, encode)))
+
+
+def rows_of(text: str, positions: list[int], records) -> list[int]:
+    """
+    The number of the CSV row each of the sorted character positions in text is in, the first row being 1.
+    records is a function returning a csv reader over a file, such as CSVReader.Reader.reader
+    """
+    file = io.StringIO(text, newline='')
+    rows = []
+    for row_number, fields in enumerate(records(file), 1):
+        # The csv reader never reads past the end of the row it returns
+        end = file.tell()
+        while len(rows) < len(positions) and positions[len(rows)] < end:
+            rows.append(row_number)
+        if len(rows) == len(positions):
+            break
+    return rows
+
+
+def resumed(encoding: str, start: bytes) -> str:
+    """
+    The codec that carries on decoding a file part way through, given the file's first few bytes. Codecs that look for
+    a byte order mark, such as utf-16, would otherwise read the middle of the file as if it were the start
+    """
+    name = codecs.lookup(encoding).name
+    if name == 'utf-8-sig':
+        return 'utf-8'
+    if name in ('utf-16', 'utf-32'):
+        bom_be = codecs.BOM_UTF16_BE if name == 'utf-16' else codecs.BOM_UTF32_BE
+        bom_le = codecs.BOM_UTF16_LE if name == 'utf-16' else codecs.BOM_UTF32_LE
+        # Without a mark the whole file was decoded in the machine's own byte order
+        order = 'be' if start.startswith(bom_be) else 'le' if start.startswith(bom_le) else sys.byteorder[0] + 'e'
+        return name + '-' + order
+    return encoding
+
+
+def complete_lines(file, encoding: str, chunk_size: int = 1 << 20):
+    """
+    Yields (line, data, bad) for every line of a binary file from where it is now, split as a text file opened with
+    newline='' would split it: the line with each bad byte read as U+FFFD, the bytes it was decoded from and the
+    offsets of its bad bytes. A last line without a newline may still be being written, so it isn't given.
+    Every line is encoded again to find its bytes, so this is meant for the few new rows of an incremental run
+    """
+    decoder = codecs.getincrementaldecoder(encoding)('surrogateescape')
+    encode = _encoder(encoding)
+    offset = file.tell()
+    read = 0
+    bad_count = 0
+    first_chunk = None
+    # Bytes that belong to no line, i.e. a byte order mark, are given with the first line
+    lead = None
+    pending = ''
+    while True:
+        chunk = file.read(chunk_size)
+        read += len(chunk)
+        if first_chunk is None:
+            first_chunk = chunk
+        text = pending + decoder.decode(chunk, final=not chunk)
+        if lead is None and text:
+            lead = first_chunk[:read - len(decoder.getstate()[0]) - len(encode(text))]
+        lines = list(io.StringIO(text, newline=''))
+        # The last line is held back until the next chunk shows where it ends, as a \r may be the start of a \r\n
+        pending = lines.pop() if chunk and lines else ''
+        for line in lines:
+            if not chunk and not line.endswith('\n'):
+                return
+            bad = []
+            if BAD_BYTE.search(line) is not None:
+                bad = _bad_offsets(line, offset + len(lead), encode)
+                bad_count += len(bad)
+                _check_count(bad_count, read)
+            data = lead + encode(line)
+            lead = b''
+            offset += len(data)
+            yield BAD_BYTE.sub(REPLACEMENT, line) if bad else line, data, bad
+        if not chunk:
+            return
+
+
+class LineDecoder:
+    """
+    Iterates over the lines of a binary file the way a text file opened with newline='' would, reading chunk_size bytes
+    at a time. Bytes that can't be decoded come out as U+FFFD and their offsets are added to bad just before the line
+    they are in is given out, so whoever is reading the lines can tell which row they belong to
+    """
+    def __init__(self, file, encoding: str, chunk_size: int = 1 << 20):
+        self.file = file
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        # Byte offsets of the bad bytes in lines given out since the caller last cleared it
+        self.bad: list[int] = []
+        self.bad_count = 0
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        # Chained so that lines from clean chunks go straight from a StringIO to the reader, without Python in between
+        return itertools.chain.from_iterable(self.chunks())
+
+    def chunks(self):
+        # An iterable of lines for every chunk of the file
+        decoder = codecs.getincrementaldecoder(self.encoding)('surrogateescape')
+        encode = _encoder(self.encoding)
+        read = 0
+        pending = ''
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            read += len(chunk)
+            text = pending + decoder.decode(chunk, final=not chunk)
+            if chunk:
+                # Everything up to the last line end is given out. A \r at the very end may be the start of a \r\n
+                end = len(text) - 1 if text.endswith('\r') else len(text)
+                cut = max(text.rfind('\n', 0, end), text.rfind('\r', 0, end)) + 1
+            else:
+                # The last line of a file needn't end with a newline
+                cut = len(text)
+            pending = text[cut:]
+            if BAD_BYTE.search(text, 0, cut) is None:
+                yield io.StringIO(text[:cut], newline='')
+            else:
+                # The whole chunk is counted before any of it is given out, so a file in another encoding is given up on at once
+                self.bad_count += sum(1 for _ in itertools.islice(BAD_BYTE.finditer(text, 0, cut), MAX_BAD_BYTES + 1))
+                _check_count(self.bad_count, read)
+                # Only now is the text re-encoded, to find where it started in the file
+                start = read - len(decoder.getstate()[0]) - len(encode(text))
+                yield self.flag(io.StringIO(text[:cut], newline=''), start, encode)
+            if not chunk:
+                return
+
+    def flag(self, lines, start: int, encode):
+        for line in lines:
+            if BAD_BYTE.search(line) is not None:
+                self.bad.extend(_bad_offsets(line, start, encode))
+                start += len(encode(line))
+                line = BAD_BYTE.sub(REPLACEMENT, line)
+            else:
+                start += len(encode(line))
+            yield line
@@ -1,19 +1,228 @@
-# Module for logging errors and eventually storing them in an output file
-import datetime
-
-errors = []
-
-def log(string):
-    global errors
-    errors.append(string + '\n')
-
-def write_log(scanned='', header='', directory='.'):
-    global errors
-    fileName = directory + '/' + "error log " + scanned + str(datetime.datetime.now()).replace(':', '.') +".txt"
-    if len(errors) == 0:
-        errorString = header + "No errors found."
-    else:
-        errorString = header + ''.join(errors)    
-    with open(fileName, 'w', encoding='UTF-8') as fileObject:
-        fileObject.write(errorString)
-    
+# Module for logging errors and eventually storing them in an output file
+# Errors go to the current sink. Sinks are set per run with "with sink:" so runs in the same process never share a log
+# Each error is kept as a compact ErrorRecord; the English sentence is only built if a text log is written
+import collections
+import contextvars
+import csv
+import datetime
+import json
+import math
+import sys
+
+# rule: the kind of check ('number', 'values', 'unique group', ...)
+# row and column: where the error is, either may be None. value: the offending value, if there is one
+# params: the check's settings, shared between records where possible. formatter: turns the record into text
+ErrorRecord = collections.namedtuple('ErrorRecord', ['rule', 'row', 'column', 'value', 'params', 'formatter'])
+
+def formatMessage(record):
+    # Formatter for errors that were logged as ready-made text
+    return record.params['message']
+
+def render(record):
+    return record.formatter(record)
+
+def jsonable(record):
+    # Infinite minimums and maximums are written as strings so the output stays strict JSON
+    params = {key: (str(value) if isinstance(value, float) and not math.isfinite(value) else value) for key, value in record.params.items()}
+    return {'rule': record.rule, 'row': record.row, 'column': record.column, 'value': record.value, 'params': params}
+
+
+class ErrorSink:
+    # Base class for anywhere errors can be sent. Subclasses only need to implement write, which receives ErrorRecords
+    def __init__(self):
+        self.count = 0
+        self.token = None
+
+    def record(self, errorRecord):
+        self.count += 1
+        self.write(errorRecord)
+
+    def log(self, string, column=None, rule=None):
+        self.record(ErrorRecord(rule, None, column, None, {'message': string}, formatMessage))
+
+    def write(self, errorRecord):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.token = currentSink.set(self)
+        return self
+
+    def __exit__(self, *excInfo):
+        currentSink.reset(self.token)
+        self.close()
+
+
+class MemorySink(ErrorSink):
+    # Keeps every record in a list. errors gives them as text lines, the way they were always collected
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def write(self, errorRecord):
+        self.records.append(errorRecord)
+
+    @property
+    def errors(self):
+        return [render(errorRecord) + '\n' for errorRecord in self.records]
+
+
+class StreamSink(ErrorSink):
+    # Writes each error as a text line as soon as it is logged and keeps nothing, so it can be left in place for good
+    # stream defaults to whatever sys.stderr is when the error is written
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream
+
+    def write(self, errorRecord):
+        (self.stream or sys.stderr).write(render(errorRecord) + '\n')
+
+
+class FileSink(ErrorSink):
+    # Streams errors to a file, holding at most bufferSize of them in memory at once
+    # outputFormat is 'text' (the classic error log), 'jsonl' (one JSON object per error) or 'csv'
+    def __init__(self, fileName, header='', bufferSize=1000, outputFormat='text'):
+        super().__init__()
+        self.fileName = fileName
+        self.bufferSize = bufferSize
+        self.outputFormat = outputFormat
+        self.buffer = []
+        self.fileObject = open(fileName, 'w', encoding='UTF-8', newline='' if outputFormat == 'csv' else None)
+        if outputFormat == 'text':
+            self.fileObject.write(header)
+        elif outputFormat == 'csv':
+            self.csvWriter = csv.writer(self.fileObject)
+            self.csvWriter.writerow(['rule', 'row', 'column', 'value', 'params'])
+
+    def write(self, errorRecord):
+        self.buffer.append(errorRecord)
+        if len(self.buffer) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self.outputFormat == 'text':
+            self.fileObject.writelines([render(errorRecord) + '\n' for errorRecord in self.buffer])
+        elif self.outputFormat == 'jsonl':
+            self.fileObject.writelines([json.dumps(jsonable(errorRecord)) + '\n' for errorRecord in self.buffer])
+        else:
+            for errorRecord in self.buffer:
+                row = jsonable(errorRecord)
+                self.csvWriter.writerow([row['rule'], row['row'], row['column'], row['value'], json.dumps(row['params'])])
+        self.buffer = []
+
+    def close(self):
+        if self.fileObject.closed:
+            return
+        self.flush()
+        if self.count == 0 and self.outputFormat == 'text':
+            self.fileObject.write("No errors found.")
+        self.fileObject.close()
+
+
+class CappedSink(ErrorSink):
+    # Passes errors on to another sink until a cap is reached, then only counts them
+    # Caps can be set per column, per rule (e.g. 'values', 'unique group') and in total; None means no cap
+    def __init__(self, sink, perColumn=None, perRule=None, total=None):
+        super().__init__()
+        self.sink = sink
+        self.perColumn = perColumn
+        self.perRule = perRule
+        self.total = total
+        self.columnCounts = {}
+        self.ruleCounts = {}
+        self.passed = 0
+        self.suppressed = {}
+
+    def record(self, errorRecord):
+        self.count += 1
+        column = errorRecord.column
+        rule = errorRecord.rule
+        columnCount = self.columnCounts.get(column, 0)
+        ruleCount = self.ruleCounts.get(rule, 0)
+        if ((self.perColumn is not None and column is not None and columnCount >= self.perColumn)
+                or (self.perRule is not None and rule is not None and ruleCount >= self.perRule)
+                or (self.total is not None and self.passed >= self.total)):
+            self.suppressed[(column, rule)] = self.suppressed.get((column, rule), 0) + 1
+            return
+        self.columnCounts[column] = columnCount + 1
+        self.ruleCounts[rule] = ruleCount + 1
+        self.passed += 1
+        self.sink.record(errorRecord)
+
+    def close(self):
+        for (column, rule), count in self.suppressed.items():
+            summary = str(count) + " further errors were not logged"
+            if column is not None:
+                summary += " for column " + str(column)
+            if rule is not None:
+                summary += " from the " + str(rule) + " check"
+            self.sink.log(summary + ".", column, 'suppressed')
+        self.sink.close()
+
+
+class ErrorLimitReached(Exception):
+    # Raised by LimitSink to stop validation. column is None when the limit for the whole run was reached
+    def __init__(self, column=None):
+        super().__init__(column)
+        self.column = column
+
+
+class LimitSink(ErrorSink):
+    # Passes every error on to another sink, then raises ErrorLimitReached once a limit is hit so the checks can stop early
+    # After perColumn errors in a column, further errors in that column raise again without being passed on
+    def __init__(self, sink, total=None, perColumn=None):
+        super().__init__()
+        self.sink = sink
+        self.total = total
+        self.perColumn = perColumn
+        self.columnCounts = {}
+        self.stopped = False
+
+    def record(self, errorRecord):
+        column = errorRecord.column
+        if self.perColumn is not None and column is not None and self.columnCounts.get(column, 0) >= self.perColumn:
+            raise ErrorLimitReached(column)
+        self.count += 1
+        self.columnCounts[column] = self.columnCounts.get(column, 0) + 1
+        self.sink.record(errorRecord)
+        if self.total is not None and self.count >= self.total:
+            self.stopped = True
+            raise ErrorLimitReached()
+        if self.perColumn is not None and column is not None and self.columnCounts[column] >= self.perColumn:
+            raise ErrorLimitReached(column)
+
+    def __exit__(self, excType, excValue, traceback):
+        super().__exit__(excType, excValue, traceback)
+        # Hitting the limit for the whole run is the expected way out of the block
+        return isinstance(excValue, ErrorLimitReached) and excValue.column is None
+
+
+# Anything logged outside of a "with sink:" block goes to the default sink, which writes it to stderr
+# It keeps nothing, so a long-running process that logs outside of a run doesn't collect those errors forever
+defaultSink = StreamSink()
+currentSink = contextvars.ContextVar('currentSink', default=defaultSink)
+
+
+def log(string, column=None, rule=None):
+    currentSink.get().log(string, column, rule)
+
+def record(rule, row, column, value, params, formatter):
+    # Cheap to call from the validation loops: no text is built until the record is rendered
+    currentSink.get().record(ErrorRecord(rule, row, column, value, params, formatter))
+
+def logFileName(scanned='', directory='.', extension='.txt'):
+    return directory + '/' + "error log " + scanned + str(datetime.datetime.now()).replace(':', '.') + extension
+
+def write_log(scanned='', header='', directory='.'):
+    # Writes out the errors collected by the current MemorySink, which has to be set with "with MemorySink():"
+    sink = currentSink.get()
+    if not isinstance(sink, MemorySink):
+        raise ValueError('write_log needs the errors to be collected in a MemorySink, use "with ErrorLogging.MemorySink():"')
+    with open(logFileName(scanned, directory), 'w', encoding='UTF-8') as fileObject:
+        fileObject.write(header)
+        if len(sink.records) == 0:
+            fileObject.write("No errors found.")
+        else:
+            fileObject.writelines(sink.errors)
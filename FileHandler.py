@@ -1,33 +1,67 @@
-import json
-import csv
-
-
-class Handler:
-    def __init__(self, rules_path: str):
-        self.rules_path: str = rules_path
-        self.data: dict[str, list] = {}
-        self.raw_rules: dict = {}  # The rules as they are presented in the rules file
-
-        # Default values, will be overwitten by the rules file
-        self.file_rules: dict = {
-            'encoding': 'utf-8',
-            'delimiter': ',',
-            'quotechar': '"',
-            'newline': '',
-            'fieldnames': None
-        }
-
-
-    def load_rules(self, file_path: str) -> None:
-        self.raw_rules = json.load(open(file_path, encoding="utf-8"))
-        # Overwrite the default values with the file's values, but avoid reading non-standard keys
-        self.file_rules = {key: self.raw_rules.get(key, self.file_rules[key]) for key in self.file_rules}
-
-
-    def load_csv(self, csv_path: str) -> None:
-        """
-        Loads a CSV file as a dictionary of header to column
-        """
-        with open(csv_path, newline=self.file_rules['newline']) as file:
-            reader = csv.DictReader(file)
-            self.data = {field: [row[field] for row in reader] for field in reader.fieldnames}
\ No newline at end of file
+import io
+
+import CSVReader
+import Encodings
+import ErrorLogging
+import RulePlan
+
+
+class Handler:
+    def __init__(self, rules_path: str):
+        self.rules_path: str = rules_path
+        self.data: dict[str, list] = {}
+        self.raw_rules: dict = {}  # The rules as they are presented in the rules file
+
+        # Default values, will be overwitten by the rules file
+        self.file_rules: dict = {
+            'encoding': 'utf-8',  # 'auto' to sniff it, trying each of 'encoding fallbacks' in turn
+            'encoding fallbacks': list(Encodings.FALLBACKS),
+            'delimiter': ',',
+            'quotechar': '"',
+            'newline': '',
+            'fieldnames': None
+        }
+
+
+    def load_rules(self, file_path: str) -> None:
+        # The parsed rules are cached on disk by RulePlan and only re-read when the file changes
+        self.raw_rules, self.file_rules = RulePlan.load(file_path, 'handler', self.compile_rules)
+
+    def compile_rules(self, raw_rules: dict, file_path: str, content_hash: str) -> tuple[dict, dict]:
+        # Overwrite the default values with the file's values, but avoid reading non-standard keys
+        return raw_rules, {key: raw_rules.get(key, self.file_rules[key]) for key in self.file_rules}
+
+
+    def load_csv(self, csv_path: str) -> None:
+        """
+        Loads a CSV file as a dictionary of header to column, using the dialect and encoding from the rules file.
+        Like csv.DictReader, blank lines are skipped, short rows are padded with None and extra fields are dropped.
+        Bytes that aren't valid in the encoding are read as U+FFFD and logged with their row, the header being row 1
+        """
+        reader = CSVReader.Reader(self.file_rules['delimiter'], self.file_rules['quotechar'], trim_trailing=False, skip_blank=True)
+        encoding = self.file_rules['encoding']
+        if encoding == Encodings.AUTO:
+            encoding = Encodings.sniff_file(csv_path, tuple(self.file_rules['encoding fallbacks']))
+        with open(csv_path, 'rb') as file:
+            content = file.read()
+        try:
+            text, bad_bytes = Encodings.decode(content, encoding)
+        except UnicodeError as error:
+            # So many bytes are bad that the file must be in another encoding altogether, so nothing in it is checked
+            ErrorLogging.log(f'The file {csv_path} does not appear to be encoded in {encoding} so it cannot be checked: {error}', rule='encoding')
+            self.data = {}
+            return
+        if bad_bytes:
+            rows = Encodings.rows_of(text, [position for position, offset in bad_bytes], reader.reader)
+            for row_num, (position, offset) in zip(rows, bad_bytes):
+                ErrorLogging.record('encoding', row_num, None, None, {'offset': offset, 'encoding': encoding}, format_bad_byte)
+        header, columns = reader.read_columns(io.StringIO(text, newline=self.file_rules['newline']), self.file_rules['fieldnames'], on_mismatch=self.pad_row)
+        self.data = dict(zip(header, columns))
+
+    @staticmethod
+    def pad_row(row_num: int, fields: list, column_count: int) -> list:
+        return fields[:column_count] + [None] * (column_count - len(fields))
+
+
+def format_bad_byte(record: ErrorLogging.ErrorRecord) -> str:
+    return f'Row {record.row} has a byte at offset {record.params["offset"]} that is not valid {record.params["encoding"]}, it was read as \ufffd'
@@ -0,0 +1,102 @@
+"""
+Runs every check of a ConstraintSet in a single row-major pass.
+The plan is worked out once, before the first row: which cells need trimming or upper-casing, which
+validator each cell goes to, which cells make up each unique group key and which cells each one to one
+pair links. Every row is then normalised in place and checked as it comes out of the reader, each cell
+being read once, with the unique group and one to one indexes updated as it goes
+"""
+import operator
+
+import ErrorLogging
+import OneToOne
+import UniqueGroups
+
+
+def _normaliser(constraint):
+    # The same changes Constraint.normalise makes, as a single function, or None when the cell is used as it is
+    if constraint.trimmed and not constraint.caseSensitive:
+        return lambda value: value.strip().upper()
+    if constraint.trimmed:
+        return str.strip
+    if not constraint.caseSensitive:
+        return str.upper
+    return None
+
+
+def _key_getter(positions: list[int]):
+    # Keys are always tuples, the same as UniqueGroupIndex builds, so either can carry on from the other
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda fields: (fields[position],)
+    return operator.itemgetter(*positions)
+
+
+class FusedPlan:
+    def __init__(self, constraint_set, group_index: UniqueGroups.UniqueGroupIndex | UniqueGroups.SpillingGroupIndex, pair_records: dict[str, OneToOne.PairIndex]):
+        """
+        group_index and the pair indexes in pair_records are updated in place
+        """
+        self.constraint_set = constraint_set
+        constraints = constraint_set.constraints
+        self.normalisers = [(i, normaliser) for i, constraint in enumerate(constraints) if (normaliser := _normaliser(constraint)) is not None]
+        self.checks = [(i, constraint, constraint.validate) for i, constraint in enumerate(constraints)]
+
+        group_constraints = constraint_set.groupIndex()[1]
+        row_positions = [constraints.index(constraint) for constraint in group_constraints]
+        self.group_index = group_index
+        if isinstance(group_index, UniqueGroups.SpillingGroupIndex):
+            # Keys are spilled to disk as the rows go by and their duplicates found by group_index.duplicates() at the end
+            self.groups = []
+            self.spill = lambda row_number, fields: group_index.add(row_number, [fields[position] for position in row_positions])
+        else:
+            self.groups = [(group, _key_getter([row_positions[position] for position in positions]), group_index.first_seen[group])
+                           for group, positions in group_index.groups.items()]
+            self.spill = None
+
+        self.pairs = []
+        for pair, index in pair_records.items():
+            a_position, b_position = [constraints.index(constraint) for constraint in constraint_set.oneToOnePairs[pair]]
+            self.pairs.append((a_position, b_position, index.add))
+
+    def run(self, rows) -> int:
+        """
+        rows yields (row number, fields). The fields lists are normalised in place. Returns the number of rows
+        """
+        normalisers = self.normalisers
+        checks = self.checks
+        groups = self.groups
+        spill = self.spill
+        pairs = self.pairs
+        log_duplicate = self.constraint_set.logDuplicate
+        count = 0
+        try:
+            for count, (row_number, fields) in enumerate(rows, 1):
+                for i, normalise in normalisers:
+                    fields[i] = normalise(fields[i])
+
+                for i, constraint, validate in checks:
+                    if not validate(fields[i]):
+                        try:
+                            constraint.logInvalid(fields[i], row_number)
+                        except ErrorLogging.ErrorLimitReached as limit:
+                            if limit.column is None:
+                                raise
+                            # This column has reached its own limit so it isn't checked any more, the others still are
+                            checks = self.checks = [check for check in checks if check[1] is not constraint]
+
+                for group, key_of, first_seen in groups:
+                    key = key_of(fields)
+                    first_row = first_seen.setdefault(key, row_number)
+                    if first_row != row_number:
+                        log_duplicate(group, row_number, first_row, key)
+                if spill is not None:
+                    spill(row_number, fields)
+
+                for a_position, b_position, add_pair in pairs:
+                    add_pair(fields[a_position], fields[b_position])
+        except BaseException:
+            # The spilled keys are no use once the pass is abandoned, e.g. at the error limit, so their files go now
+            if spill is not None:
+                self.group_index.close()
+            raise
+        return count
@@ -1,30 +1,74 @@
-import tkinter as tk
-from tkinter import ttk, filedialog as fd
-# import os
-import Main2 as Main
-
-
-root = tk.Tk()
-root.title('CSValidator')
-root.geometry('500x200')
-
-
-rules_label = tk.Label(master=root, text='Rules:')
-rules_combobox = ttk.Combobox(master=root, width=40)
-rules_label.grid(row=0, column=0, padx=10, sticky='w')
-rules_combobox.grid(row=0, column=1, padx=10, sticky='w', pady=5)
-
-
-def validate():
-    rule_set = rules_combobox.get()
-    if rule_set in ('', None):
-        return  # TODO display an error
-    target_file = fd.askopenfile(title='Select a CSV file to validate', filetypes=[('CSV file', '*.csv')])
-    print(f'Validating file: {target_file}\nAgainst rule set: {rule_set}')
-
-
-run_btn = ttk.Button(master=root, text='Validate', command=validate)
-run_btn.grid(row=1, column=1, sticky='w', padx=10)
-
-
-root.mainloop()
\ No newline at end of file
+import os
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk, filedialog as fd
+
+import Validation
+
+# How often the window checks whether a validation running in the background has finished, in milliseconds
+POLL_INTERVAL = 100
+
+
+class ValidatorWindow:
+    def __init__(self, root, rules_directory='.'):
+        self.root = root
+        root.title('CSValidator')
+        root.geometry('500x200')
+        self.rules_directory = rules_directory
+        # Finished results are handed from the background thread to the Tk thread through this queue
+        self.finished = queue.Queue()
+
+        rules_label = tk.Label(master=root, text='Rules:')
+        self.rules_combobox = ttk.Combobox(master=root, width=40, values=sorted(name for name in os.listdir(rules_directory) if name.endswith('.json')))
+        rules_label.grid(row=0, column=0, padx=10, sticky='w')
+        self.rules_combobox.grid(row=0, column=1, padx=10, sticky='w', pady=5)
+
+        self.run_btn = ttk.Button(master=root, text='Validate', command=self.validate)
+        self.run_btn.grid(row=1, column=1, sticky='w', padx=10)
+
+        self.status_label = tk.Label(master=root, text='', justify='left', wraplength=460)
+        self.status_label.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky='w')
+
+    def validate(self):
+        rule_set = self.rules_combobox.get()
+        if rule_set in ('', None):
+            self.status_label.config(text='Choose a rules file first.')
+            return
+        target_file = fd.askopenfilename(title='Select a CSV file to validate', filetypes=[('CSV file', '*.csv')])
+        if not target_file:
+            return
+        rules_path = os.path.join(self.rules_directory, rule_set)
+        self.run_btn.state(['disabled'])
+        self.status_label.config(text=f'Validating {os.path.basename(target_file)} against {rule_set}...')
+        # Large files take a while, so they are checked off the Tk thread and the window stays responsive
+        threading.Thread(target=self.run, args=(target_file, rules_path), daemon=True).start()
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def run(self, target_file, rules_path):
+        # Runs on the background thread. Tk may only be used from its own thread, so nothing here touches the window
+        try:
+            result = Validation.validate_file(target_file, rules_path)
+            message = f'{result.error_count} errors, log written to {result.write_log(os.path.dirname(target_file))}'
+        except Exception as error:
+            message = f'Validation failed: {error}'
+        self.finished.put(message)
+
+    def poll(self):
+        try:
+            message = self.finished.get_nowait()
+        except queue.Empty:
+            self.root.after(POLL_INTERVAL, self.poll)
+            return
+        self.status_label.config(text=message)
+        self.run_btn.state(['!disabled'])
+
+
+def main():
+    root = tk.Tk()
+    ValidatorWindow(root)
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Memory-mapped column storage.
+Instead of a str per cell, each column keeps the (start, end) byte offsets of its cells in two compact arrays and
+the file itself stays memory-mapped, so the OS pages it in and out as needed. A cell is only decoded, and only
+trimmed or upper-cased, when a check asks for it. Only encodings where the delimiter, quote character and newline
+are single ASCII bytes (UTF-8, cp1252, latin-1, ...) can be mapped; CSVWrapper falls back to its lists otherwise
+"""
+import array
+import bisect
+import codecs
+import collections.abc
+import csv
+import itertools
+import mmap
+import os
+import re
+# Quote-free files are split into cells with NumPy when it is available. See _numpy
+np = None
+
+# Files are checked for decoding errors this many bytes at a time
+DECODE_CHUNK = 1 << 20
+# Where the bytes outside ASCII are is remembered for up to this many of them. With more, no column counts as ASCII
+MAX_NON_ASCII = 4096
+NON_ASCII = re.compile(rb'[\x80-\xff]')
+# The characters str.strip removes that are ASCII, for trimming cells that are still bytes
+ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+
+def _numpy():
+    # NumPy takes longer to import than the rest of the validator, so it is only imported once a file is mapped
+    # Returns None if it isn't installed
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            np = False
+        else:
+            np = numpy
+    return np or None
+
+
+def can_map(file_path: str, encoding: str, delimiter: str, quotechar: str = None) -> bool:
+    """
+    Whether a file can be read through MappedFile: it must be non-empty and the encoding ASCII compatible
+    """
+    if len(delimiter) != 1 or (quotechar is not None and len(quotechar) != 1):
+        return False
+    probe = '\n,|"az09'
+    try:
+        if probe.encode('ascii').decode(encoding) != probe or (delimiter + (quotechar or '')).encode(encoding) != (delimiter + (quotechar or '')).encode('ascii'):
+            return False
+    except (UnicodeError, LookupError):
+        return False
+    return os.path.getsize(file_path) > 0
+
+
+class MappedFile:
+    # A read-only mapping of a file. It pickles as its path, so columns can be sent to worker processes
+    def __init__(self, file_path: str, encoding: str = 'UTF-8'):
+        self.file_path = file_path
+        self.encoding = encoding
+        # Sorted offsets of the bytes outside ASCII, set by check_decodes. None if unknown or there are too many
+        self.non_ascii = None
+        self.open()
+
+    def open(self) -> None:
+        with open(self.file_path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # A UTF-8 byte order mark is not part of the first header cell
+        self.start = len(codecs.BOM_UTF8) if self.buffer[:3] == codecs.BOM_UTF8 and codecs.lookup(self.encoding).name == 'utf-8-sig' else 0
+
+    def check_decodes(self) -> None:
+        """
+        Raises UnicodeError if any part of the file can't be decoded. Nothing decoded is kept, but where the bytes
+        outside ASCII are is noted for MappedColumn.ascii
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        non_ascii = []
+        for position in range(0, len(self.buffer), DECODE_CHUNK):
+            chunk = self.buffer[position:position + DECODE_CHUNK]
+            decoder.decode(chunk)
+            if non_ascii is not None and not chunk.isascii():
+                found = itertools.islice(NON_ASCII.finditer(chunk), MAX_NON_ASCII + 1 - len(non_ascii))
+                non_ascii.extend(position + match.start() for match in found)
+                if len(non_ascii) > MAX_NON_ASCII:
+                    non_ascii = None
+        decoder.decode(b'', final=True)
+        self.non_ascii = non_ascii
+
+    def close(self) -> None:
+        self.buffer.close()
+
+    def __getstate__(self):
+        return {'file_path': self.file_path, 'encoding': self.encoding, 'non_ascii': self.non_ascii}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+
+class MappedColumn(collections.abc.Sequence):
+    """
+    A read-only column whose cells are decoded from the mapped file on access.
+    trimmed and upper apply the same normalisation matchToColumns applies to a list column
+    """
+    def __init__(self, source: MappedFile, starts: array.array, ends: array.array, quotechar: str = None, trimmed: bool = False, upper: bool = False):
+        self.source = source
+        self.starts = starts
+        self.ends = ends
+        # Only set when at least one cell in the column is quoted, since those cells need unquoting
+        self.quotechar = quotechar
+        self.trimmed = trimmed
+        self.upper = upper
+
+    def normalised(self, trimmed: bool = False, upper: bool = False) -> 'MappedColumn':
+        return MappedColumn(self.source, self.starts, self.ends, self.quotechar, self.trimmed or trimmed, self.upper or upper)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MappedColumn(self.source, self.starts[index], self.ends[index], self.quotechar, self.trimmed, self.upper)
+        return self._finish(self.source.buffer[self.starts[index]:self.ends[index]].decode(self.source.encoding))
+
+    def __iter__(self):
+        buffer = self.source.buffer
+        encoding = self.source.encoding
+        values = (buffer[start:end].decode(encoding) for start, end in zip(self.starts, self.ends))
+        if self.quotechar is None and not self.trimmed and not self.upper:
+            return values
+        return map(self._finish, values)
+
+    def _finish(self, value: str) -> str:
+        if self.quotechar is not None and value[:1] == self.quotechar:
+            value = next(csv.reader([value], delimiter='\0', quotechar=self.quotechar, strict=False))[0]
+        if self.trimmed:
+            value = value.strip()
+        if self.upper:
+            value = value.upper()
+        return value
+
+    @property
+    def ascii(self) -> bool:
+        """
+        Whether every cell is unquoted and plain ASCII, so that each byte is one character and failing_rows can check
+        the cells without decoding them
+        """
+        positions = self.source.non_ascii
+        if self.quotechar is not None or positions is None:
+            return False
+        starts = self.starts
+        ends = self.ends
+        for position in positions:
+            i = bisect.bisect_right(starts, position) - 1
+            if i >= 0 and position < ends[i]:
+                return False
+        return True
+
+    def failing_rows(self, validate) -> list[int]:
+        """
+        Rows whose cell validate rejects. validate is given each cell's bytes, trimmed and upper-cased the same as a
+        decoded cell would be. Only for columns where ascii is True
+        """
+        buffer = self.source.buffer
+        cells = (buffer[start:end] for start, end in zip(self.starts, self.ends))
+        if self.trimmed:
+            cells = (cell.strip(ASCII_WHITESPACE) for cell in cells)
+        if self.upper:
+            cells = map(bytes.upper, cells)
+        return [i for i, cell in enumerate(cells) if not validate(cell)]
+
+    def nbytes(self) -> int:
+        # Memory held by the column itself; the mapped file is shared and paged by the OS
+        return self.starts.itemsize * len(self.starts) + self.ends.itemsize * len(self.ends)
+
+
+def _records(buffer, position: int, delimiter: int, quote: int):
+    """
+    Yields (next position, starts, ends, quoted) for each record from position onwards.
+    Records end at a newline that isn't inside quotes; a '\\r' before it is not part of the last cell
+    """
+    size = len(buffer)
+    while position < size:
+        newline = buffer.find(b'\n', position)
+        line_end = size if newline == -1 else newline
+        line = buffer[position:line_end]
+        if quote is None or quote not in line:
+            content_end = line_end - 1 if line.endswith(b'\r') else line_end
+            starts = []
+            ends = []
+            start = position
+            for field in buffer[position:content_end].split(bytes((delimiter,))):
+                starts.append(start)
+                start += len(field)
+                ends.append(start)
+                start += 1
+            yield line_end + 1, starts, ends, False
+            position = line_end + 1
+            continue
+
+        # Quoted cells can hold delimiters and newlines, so this record is walked byte by byte
+        starts = []
+        ends = []
+        field_start = position
+        in_quotes = False
+        while position < size:
+            byte = buffer[position]
+            if in_quotes:
+                if byte == quote:
+                    if position + 1 < size and buffer[position + 1] == quote:
+                        position += 1
+                    else:
+                        in_quotes = False
+            elif byte == quote and position == field_start:
+                in_quotes = True
+            elif byte == delimiter:
+                starts.append(field_start)
+                ends.append(position)
+                field_start = position + 1
+            elif byte == 10:
+                break
+            position += 1
+        end = position - 1 if position > field_start and buffer[position - 1] == 13 else position
+        starts.append(field_start)
+        ends.append(end)
+        yield position + 1, starts, ends, True
+        position += 1
+
+
+def read_header(source: MappedFile, delimiter: str, quotechar: str = None) -> tuple[list[str], int]:
+    """
+    Returns the header cells, without the empty ones after the last name, and the position of the first data record
+    """
+    record = next(_records(source.buffer, source.start, ord(delimiter), ord(quotechar) if quotechar else None), None)
+    if record is None:
+        return [''], len(source.buffer)
+    position, starts, ends, quoted = record
+    header = list(MappedColumn(source, starts, ends, quotechar if quoted else None))
+    while len(header) > 1 and header[-1] == '':
+        header.pop()
+    return header, min(position, len(source.buffer))
+
+
+def read_columns(source: MappedFile, delimiter: str, quotechar: str = None, on_mismatch=None) -> tuple[list[str], list[MappedColumn]]:
+    """
+    Indexes every cell of the file. Follows CSVReader.Reader.read_columns: trailing empty or delimiter-only rows
+    are dropped, empty cells past the header's width are ignored, and on_mismatch(row number, fields, column count)
+    is told about rows with the wrong number of cells, which are left out
+    """
+    header, position = read_header(source, delimiter, quotechar)
+    quote = ord(quotechar) if quotechar else None
+    if _numpy() is not None and (quote is None or source.buffer.find(bytes((quote,)), position) == -1):
+        starts, ends = _index_plain(source, position, ord(delimiter), len(header), on_mismatch)
+        quoted = False
+    else:
+        starts, ends, quoted = _index_records(source, position, ord(delimiter), quote, len(header), on_mismatch)
+    columns = [MappedColumn(source, column_starts, column_ends, quotechar if quoted else None) for column_starts, column_ends in zip(starts, ends)]
+    return header, columns
+
+
+def _fit(source: MappedFile, row_number: int, starts: list[int], ends: list[int], quoted: bool, quotechar: str, column_count: int, on_mismatch) -> bool:
+    # Empty cells past the header's width are dropped; True if the row then has the right number of cells
+    while len(starts) > column_count and starts[-1] == ends[-1]:
+        starts.pop()
+        ends.pop()
+    if len(starts) == column_count:
+        return True
+    if on_mismatch is not None:
+        on_mismatch(row_number, list(MappedColumn(source, starts, ends, quotechar if quoted else None)), column_count)
+    return False
+
+
+def _index_records(source: MappedFile, position: int, delimiter: int, quote: int, column_count: int, on_mismatch):
+    starts = [array.array('q') for _ in range(column_count)]
+    ends = [array.array('q') for _ in range(column_count)]
+    quotechar = chr(quote) if quote is not None else None
+    any_quoted = False
+    # Trivial rows are held back until a non-trivial row shows they are not part of the trailing block
+    pending = []
+    for row_number, (_, row_starts, row_ends, quoted) in enumerate(_records(source.buffer, position, delimiter, quote), 2):
+        if quoted:
+            trivial = not any(MappedColumn(source, row_starts, row_ends, quotechar))
+        else:
+            trivial = all(start == end for start, end in zip(row_starts, row_ends))
+        if trivial:
+            pending.append((row_number, row_starts, row_ends, quoted))
+            continue
+        pending.append((row_number, row_starts, row_ends, quoted))
+        for pending_number, pending_starts, pending_ends, pending_quoted in pending:
+            if _fit(source, pending_number, pending_starts, pending_ends, pending_quoted, quotechar, column_count, on_mismatch):
+                any_quoted = any_quoted or pending_quoted
+                for column_starts, column_ends, start, end in zip(starts, ends, pending_starts, pending_ends):
+                    column_starts.append(start)
+                    column_ends.append(end)
+        pending = []
+    return starts, ends, any_quoted
+
+
+def _index_plain(source: MappedFile, position: int, delimiter: int, column_count: int, on_mismatch):
+    """
+    Vectorised indexing for files without quotes: every line is a record and every delimiter a cell boundary.
+    Lines with the wrong number of delimiters are the only ones looked at one by one
+    """
+    buffer = source.buffer
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    newlines = np.flatnonzero(data[position:] == 10) + position
+    line_starts = np.concatenate(([position], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(data)]))
+    if line_starts[-1] == len(data):
+        # Nothing after the final newline
+        line_starts = line_starts[:-1]
+        line_ends = line_ends[:-1]
+    content_ends = line_ends - ((line_ends > line_starts) & (data[np.maximum(line_ends - 1, 0)] == 13))
+
+    delimiters = np.flatnonzero(data[position:] == delimiter) + position
+    first_delimiter = np.searchsorted(delimiters, line_starts)
+    delimiter_counts = np.searchsorted(delimiters, content_ends) - first_delimiter
+
+    # Lines made only of delimiters at the end of the file are dropped
+    trivial = content_ends - line_starts == delimiter_counts
+    non_trivial = np.flatnonzero(~trivial)
+    line_count = int(non_trivial[-1]) + 1 if len(non_trivial) else 0
+
+    cell_starts = np.empty((line_count, column_count), dtype=np.int64)
+    cell_ends = np.empty((line_count, column_count), dtype=np.int64)
+    good = delimiter_counts[:line_count] == column_count - 1
+    good_lines = np.flatnonzero(good)
+    for k in range(column_count):
+        if k == 0:
+            cell_starts[good_lines, 0] = line_starts[good_lines]
+        else:
+            cell_starts[good_lines, k] = delimiters[first_delimiter[good_lines] + k - 1] + 1
+        if k == column_count - 1:
+            cell_ends[good_lines, k] = content_ends[good_lines]
+        else:
+            cell_ends[good_lines, k] = delimiters[first_delimiter[good_lines] + k]
+
+    keep = good.copy()
+    for line in np.flatnonzero(~good).tolist():
+        _, row_starts, row_ends, _ = next(_records(buffer, int(line_starts[line]), delimiter, None))
+        # The header is row 1 and the first data line row 2
+        if _fit(source, line + 2, row_starts, row_ends, False, None, column_count, on_mismatch):
+            cell_starts[line] = row_starts
+            cell_ends[line] = row_ends
+            keep[line] = True
+
+    starts = []
+    ends = []
+    for k in range(column_count):
+        starts.append(array.array('q', np.ascontiguousarray(cell_starts[keep, k]).tobytes()))
+        ends.append(array.array('q', np.ascontiguousarray(cell_ends[keep, k]).tobytes()))
+    return starts, ends
@@ -0,0 +1,153 @@
+"""
+One to one checking for pairs of columns.
+Each side of a pair is dictionary-encoded: every distinct value gets an integer code, the value itself is stored
+once, and each code's partner is a single slot in a compact array. A value stops being tracked as soon as it has
+a second partner; from then on only the first few partners are kept, as examples for the error log, and a value
+with more is only marked as having overflowed. Memory therefore grows with the number of distinct values, never with the number of rows or of conflicting partners
+"""
+import array
+
+# Partners kept per conflicting value for the error log
+MAX_EXAMPLES = 10
+# Partner slot markers. Real partners are codes, which are never negative
+NO_PARTNER = -1
+CONFLICT = -2
+
+
+class PairSide:
+    def __init__(self):
+        self.codes: dict = {}
+        self.values: list = []
+        # The code of each value's only partner so far, or CONFLICT once it has had two
+        self.partners = array.array('q')
+        # Example partner codes, in the order they were first seen, for each conflicting value's code
+        self.conflicts: dict[int, list[int]] = {}
+        # Codes of the conflicting values that had more partners than the examples hold
+        self.overflowed: set[int] = set()
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.partners.append(NO_PARTNER)
+        return code
+
+    def link(self, code: int, partner: int, max_examples: int) -> bool:
+        """
+        Records partner against code. Returns True if that gave code a new conflicting partner.
+        Partners past the examples aren't kept, so once code has overflowed every partner outside its examples
+        counts as new
+        """
+        current = self.partners[code]
+        if current == partner:
+            return False
+        if current == NO_PARTNER:
+            self.partners[code] = partner
+            return False
+        if current != CONFLICT:
+            self.partners[code] = CONFLICT
+            self.conflicts[code] = [current, partner]
+            return True
+        examples = self.conflicts[code]
+        if partner in examples:
+            return False
+        if len(examples) < max_examples:
+            examples.append(partner)
+        else:
+            self.overflowed.add(code)
+        return True
+
+    def conflicting(self):
+        """
+        Yields (code, example partner codes, overflowed) for each conflicting value, in the order the values were first seen
+        """
+        for code in sorted(self.conflicts):
+            yield code, self.conflicts[code], code in self.overflowed
+
+
+class PairIndex:
+    """
+    Tracks one pair of columns. add and add_columns take the a and b values in row order
+    """
+    def __init__(self, max_examples: int = MAX_EXAMPLES):
+        self.max_examples = max_examples
+        self.a = PairSide()
+        self.b = PairSide()
+        # Codes of the values that gained a conflicting partner since the last call to reset_changes
+        self.changed = (set(), set())
+
+    def add(self, a, b) -> None:
+        a_code = self.a.encode(a)
+        b_code = self.b.encode(b)
+        if self.a.link(a_code, b_code, self.max_examples):
+            self.changed[0].add(a_code)
+        if self.b.link(b_code, a_code, self.max_examples):
+            self.changed[1].add(b_code)
+
+    def add_columns(self, a_column, b_column) -> 'PairIndex':
+        add = self.add
+        for a, b in zip(a_column, b_column):
+            add(a, b)
+        return self
+
+    def merge(self, later: 'PairIndex') -> 'PairIndex':
+        """
+        Folds in an index built over later rows, e.g. another shard of the same file.
+        The result is the same as one index fed every row in order
+        """
+        a_codes = [self.a.encode(value) for value in later.a.values]
+        b_codes = [self.b.encode(value) for value in later.b.values]
+        for side, other_side, codes, partner_codes, changed in ((self.a, later.a, a_codes, b_codes, self.changed[0]),
+                                                               (self.b, later.b, b_codes, a_codes, self.changed[1])):
+            for later_code, partner in enumerate(other_side.partners):
+                partners = other_side.conflicts[later_code] if partner == CONFLICT else [partner]
+                for later_partner in partners:
+                    if side.link(codes[later_code], partner_codes[later_partner], self.max_examples):
+                        changed.add(codes[later_code])
+                # The partners the later index didn't keep are more than the examples can hold here too
+                if later_code in other_side.overflowed:
+                    side.overflowed.add(codes[later_code])
+                    changed.add(codes[later_code])
+        return self
+
+    def decode(self, a_values: list = None, b_values: list = None) -> None:
+        """
+        For an index fed codes rather than values: replaces the codes with the values they stand for
+        """
+        if a_values is not None:
+            self.a.values = [a_values[value] for value in self.a.values]
+            self.a.codes = {value: code for code, value in enumerate(self.a.values)}
+        if b_values is not None:
+            self.b.values = [b_values[value] for value in self.b.values]
+            self.b.codes = {value: code for code, value in enumerate(self.b.values)}
+
+    def reset_changes(self) -> None:
+        self.changed = (set(), set())
+
+    def conflicts(self, changed_only: bool = False):
+        """
+        Yields (side, value, partner values, complete) for every conflicting value, side being 0 for a and 1 for b.
+        complete is False when the value had more partners than max_examples, so not all of them are given.
+        changed_only limits this to the values that gained a partner since reset_changes
+        """
+        for side_number, (side, other_side) in enumerate(((self.a, self.b), (self.b, self.a))):
+            for code, examples, overflowed in side.conflicting():
+                if changed_only and code not in self.changed[side_number]:
+                    continue
+                yield side_number, side.values[code], [other_side.values[partner] for partner in examples], not overflowed
+
+
+def index_pairs(pairs: list[tuple], max_examples: int = MAX_EXAMPLES) -> list[PairIndex]:
+    """
+    Checks any number of (a column, b column) pairs in a single pass over the rows
+    """
+    indexes = [PairIndex(max_examples) for _ in pairs]
+    if not pairs:
+        return indexes
+    adds = [index.add for index in indexes]
+    columns = [column for pair in pairs for column in pair]
+    for values in zip(*columns):
+        for i, add in enumerate(adds):
+            add(values[2 * i], values[2 * i + 1])
+    return indexes
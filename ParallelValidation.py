@@ -0,0 +1,144 @@
+"""
+Runs the ConstraintSet checks across a pool of processes.
+Every column is cut into row shards and each (column, shard) is checked separately. Unique groups and
+one to one pairs are indexed per shard and the shard indexes are merged in row order, so the results and
+the order of the log are exactly those of a serial validateAll.
+A pool from create_pool can be shared by any number of calls, e.g. for every file of a batch, so that its processes
+are only started once
+"""
+import concurrent.futures
+import os
+
+import ConstraintModule
+import EncodedColumns
+import ErrorLogging
+import OneToOne
+import UniqueGroups
+
+DEFAULT_SHARD_SIZE = 250_000
+
+
+def create_pool(workers: int = None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    A pool that validate_all can use for any number of files, so its processes are started only once.
+    The caller shuts it down. workers=None uses every core
+    """
+    return concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count())
+
+
+def _check_column_shard(constraint, shard, start: int, engine: str) -> list[int]:
+    """
+    Returns the indices of the rows of the shard, which starts at row start, that fail the constraint
+    """
+    if isinstance(shard, EncodedColumns.EncodedColumn):
+        return [start + i for i in shard.failing_rows(constraint.validate)]
+    if engine == 'numpy':
+        return [start + int(i) for i in ConstraintModule.loadVectorEngine().failing_rows(constraint, shard)]
+    validate = constraint.validate
+    return [start + i for i, value in enumerate(shard) if not validate(value)]
+
+
+def _index_group_shard(groups: dict[str, list[int]], shards: list, start: int):
+    index = UniqueGroups.UniqueGroupIndex(groups)
+    duplicates = list(index.add_columns([EncodedColumns.key_column(shard) for shard in shards], start))
+    return index, duplicates
+
+
+def _index_pair_shard(a_shard, b_shard):
+    return OneToOne.PairIndex().add_columns(EncodedColumns.key_column(a_shard), EncodedColumns.key_column(b_shard))
+
+
+def validate_all(constraint_set, workers: int = None, engine: str = 'python', shard_size: int = DEFAULT_SHARD_SIZE, pool=None) -> None:
+    """
+    Parallel equivalent of ConstraintSet.validateAll. workers=None uses every core.
+    pool, from create_pool, is used instead of starting a pool of workers processes for this call alone
+    """
+    if pool is None:
+        with create_pool(workers) as pool:
+            _run(constraint_set, engine, shard_size, pool)
+    else:
+        _run(constraint_set, engine, shard_size, pool)
+
+
+def _run(constraint_set, engine: str, shard_size: int, pool) -> None:
+    engine = constraint_set.checkEngine(engine)
+    constraints = constraint_set.constraints
+    columns = [constraint.column for constraint in constraints]
+    row_count = len(columns[0]) if columns else 0
+    shards = [(start, min(start + shard_size, row_count)) for start in range(0, row_count, shard_size)]
+
+    # Each job is sent the shards it needs, so the pool's processes don't depend on the file being checked.
+    # Everything is submitted up front so the pool stays busy, then collected in serial order
+    column_jobs = [
+        [pool.submit(_check_column_shard, constraint, column[start:stop], start, engine) for start, stop in shards]
+        for constraint, column in zip(constraints, columns)
+    ]
+
+    group_index = None
+    group_jobs = []
+    if constraint_set.uniqueGroups:
+        group_index, group_constraints = constraint_set.groupIndex()
+        group_columns = [constraint.column for constraint in group_constraints]
+        group_jobs = [pool.submit(_index_group_shard, group_index.groups, [column[start:stop] for column in group_columns], start)
+                      for start, stop in shards]
+
+    pair_jobs = {}
+    for pair, pair_constraints in constraint_set.oneToOnePairs.items():
+        if len(pair_constraints) == 2:
+            a_column, b_column = [constraint.column for constraint in pair_constraints]
+            pair_jobs[pair] = [pool.submit(_index_pair_shard, a_column[start:stop], b_column[start:stop]) for start, stop in shards]
+
+    jobs = [job for column in column_jobs for job in column] + group_jobs + [job for pair in pair_jobs.values() for job in pair]
+    try:
+        _collect(constraint_set, column_jobs, group_jobs, pair_jobs, group_index)
+    except BaseException:
+        # Nothing else will be logged, so the work still queued is dropped rather than left to hold up a shared pool
+        for job in jobs:
+            job.cancel()
+        raise
+
+
+def _collect(constraint_set, column_jobs: list, group_jobs: list, pair_jobs: dict, group_index: UniqueGroups.UniqueGroupIndex) -> None:
+    for constraint, jobs in zip(constraint_set.constraints, column_jobs):
+        try:
+            for job in jobs:
+                for i in job.result():
+                    # The plus 2 is to match the row count seen in excel etc
+                    constraint.logInvalid(constraint.column[i], i + 2)
+        except ErrorLogging.ErrorLimitReached as limit:
+            # A column that has reached its own limit is left, the others are still logged
+            if limit.column is None:
+                raise
+
+    if group_jobs:
+        _merge_groups(constraint_set, group_index, group_jobs)
+
+    for pair in constraint_set.oneToOnePairs:
+        if pair not in pair_jobs:
+            constraint_set.logUnpairedOneToOne(pair)
+            continue
+        index = OneToOne.PairIndex()
+        for job in pair_jobs[pair]:
+            index.merge(job.result())
+        index.decode(*[EncodedColumns.decoder(constraint.column) for constraint in constraint_set.oneToOnePairs[pair]])
+        constraint_set.logOneToOne(pair, index)
+
+
+def _merge_groups(constraint_set, group_index: UniqueGroups.UniqueGroupIndex, group_jobs: list) -> None:
+    group_order = list(group_index.groups)
+    decoders = [EncodedColumns.decoder(constraint.column) for constraint in constraint_set.groupIndex()[1]]
+    duplicates = []
+    for job in group_jobs:
+        shard_index, shard_duplicates = job.result()
+        # Keys first seen in this shard may already have been seen in an earlier one
+        duplicates.extend(group_index.merge(shard_index))
+        # Duplicates within the shard point at the shard's first row, which an earlier shard may beat
+        for row_num, group, key, first_row in shard_duplicates:
+            duplicates.append((row_num, group, key, group_index.first_seen[group][key]))
+
+    # A serial run logs row by row, and within a row group by group
+    duplicates.sort(key=lambda duplicate: (duplicate[0], group_order.index(duplicate[1])))
+    for row_num, group, key, first_row in duplicates:
+        # The + 2 is to account for the header being removed and python counting from 0 while excel starts at 1
+        key = constraint_set.decodeKey(group_index.groups[group], key, decoders)
+        constraint_set.logDuplicate(group, row_num + 2, first_row + 2, key)
@@ -1,170 +1,230 @@
-import ErrorLogging
-
-
-class RuleSet:
-    """
-    This class acts as a contained for individual column rules and also manages
-    rules that must look at multiple columns at once e.g. One to One checks
-    """
-    def __init__(self, rule_info: dict):
-        self.rules: list[Rule] = []
-        self.unique_groups = {}
-        self.one_to_one_pairs = []
-        self.load_rules(rule_info)
-
-
-    def load_rules(self, rule_info: dict) -> None:
-        for key, val in rule_info.items():
-            self.rules.append(Rule(key, val))
-            if 'unique group' in val:
-                self.unique_groups[val['unique group']] = self.unique_groups.get(val['unique group'], []).append(key)
-            if 'one to one' in val:
-                pair = (key, val['one to one'])
-                # Protection against processing the same pair twice if the rules for both columns
-                # mention the column
-                if not (pair in self.one_to_one_pairs or (pair[1], pair[0]) in self.one_to_one_pairs):
-                    self.one_to_one_pairs.append(pair)
-
-
-    def validate_unique_groups(self, data: dict[str, list]):
-        """
-        Check multiple columns at once and ensure that the combination of those columns
-        is unique
-        """
-        for group_name, column_names in self.unique_groups.items():
-            unique_dict: dict[tuple: int] = {}
-            columns = {col: data[col] for col in column_names}  # Take only relevant cols for this group
-            for idx, values in enumerate(zip(columns.values())):
-                if values in unique_dict:
-                    ErrorLogging.log(
-                        f'Row {idx + 1} contains a duplicate value for unique group {group_name}: '
-                        f'Values {values} match row {unique_dict[values] + 1}'
-                    )
-                else:
-                    unique_dict[values] = idx
-    
-
-    def validate_one_to_one(self, data: dict[str, list]) -> int:
-        """
-        Checks that two columns have a one to one relationship, and returns any examples of this breaking
-        """
-        error_count = 0
-        for pair in self.one_to_one_pairs:
-            if len(pair) != 2:
-                raise ValueError(f'A one to one pair must specify 2 columns, instead got {len(pair)}')
-            a, b = pair
-
-            a_to_b: dict[str, set] = {}
-            b_to_a: dict[str, set] = {}
-
-            # Generate dictionary a every a -> b and b -> a combination
-            for a, b in zip(data[a], data[b]):
-                if not a in a_to_b:
-                    a_to_b[a] = set()
-                a_to_b[a].add(b)
-                if not b in b_to_a:
-                    b_to_a[b] = set()
-                b_to_a[b].add(a)
-            
-            # Log errors
-            for key, val in a_to_b:
-                if len(val) != 1:
-                    ErrorLogging.log(f'Columns {a} and {b} have a 1-to-1 relation, but {key} matches to {val}')
-                    error_count += 1
-            for key, val in b_to_a:
-                if len(val) != 1:
-                    ErrorLogging.log(f'Columns {b} and {a} have a 1-to-1 relation, but {key} matches to {val}')
-                    error_count += 1
-        return error_count
-
-
-class Rule:
-    def __init__(self, name: str, rule_info: dict) -> None:
-        self.name = name
-        self.checks = []
-        self.parse_rule(rule_info)
-
-    def parse_rule(self, rule_info: dict) -> None:
-        # Setup checks for type
-        if not 'type' in rule_info or rule_info['type'].lower() in ('str', 'string', 'text', 'varchar'):
-            self.data_type = 'str'
-        elif rule_info['type'].lower() in ('int', 'integer'):
-            self.data_type = 'int'
-        elif rule_info['type'].lower() in ('float', 'double', 'decimal', 'number', 'numeric'):
-            self.data_type = 'float'
-        # TODO: Add support for date and other data types
-        else:
-            raise ValueError(f'Unrecognised value for type: {rule_info["type"]}')
-        self.checks = [self.validate_data_type]
-
-        # Setup checks for values
-        if 'values' in rule_info:
-            self.values = rule_info['values']
-            self.checks.append(self.validate_possibilities_list)
-        
-        if 'minimum' in rule_info or 'maximum' in rule_info:
-            self.minimum = float(rule_info.get('minimum', '-inf'))
-            self.maximum = float(rule_info.get('maximum', 'inf'))
-            self.checks.append(self.validate_min_max)
-        
-        # Exceptions are values that might break other rules, but should still be allowed
-        # They bypass type checks and min_max checks
-        # They DO NOT bypass possiblee checks; they should just be in values
-        self.exceptions = set(rule_info.get('exceptions', []))
-    
-
-    def validate_data_type(self, column: list) -> int:
-        if self.data_type == 'str':
-            return 0  # Nothing to check here
-        if self.data_type == 'int':
-            bad_lines = [idx for idx, val in enumerate(column) if not self.check_int(val)]
-        elif self.data_type == 'float':
-            bad_lines = [idx for idx, val in enumerate(column) if not self.check_float(val)]
-        
-        # Log the lines that failed, and return an overall failure/success
-        for line in bad_lines:
-            self.log_issue(line, f'cannot be interpreted as {self.data_type}')
-        return len(bad_lines)   
-
-
-    def check_int(self, value: str) -> bool:
-        try:
-            int(value)
-        except ValueError:
-            return value in self.exceptions
-    
-    def check_float(self, value: str) -> bool:
-        try:
-            int(value)
-        except ValueError:
-            return value in self.exceptions
-    
-
-    def validate_possibilities_list(self, column: list[str]) -> int:
-        bad_lines = [idx for idx, val in enumerate(column) if not val in self.values]
-        for line in bad_lines:
-            self.log_issue(line, f'is not among allowed values: {self.values}')
-        return len(bad_lines)
-
-
-    def validate_min_max(self, column: list[str]) -> int:
-        if self.type == 'str':
-            bad_lines = [idx for idx, val in enumerate(column) if not self.minimum <= len(val) <= self.maximum]
-        elif self.type in ('int', 'float'):
-            bad_lines = [idx for idx, val in enumerate(column) if not self.minimum <= val <= self.maximum]
-        
-        # Log the lines that failed the check
-        if self.data_type == 'str':
-            for line in bad_lines:
-                self.log_issue(line, f'must be between {self.minimum} and {self.maximum} characters long')
-        else:
-            for line in bad_lines:
-                self.log_issue(line, f'must have a value between {self.minimum} and {self.maximum}')
-    
-
-    def log_issue(self, row_num: int, end_text: str = '') -> None:
-        """
-        Several checks requried logging basically the same error structure, so this
-        is used to simplify that
-        """
-        ErrorLogging.log(f'Entry at row: {row_num + 1} for column {self.name} {end_text}')
\ No newline at end of file
+import functools
+
+import ErrorLogging
+import OneToOne
+import RuleTypes
+import UniqueGroups
+import ValueSets
+
+
+class RuleSet:
+    """
+    This class acts as a contained for individual column rules and also manages
+    rules that must look at multiple columns at once e.g. One to One checks
+    """
+    def __init__(self, rule_info: dict):
+        self.rules: list[Rule] = []
+        self.unique_groups = {}
+        self.one_to_one_pairs = []
+        self.load_rules(rule_info)
+
+
+    def load_rules(self, rule_info: dict) -> None:
+        for key, val in rule_info.items():
+            self.rules.append(Rule(key, val))
+            if 'unique group' in val:
+                self.unique_groups.setdefault(val['unique group'], []).append(key)
+            if 'one to one' in val:
+                pair = (key, val['one to one'])
+                # Protection against processing the same pair twice if the rules for both columns
+                # mention the column
+                if not (pair in self.one_to_one_pairs or (pair[1], pair[0]) in self.one_to_one_pairs):
+                    self.one_to_one_pairs.append(pair)
+
+
+    def validate_unique_groups(self, data: dict[str, list], memory_budget: int = None):
+        """
+        Check multiple columns at once and ensure that the combination of those columns
+        is unique. All groups are checked in the same pass over the data.
+        If the keys would take more than memory_budget bytes they are spilled to disk and checked in partitions
+        """
+        column_names = list(dict.fromkeys(col for cols in self.unique_groups.values() for col in cols))
+        groups = {group_name: [column_names.index(col) for col in cols] for group_name, cols in self.unique_groups.items()}
+        rows = len(data[column_names[0]]) if column_names else 0
+        if memory_budget is not None and UniqueGroups.index_bytes(rows, len(groups)) > memory_budget:
+            index = UniqueGroups.SpillingGroupIndex(groups, memory_budget, rows)
+        else:
+            index = UniqueGroups.UniqueGroupIndex(groups)
+        # Take only relevant cols for the groups
+        try:
+            for idx, group_name, values, first_idx in index.add_columns([data[col] for col in column_names]):
+                ErrorLogging.record('unique group', idx + 1, None, values, {'group': group_name, 'first_row': first_idx + 1}, format_duplicate)
+        finally:
+            index.close()
+    
+
+    def enable_verdict_cache(self, size: int = 4096) -> None:
+        for rule in self.rules:
+            rule.enable_verdict_cache(size)
+
+    def verdict_cache_stats(self) -> dict[str, dict]:
+        return {rule.name: stats for rule in self.rules if (stats := rule.verdict_cache_stats()) is not None}
+
+
+    def validate_one_to_one(self, data: dict[str, list]) -> int:
+        """
+        Checks that each pair of columns has a one to one relationship, logging every value with more than one partner.
+        All pairs are checked in the same pass over the data
+        """
+        for pair in self.one_to_one_pairs:
+            if len(pair) != 2:
+                raise ValueError(f'A one to one pair must specify 2 columns, instead got {len(pair)}')
+
+        indexes = OneToOne.index_pairs([(data[a_name], data[b_name]) for a_name, b_name in self.one_to_one_pairs])
+        error_count = 0
+        for pair, index in zip(self.one_to_one_pairs, indexes):
+            for side, value, partners, complete in index.conflicts():
+                column, other_column = pair if side == 0 else pair[::-1]
+                ErrorLogging.record('one to one', None, column, value, {'other_column': other_column, 'values': partners, 'complete': complete}, format_one_to_one)
+                error_count += 1
+        return error_count
+
+
+class Rule:
+    def __init__(self, name: str, rule_info: dict) -> None:
+        self.name = name
+        self.checks = []
+        self.issue_params = None
+        self.rule_type = None
+        self.parse_rule(rule_info)
+
+    def parse_rule(self, rule_info: dict) -> None:
+        # Setup checks for type
+        if not 'type' in rule_info or rule_info['type'].lower() in ('str', 'string', 'text', 'varchar'):
+            self.data_type = 'str'
+        elif rule_info['type'].lower() in ('int', 'integer'):
+            self.data_type = 'int'
+        elif rule_info['type'].lower() in ('float', 'double', 'decimal', 'number', 'numeric'):
+            self.data_type = 'float'
+        elif RuleTypes.lookup(rule_info['type'], rule_info) is not None:
+            # Dates, patterns and anything else in the RuleTypes registry, which read their own minimum and maximum
+            self.rule_type = RuleTypes.create(rule_info['type'], {key: value for key, value in rule_info.items() if key != 'type'})
+            self.data_type = self.rule_type.describe()
+        else:
+            raise ValueError(f'Unrecognised value for type: {rule_info["type"]}')
+        self.checks = [self.validate_data_type]
+
+        # Setup checks for values
+        if 'values' in rule_info:
+            self.values = rule_info['values']
+            self.allowed_values = ValueSets.compile_values(self.values)
+            self.checks.append(self.validate_possibilities_list)
+        
+        if self.rule_type is None and ('minimum' in rule_info or 'maximum' in rule_info):
+            self.minimum = float(rule_info.get('minimum', '-inf'))
+            self.maximum = float(rule_info.get('maximum', 'inf'))
+            self.checks.append(self.validate_min_max)
+        
+        # Exceptions are values that might break other rules, but should still be allowed
+        # They bypass type checks and min_max checks
+        # They DO NOT bypass possiblee checks; they should just be in values
+        self.exceptions = set(rule_info.get('exceptions', []))
+    
+
+    def validate_data_type(self, column: list) -> int:
+        if self.data_type == 'str':
+            return 0  # Nothing to check here
+        if self.data_type == 'int':
+            bad_lines = [idx for idx, val in enumerate(column) if not self.check_int(val)]
+        elif self.data_type == 'float':
+            bad_lines = [idx for idx, val in enumerate(column) if not self.check_float(val)]
+        else:
+            bad_lines = [idx for idx in self.rule_type.failing_rows(column) if column[idx] not in self.exceptions]
+        
+        # Log the lines that failed, and return an overall failure/success
+        for line in bad_lines:
+            self.log_issue(line, 'type', column[line])
+        return len(bad_lines)   
+
+
+    def check_int(self, value: str) -> bool:
+        try:
+            int(value)
+        except ValueError:
+            return value in self.exceptions
+        return True
+    
+    def check_float(self, value: str) -> bool:
+        try:
+            float(value)
+        except ValueError:
+            return value in self.exceptions
+        return True
+
+    def enable_verdict_cache(self, size: int = 4096) -> None:
+        """
+        Remembers the type check verdicts of the last size distinct values. Verdicts only depend on the value,
+        so the results are the same as without the cache
+        """
+        self.check_int = functools.lru_cache(maxsize=size)(self.check_int)
+        self.check_float = functools.lru_cache(maxsize=size)(self.check_float)
+
+    def verdict_cache_stats(self) -> dict:
+        check = {'int': self.check_int, 'float': self.check_float}.get(self.data_type)
+        if not hasattr(check, 'cache_info'):
+            return None
+        info = check.cache_info()
+        lookups = info.hits + info.misses
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize,
+                'hit_rate': info.hits / lookups if lookups else 0.0}
+    
+
+    def validate_possibilities_list(self, column: list[str]) -> int:
+        bad_lines = [idx for idx, val in enumerate(column) if not val in self.allowed_values]
+        for line in bad_lines:
+            self.log_issue(line, 'values', column[line])
+        return len(bad_lines)
+
+
+    def validate_min_max(self, column: list[str]) -> int:
+        if self.type == 'str':
+            bad_lines = [idx for idx, val in enumerate(column) if not self.minimum <= len(val) <= self.maximum]
+        elif self.type in ('int', 'float'):
+            bad_lines = [idx for idx, val in enumerate(column) if not self.minimum <= val <= self.maximum]
+        
+        # Log the lines that failed the check
+        if self.data_type == 'str':
+            for line in bad_lines:
+                self.log_issue(line, 'length', column[line])
+        else:
+            for line in bad_lines:
+                self.log_issue(line, 'min max', column[line])
+    
+
+    def log_issue(self, row_num: int, rule: str, value: str = None) -> None:
+        """
+        Several checks requried logging basically the same error structure, so this
+        is used to simplify that. The text itself is only built by format_issue if a text log is written
+        """
+        if self.issue_params is None:
+            self.issue_params = {
+                'data_type': self.data_type,
+                'values': getattr(self, 'values', None),
+                'minimum': getattr(self, 'minimum', None),
+                'maximum': getattr(self, 'maximum', None),
+            }
+        ErrorLogging.record(rule, row_num + 1, self.name, value, self.issue_params, format_issue)
+
+
+ISSUE_TEXT = {
+    'type': 'cannot be interpreted as {data_type}',
+    'values': 'is not among allowed values: {values}',
+    'length': 'must be between {minimum} and {maximum} characters long',
+    'min max': 'must have a value between {minimum} and {maximum}',
+}
+
+
+def format_duplicate(record: ErrorLogging.ErrorRecord) -> str:
+    return (
+        f'Row {record.row} contains a duplicate value for unique group {record.params["group"]}: '
+        f'Values {record.value} match row {record.params["first_row"]}'
+    )
+
+
+def format_one_to_one(record: ErrorLogging.ErrorRecord) -> str:
+    more = '' if record.params['complete'] else ' (and possibly more)'
+    return f'Columns {record.column} and {record.params["other_column"]} have a 1-to-1 relation, but {record.value} matches to {record.params["values"]}{more}'
+
+
+def format_issue(record: ErrorLogging.ErrorRecord) -> str:
+    return f'Entry at row: {record.row} for column {record.column} ' + ISSUE_TEXT[record.rule].format(**record.params)
\ No newline at end of file
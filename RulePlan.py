@@ -0,0 +1,232 @@
+"""
+Compiles JSON rule files into immutable rule plans and caches them on disk.
+
+A cached plan is keyed by the rule file's absolute path and is only reused while the file's
+mtime and size are unchanged, or, if they have changed, while its content hash still matches.
+Nothing in here calls eval, booleans in the rules are parsed explicitly.
+
+    python RulePlan.py inspect rules.json   # print the compiled plan
+    python RulePlan.py clear [rules.json]   # drop one cached plan, or all of them
+"""
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import RuleTypes
+
+# Bump this whenever the plan classes change so that old pickles are recompiled rather than loaded
+PLAN_VERSION = 3
+CACHE_DIR = os.environ.get('CSVALIDATOR_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'CSValidator'))
+
+
+@dataclasses.dataclass(frozen=True)
+class ColumnRule:
+    name: str
+    col_type: str = 'str'  # 'int', 'float', 'str' or the name of a type in the RuleTypes registry
+    essential: bool = False
+    hashable: bool = False
+    minimum: float = -float('inf')
+    maximum: float = float('inf')
+    decimal_places: int = 0
+    values: tuple = None  # None when any value of the type is allowed
+    unique_group: str = None
+    one_to_one: str = None
+    trimmed: bool = False
+    case_sensitive: bool = True
+    # (key, value) pairs from the rule that configure a RuleTypes type, such as its Pattern or Format
+    type_options: tuple = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class RulePlan:
+    source: str
+    content_hash: str
+    columns: tuple[ColumnRule, ...]
+    # Problems with the rule file, in the order the old loader logged them
+    problems: tuple[str, ...] = ()
+    # Columns whose RuleTypes type could not be set up, e.g. a missing plugin. These depend on more than the rule file,
+    # so a plan with any is never cached
+    unresolved_types: tuple[str, ...] = ()
+
+    def describe(self) -> str:
+        lines = [f'Rule plan for {self.source} (sha256 {self.content_hash})']
+        for column in self.columns:
+            settings = {field.name: getattr(column, field.name) for field in dataclasses.fields(column)
+                        if field.name != 'name' and getattr(column, field.name) != field.default}
+            lines.append(f'  {column.name}: ' + ', '.join(f'{key}={value!r}' for key, value in settings.items()))
+        lines.extend(f'  Problem: {problem}' for problem in self.problems)
+        return '\n'.join(lines)
+
+
+def _parse_bool(column: dict, key: str, file_path: str, problems: list[str]) -> bool:
+    value = column.get(key, False)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().upper() in ('TRUE', 'FALSE'):
+        return value.strip().upper() == 'TRUE'
+    problems.append(f'Error with chosen json file: {file_path} . Column {column["Column"]} has {key} set to {value} but only values True and False are valid.')
+    return False
+
+
+# Keys every column rule understands. The rest of a rule's keys are options for its RuleTypes type, if it has one
+STANDARD_KEYS = ('Column', 'Type', 'Essential', 'Hashable', 'Trimmed', 'Values', 'Unique Group', 'One To One', 'Case Sensitive', 'Decimal Places')
+
+
+def _rule_type(column: dict, file_path: str, problems: list[str], unresolved: list[str]) -> tuple:
+    """
+    (type name, options) if the column's type is in the RuleTypes registry, otherwise None.
+    The type is built once here so that bad options are reported with the rest of the rule file's problems,
+    and the column is added to unresolved
+    """
+    options = {key: value for key, value in column.items() if key not in STANDARD_KEYS}
+    try:
+        rule_type = RuleTypes.create(column['Type'], options)
+    except (ValueError, ImportError, AttributeError) as error:
+        if RuleTypes.REGISTRY.get(column['Type'].lower()) is not None or 'Import' in column:
+            problems.append(f'Error with chosen json file: {file_path} . Column {column["Column"]} has type {column["Type"]}, which could not be set up: {error}. It will be checked as a string.')
+            unresolved.append(column['Column'])
+        return None
+    return rule_type.name, tuple(sorted(options.items()))
+
+
+def compile_constraints(loaded_json: list, file_path: str, content_hash: str = '') -> RulePlan:
+    """
+    Compiles the list-of-columns format read by ConstraintModule.ConstraintSet
+    """
+    columns = []
+    problems = []
+    unresolved = []
+    one_to_one_sizes = {}
+    for column in loaded_json:
+        if 'Column' not in column:
+            # If the column constraint doesn't even have a name, skip it and tell the user
+            problems.append(file_path + ' contains a column that has not been named. Please fix this.')
+            continue
+
+        rule = {
+            'name': column['Column'],
+            'essential': _parse_bool(column, 'Essential', file_path, problems),
+            'hashable': _parse_bool(column, 'Hashable', file_path, problems),
+            'trimmed': _parse_bool(column, 'Trimmed', file_path, problems),
+        }
+        if 'Values' in column:
+            rule['values'] = tuple(column['Values'])
+        if 'Unique Group' in column and column['Unique Group'].upper() != 'NONE':
+            rule['unique_group'] = column['Unique Group']
+
+        # If a type isn't specified let the loading fail completely, that should never be allowed
+        col_type = column['Type'].upper()
+        if col_type in ('INT', 'INTEGER'):
+            rule['col_type'] = 'int'
+        elif col_type in ('FLOAT', 'DECIMAL'):
+            rule['col_type'] = 'float'
+            rule['decimal_places'] = int(column['Decimal Places'])
+        elif col_type not in ('STR', 'STRING', 'TEXT') and (registered := _rule_type(column, file_path, problems, unresolved)) is not None:
+            # A registered type reads its own Minimum and Maximum, e.g. as dates
+            rule['col_type'], rule['type_options'] = registered
+        if rule.get('col_type', 'str') in ('int', 'float', 'str'):
+            rule['minimum'] = float(column.get('Minimum', -float('inf')))
+            rule['maximum'] = float(column.get('Maximum', float('inf')))
+
+        if 'One To One' in column:
+            pair = column['One To One']
+            rule['one_to_one'] = pair
+            if one_to_one_sizes.get(pair, 0) == 2:
+                problems.append('Error with the One to One Pairing ' + pair + '. More than 2 columns are in this pairing. This is an issue with the JSON file selected.')
+                rule['one_to_one'] = None
+            else:
+                one_to_one_sizes[pair] = one_to_one_sizes.get(pair, 0) + 1
+
+        if 'Case Sensitive' in column:
+            if column['Case Sensitive'].upper() in ('TRUE', 'FALSE'):
+                rule['case_sensitive'] = column['Case Sensitive'].upper() == 'TRUE'
+            else:
+                # If a non-boolean value was entered, tell the user there's a problem.
+                problems.append('Error with chosen json file: ' + file_path + ' . Column ' + column['Column'] + ' specifies that case sensitivity is ' + column['Case Sensitive'] + ' but only values True and False are valid. Please correct this before usinmg this json file again.')
+            if rule.get('col_type', 'str') != 'str':
+                problems.append('Only columns of type string can use the Case Sensistive parameter. Please correct this before using this json file again.')
+
+        columns.append(ColumnRule(**rule))
+    return RulePlan(file_path, content_hash, tuple(columns), tuple(problems), tuple(unresolved))
+
+
+def _cache_path(file_path: str, kind: str) -> str:
+    key = hashlib.sha256((kind + '\0' + os.path.abspath(file_path)).encode('UTF-8')).hexdigest()[:32]
+    return os.path.join(CACHE_DIR, key + '.pickle')
+
+
+def load(file_path: str, kind: str = 'constraints', compiler=compile_constraints, use_cache: bool = True):
+    """
+    Returns the compiled plan for a rule file, from the cache when it is still valid.
+    compiler is called with the parsed JSON, the file path and the content hash
+    """
+    stat = os.stat(file_path)
+    cache_path = _cache_path(file_path, kind)
+    cached = None
+    if use_cache:
+        try:
+            with open(cache_path, 'rb') as file:
+                cached = pickle.load(file)
+            if cached['version'] != PLAN_VERSION:
+                cached = None
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, AttributeError, TypeError):
+            cached = None
+        # Unchanged mtime and size means the file can't have been edited, so it isn't even read
+        if cached is not None and (cached['mtime'], cached['size']) == (stat.st_mtime_ns, stat.st_size):
+            return cached['plan']
+
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+    if cached is not None and cached['hash'] == content_hash:
+        # Touched but not edited
+        plan = cached['plan']
+    else:
+        plan = compiler(json.loads(content.decode('UTF-8')), file_path, content_hash)
+
+    # A type that couldn't be set up may work next time, e.g. once its plugin is fixed, so the plan is compiled again
+    if use_cache and not getattr(plan, 'unresolved_types', ()):
+        _store(cache_path, {'version': PLAN_VERSION, 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash, 'plan': plan})
+    return plan
+
+
+def _store(cache_path: str, record: dict) -> None:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Written under a temporary name and then renamed so a concurrent reader never sees half a file
+        temp_path = cache_path + '.' + str(os.getpid())
+        with open(temp_path, 'wb') as file:
+            pickle.dump(record, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # A read-only or missing cache directory only costs speed
+        pass
+
+
+def invalidate(file_path: str = None, kind: str = 'constraints') -> None:
+    """
+    Drops the cached plan for one rule file, or every cached plan when no file is given
+    """
+    if file_path is not None:
+        paths = [_cache_path(file_path, kind)]
+    elif os.path.isdir(CACHE_DIR):
+        paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.endswith('.pickle')]
+    else:
+        paths = []
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'inspect':
+        print(load(sys.argv[2]).describe())
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'clear':
+        invalidate(sys.argv[2] if len(sys.argv) >= 3 else None)
+    else:
+        print('Usage: python RulePlan.py inspect <rules file> | clear [rules file]')
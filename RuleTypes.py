@@ -0,0 +1,184 @@
+"""
+Registry of the column types that go beyond int, float and str.
+Each type is a RuleType subclass, made from the options given in the column's rule, with a per-value check used by
+the row by row, streaming and fused paths and a batched failing_rows used when a whole column is checked at once.
+Built in are "Regex" (a pattern every value must match in full), "Date" and "DateTime" (a strptime format, with
+optional Minimum and Maximum in the same format) and "Custom", which loads a check function named in the rules file:
+
+    {"Column": "IBAN", "Type": "Custom", "Check": "bank_checks:valid_iban", "Batch Check": "bank_checks:invalid_rows"}
+
+A module can also add types of its own with register; naming it under "Import" in a rule makes sure it is imported
+before the rule's type is looked up. Option names are case-insensitive, so ConstraintSet rule files can write
+"Pattern" where RuleHandler rule files write "pattern"
+"""
+import datetime
+import importlib
+import re
+
+# Type name, lower case, to the RuleType subclass that implements it
+REGISTRY: dict[str, type] = {}
+
+
+def register(name: str):
+    """
+    Class decorator adding a RuleType subclass to the registry under name
+    """
+    def add(cls):
+        cls.name = name.lower()
+        REGISTRY[cls.name] = cls
+        return cls
+    return add
+
+
+def load_object(path: str):
+    # "package.module:attribute", as used by the Check, Batch Check and Import options
+    module_name, _, attribute = path.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute) if attribute else module
+
+
+def lookup(type_name: str, options: dict = None) -> type:
+    """
+    The RuleType subclass for type_name, or None if it isn't a registered type
+    """
+    options = normalise_options(options or {})
+    if 'import' in options:
+        load_object(options['import'])
+    return REGISTRY.get(type_name.lower())
+
+
+def create(type_name: str, options: dict) -> 'RuleType':
+    """
+    Builds the type named in a rule. Raises ValueError if the name or the options aren't valid
+    """
+    cls = lookup(type_name, options)
+    if cls is None:
+        raise ValueError('Unrecognised rule type: ' + type_name)
+    return cls(normalise_options(options))
+
+
+def normalise_options(options: dict) -> dict:
+    return {key.lower(): value for key, value in options.items()}
+
+
+class RuleType:
+    name = None
+
+    def __init__(self, options: dict):
+        self.options = options
+
+    def check(self, value: str) -> bool:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        # What a valid value is, to complete "This column must be ..."
+        return 'a valid ' + self.name
+
+    def failing_rows(self, column, essential: bool = True) -> list[int]:
+        """
+        Indices of the values in column that fail the check. Unless essential, blank values pass.
+        Subclasses override this when they can do better than checking every value in turn
+        """
+        check = self.check
+        return [i for i, value in enumerate(column) if not check(value) and (essential or value != '')]
+
+
+@register('regex')
+class RegexType(RuleType):
+    def __init__(self, options: dict):
+        super().__init__(options)
+        if 'pattern' not in options:
+            raise ValueError('A Regex rule needs a Pattern')
+        try:
+            self.pattern = re.compile(options['pattern'])
+        except re.error as error:
+            raise ValueError('Invalid Pattern ' + repr(options['pattern']) + ': ' + str(error)) from error
+
+    def check(self, value: str) -> bool:
+        return self.pattern.fullmatch(value) is not None
+
+    def describe(self) -> str:
+        return 'a value matching the pattern ' + self.pattern.pattern
+
+    def failing_rows(self, column, essential: bool = True) -> list[int]:
+        fullmatch = self.pattern.fullmatch
+        if essential:
+            return [i for i, value in enumerate(column) if fullmatch(value) is None]
+        return [i for i, value in enumerate(column) if fullmatch(value) is None and value != '']
+
+
+@register('date')
+class DateType(RuleType):
+    default_format = '%Y-%m-%d'
+    noun = 'a date'
+
+    def __init__(self, options: dict):
+        super().__init__(options)
+        self.format = options.get('format', self.default_format)
+        try:
+            self.minimum = self.parse(options['minimum']) if 'minimum' in options else None
+            self.maximum = self.parse(options['maximum']) if 'maximum' in options else None
+        except ValueError as error:
+            raise ValueError('Minimum and Maximum must be written in the format ' + self.format) from error
+
+    def parse(self, value: str):
+        return datetime.datetime.strptime(value, self.format)
+
+    def check(self, value: str) -> bool:
+        try:
+            parsed = self.parse(value)
+        except ValueError:
+            return False
+        return (self.minimum is None or parsed >= self.minimum) and (self.maximum is None or parsed <= self.maximum)
+
+    def describe(self) -> str:
+        text = self.noun + ' in the format ' + self.format
+        if self.minimum is not None:
+            text += ' no earlier than ' + self.options['minimum']
+        if self.maximum is not None:
+            text += ' no later than ' + self.options['maximum']
+        return text
+
+    def failing_rows(self, column, essential: bool = True) -> list[int]:
+        # Dates repeat a lot and strptime is slow, so each distinct value is only parsed once
+        verdicts = {} if essential else {'': True}
+        check = self.check
+        rows = []
+        for i, value in enumerate(column):
+            verdict = verdicts.get(value)
+            if verdict is None:
+                verdict = verdicts[value] = check(value)
+            if not verdict:
+                rows.append(i)
+        return rows
+
+
+@register('datetime')
+class DateTimeType(DateType):
+    default_format = '%Y-%m-%d %H:%M:%S'
+    noun = 'a date and time'
+
+
+@register('custom')
+class CustomType(RuleType):
+    def __init__(self, options: dict):
+        super().__init__(options)
+        if 'check' not in options:
+            raise ValueError('A Custom rule needs a Check, e.g. "package.module:function"')
+        try:
+            self.function = load_object(options['check'])
+            self.batch_function = load_object(options['batch check']) if 'batch check' in options else None
+        except (ImportError, AttributeError) as error:
+            raise ValueError('Could not load the check: ' + str(error)) from error
+
+    def check(self, value: str) -> bool:
+        return bool(self.function(value))
+
+    def describe(self) -> str:
+        return 'a value accepted by ' + self.options['check']
+
+    def failing_rows(self, column, essential: bool = True) -> list[int]:
+        if self.batch_function is None:
+            return super().failing_rows(column, essential)
+        # The batch check is given the whole column and returns the indices of the values that fail
+        return [i for i in self.batch_function(column) if essential or column[i] != '']
@@ -0,0 +1,154 @@
+"""
+Timing and memory figures for the stages of a validation run.
+ConstraintSet.enableStats attaches a RunStats, which the ConstraintSet then fills in as it goes: every stage, such as
+matchToColumns or the unique group check, and every column's share of the stages that work column by column, gets its
+wall time, CPU time, rows and peak memory. Nothing is measured per row, so the cost with stats switched off is one
+attribute check per stage
+"""
+import contextlib
+import dataclasses
+import json
+import sys
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the resident set size isn't reported
+    resource = None
+
+
+@dataclasses.dataclass
+class StageStats:
+    wall_seconds: float = 0.0
+    # CPU time of this process only, so work done in worker processes isn't included
+    cpu_seconds: float = 0.0
+    rows: int = 0
+    # Peak memory allocated during the stage, on top of what was allocated when it began. Only with memory tracing on
+    peak_traced_bytes: int = None
+    # The process' peak resident set size when the stage ended. It never goes down, so it is the high-water mark so far
+    max_rss_bytes: int = None
+    # How many times the stage ran. The other figures are totals, or the highest seen for the memory figures
+    calls: int = 0
+
+    def add(self, other: 'StageStats') -> None:
+        self.wall_seconds += other.wall_seconds
+        self.cpu_seconds += other.cpu_seconds
+        self.rows += other.rows
+        self.calls += other.calls
+        if other.peak_traced_bytes is not None:
+            self.peak_traced_bytes = max(self.peak_traced_bytes or 0, other.peak_traced_bytes)
+        if other.max_rss_bytes is not None:
+            self.max_rss_bytes = max(self.max_rss_bytes or 0, other.max_rss_bytes)
+
+
+def max_rss_bytes() -> int:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RunStats:
+    def __init__(self, trace_memory: bool = False):
+        # tracemalloc slows allocation down a lot, so per stage peak memory is only measured when asked for
+        self.trace_memory = trace_memory
+        self.stages: dict[str, StageStats] = {}
+        # Column name to stage name to that column's share of the stage
+        self.columns: dict[str, dict[str, StageStats]] = {}
+        # Column name to the hit and miss counts of its verdict cache, see ConstraintSet.verdictCacheStats
+        self.verdict_caches: dict[str, dict] = {}
+        # [memory allocated at the start, highest allocation seen] for each stage being measured, outermost first
+        self.open_stages: list[list[int]] = []
+        self.started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: int = 0, column: str = None):
+        """
+        Measures the body of the with statement as one run of the stage, or of column's share of it.
+        Yields the StageStats being filled in so that rows can be set from inside when they aren't known up front
+        """
+        record = StageStats(rows=rows, calls=1)
+        if self.trace_memory:
+            self.open_memory()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - start
+            record.cpu_seconds = time.process_time() - cpu_start
+            if self.trace_memory:
+                record.peak_traced_bytes = self.close_memory()
+            record.max_rss_bytes = max_rss_bytes()
+            if column is None:
+                self.stages.setdefault(name, StageStats()).add(record)
+            else:
+                self.columns.setdefault(column, {}).setdefault(name, StageStats()).add(record)
+
+    def open_memory(self) -> None:
+        if not self.open_stages and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        # The enclosing stages keep the peak seen so far, since it is about to be reset for this one
+        for open_stage in self.open_stages:
+            open_stage[1] = max(open_stage[1], peak)
+        tracemalloc.reset_peak()
+        self.open_stages.append([current, current])
+
+    def close_memory(self) -> int:
+        start, highest = self.open_stages.pop()
+        highest = max(highest, tracemalloc.get_traced_memory()[1])
+        if self.open_stages:
+            self.open_stages[-1][1] = max(self.open_stages[-1][1], highest)
+        elif self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return highest - start
+
+    def to_dict(self) -> dict:
+        return {'stages': {name: dataclasses.asdict(stats) for name, stats in self.stages.items()},
+                'columns': {column: {name: dataclasses.asdict(stats) for name, stats in stages.items()} for column, stages in self.columns.items()},
+                'verdict_caches': self.verdict_caches}
+
+    def write_json(self, path: str) -> None:
+        with open(path, 'w', encoding='UTF-8') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+    def prometheus(self, labels: dict[str, str] = None) -> str:
+        """
+        The stats in the Prometheus text exposition format, e.g. for the node exporter's textfile collector.
+        labels are added to every sample, e.g. {'file': 'sales.csv'}
+        """
+        metrics = {}
+
+        def add(metric, help_text, value, sample_labels):
+            if value is None:
+                return
+            lines = metrics.setdefault(metric, [f'# HELP csvalidator_{metric} {help_text}', f'# TYPE csvalidator_{metric} gauge'])
+            lines.append(f'csvalidator_{metric}{{{format_labels({**(labels or {}), **sample_labels})}}} {value}')
+
+        for prefix, owner, stats in ([('stage', {'stage': name}, stats) for name, stats in self.stages.items()] +
+                                     [('column', {'column': column, 'stage': name}, stats)
+                                      for column, stages in self.columns.items() for name, stats in stages.items()]):
+            add(prefix + '_wall_seconds', f'Wall time spent in each {prefix}', stats.wall_seconds, owner)
+            add(prefix + '_cpu_seconds', f'CPU time spent in each {prefix}', stats.cpu_seconds, owner)
+            add(prefix + '_rows', f'Rows processed by each {prefix}', stats.rows, owner)
+            add(prefix + '_peak_traced_bytes', f'Peak memory allocated during each {prefix}', stats.peak_traced_bytes, owner)
+            add(prefix + '_max_rss_bytes', f'Peak resident set size of the process at the end of each {prefix}', stats.max_rss_bytes, owner)
+        for column, cache in self.verdict_caches.items():
+            add('verdict_cache_hits', 'Verdict cache hits per column', cache['hits'], {'column': column})
+            add('verdict_cache_misses', 'Verdict cache misses per column', cache['misses'], {'column': column})
+            add('verdict_cache_hit_ratio', 'Share of verdict cache lookups that were hits', cache['hit_rate'], {'column': column})
+        return ''.join(line + '\n' for lines in metrics.values() for line in lines)
+
+    def write_prometheus(self, path: str, labels: dict[str, str] = None) -> None:
+        with open(path, 'w', encoding='UTF-8') as file:
+            file.write(self.prometheus(labels))
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    escaped = {name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in labels.items()}
+    return ','.join(f'{name}="{value}"' for name, value in escaped.items())
@@ -0,0 +1,59 @@
+"""
+Row sampling and error rate estimates for ConstraintSet.validateSample
+"""
+import dataclasses
+import math
+import random
+import statistics
+
+
+@dataclasses.dataclass(frozen=True)
+class SampleEstimate:
+    row_count: int
+    sampled: int
+    bad_rows: int
+    confidence: float
+    lower: float
+    upper: float
+
+    @property
+    def rate(self) -> float:
+        return self.bad_rows / self.sampled if self.sampled else 0.0
+
+    def describe(self) -> str:
+        return (f'Sampled {self.sampled} of {self.row_count} rows, {self.bad_rows} had errors. '
+                f'Estimated error rate {self.rate:.2%} ({self.confidence:.0%} confidence: {self.lower:.2%} to {self.upper:.2%}).')
+
+
+def sample_rows(row_count: int, sample_size: int, stratified: bool = False, rng: random.Random = None) -> list[int]:
+    """
+    Picks sample_size distinct row indices in ascending order.
+    Stratified sampling cuts the file into sample_size equal blocks and takes one row from each,
+    so damage confined to one part of the file can't be missed by chance
+    """
+    rng = rng or random.Random()
+    sample_size = min(sample_size, row_count)
+    if sample_size <= 0:
+        # An empty file, or a sample of nothing, has no blocks to cut
+        return []
+    if not stratified:
+        return sorted(rng.sample(range(row_count), sample_size))
+    bounds = [row_count * i // sample_size for i in range(sample_size + 1)]
+    return [rng.randrange(start, stop) for start, stop in zip(bounds, bounds[1:])]
+
+
+def estimate(row_count: int, sampled: int, bad_rows: int, confidence: float = 0.95) -> SampleEstimate:
+    """
+    Wilson score interval for the share of bad rows, narrowed by the finite population correction
+    since the sample is drawn without replacement
+    """
+    if sampled == 0:
+        return SampleEstimate(row_count, 0, 0, confidence, 0.0, 1.0)
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    if row_count > 1:
+        z *= math.sqrt((row_count - sampled) / (row_count - 1))
+    p = bad_rows / sampled
+    denominator = 1 + z * z / sampled
+    centre = (p + z * z / (2 * sampled)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / sampled + z * z / (4 * sampled * sampled)) / denominator
+    return SampleEstimate(row_count, sampled, bad_rows, confidence, max(0.0, centre - margin), min(1.0, centre + margin))
@@ -0,0 +1,281 @@
+import heapq
+import math
+import os
+import pickle
+import shutil
+import tempfile
+
+# Rough number of bytes an in-memory index spends on each key: the tuple, its dict entry and the row number
+ENTRY_BYTES = 200
+# Most spill files a partition is split into at once, which keeps the number of files written to at a time bounded
+MAX_PARTITIONS = 256
+# How many times a partition that is still too big is split again. A single key repeated on most rows can't be split
+MAX_SPLITS = 3
+# Duplicates are written to disk in batches of this many
+BATCH_SIZE = 10000
+
+
+def index_bytes(rows: int, group_count: int) -> int:
+    """
+    Roughly how much memory a UniqueGroupIndex over rows rows and group_count groups would take if no key repeated
+    """
+    return rows * group_count * ENTRY_BYTES
+
+
+class UniqueGroupIndex:
+    """
+    Hash index used to find duplicate rows in one or more unique groups in a single pass.
+    Keys are tuples of the group's values, so ('ab', 'c') and ('a', 'bc') never collide
+    """
+    def __init__(self, groups: dict[str, list[int]]):
+        # groups maps each group name to the positions of its columns within a row
+        self.groups = groups
+        self.first_seen: dict[str, dict[tuple, int]] = {group: {} for group in groups}
+
+    def add(self, row_num: int, values: list) -> list[tuple[str, tuple, int]]:
+        """
+        Records a row and returns (group, key, first row) for every group the row duplicates
+        """
+        duplicates = []
+        for group, positions in self.groups.items():
+            key = tuple([values[i] for i in positions])
+            seen = self.first_seen[group]
+            first_row = seen.setdefault(key, row_num)
+            if first_row != row_num:
+                duplicates.append((group, key, first_row))
+        return duplicates
+
+    def add_columns(self, columns: list[list], first_row_num: int = 0):
+        """
+        Feeds whole columns through the index, yielding (row, group, key, first row) for each duplicate
+        """
+        for row_num, values in enumerate(zip(*columns), first_row_num):
+            for group, key, first_row in self.add(row_num, values):
+                yield row_num, group, key, first_row
+
+    def close(self) -> None:
+        # Nothing is held outside memory; this is here so either index can be closed the same way
+        pass
+
+    def duplicate_count(self, group: str, row_count: int) -> int:
+        return row_count - len(self.first_seen[group])
+
+    def merge(self, other: 'UniqueGroupIndex') -> list[tuple[int, str, tuple, int]]:
+        """
+        Folds in an index built over later rows, e.g. another shard of the same file.
+        Returns (row, group, key, first row) for each key of other that was already seen here
+        """
+        duplicates = []
+        for group, seen in other.first_seen.items():
+            first_seen = self.first_seen[group]
+            for key, row_num in seen.items():
+                first_row = first_seen.setdefault(key, row_num)
+                if first_row != row_num:
+                    duplicates.append((row_num, group, key, first_row))
+        return duplicates
+
+
+class BloomFilter:
+    """
+    Fixed-size set of key hashes. A key it says is missing was never added; a key it says is present probably was
+    """
+    def __init__(self, size_bytes: int, expected_keys: int):
+        self.bits = bytearray(max(size_bytes, 1))
+        self.size = len(self.bits) * 8
+        # The number of hashes that gives the fewest false positives for this many bits per key
+        self.hash_count = min(8, max(1, round(self.size / max(expected_keys, 1) * math.log(2))))
+
+    def positions(self, key) -> list[int]:
+        # Double hashing: every position is derived from the two halves of the key's hash
+        value = hash(key)
+        low = value & 0xFFFFFFFF
+        high = (value >> 32) | 1
+        return [(low + i * high) % self.size for i in range(self.hash_count)]
+
+    def add(self, key) -> bool:
+        """
+        Adds key and returns whether it was probably there already
+        """
+        bits = self.bits
+        present = True
+        for position in self.positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not bits[byte] & bit:
+                present = False
+                bits[byte] |= bit
+        return present
+
+    def __contains__(self, key) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+def _read_batches(path: str):
+    # Every record of a spill file, in the order they were written
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                batch = pickle.load(file)
+            except EOFError:
+                return
+            yield from batch
+
+
+class _SpillFiles:
+    # Records hash-partitioned across several files, each file keeping the order its records were added in
+    # Records are buffered and appended in batches, so only one file is open at a time
+    def __init__(self, prefix: str, count: int, buffer_size: int):
+        self.paths = [f'{prefix}-{i}' for i in range(count)]
+        self.buffers = [[] for _ in range(count)]
+        self.counts = [0] * count
+        self.buffer_size = buffer_size
+        self.buffered = 0
+
+    def add(self, partition: int, record: tuple) -> None:
+        self.buffers[partition].append(record)
+        self.counts[partition] += 1
+        self.buffered += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for path, buffer in zip(self.paths, self.buffers):
+            if buffer:
+                with open(path, 'ab') as file:
+                    pickle.dump(buffer, file, pickle.HIGHEST_PROTOCOL)
+                buffer.clear()
+        self.buffered = 0
+
+    def partitions(self):
+        # (path, number of records) of every file that got any
+        return [(path, count) for path, count in zip(self.paths, self.counts) if count]
+
+
+class SpillingGroupIndex:
+    """
+    Out-of-core counterpart of UniqueGroupIndex, for files whose keys don't fit in memory.
+    Keys are hash-partitioned into spill files so that every copy of a key lands in the same one, and each file is
+    small enough to be checked on its own within memory_budget bytes. The duplicates found in each file are written
+    back to disk and merged into row order, so they come out exactly as UniqueGroupIndex would give them.
+    Unlike UniqueGroupIndex, duplicates are only known once every row has been added
+    """
+    def __init__(self, groups: dict[str, list[int]], memory_budget: int, expected_rows: int = None, directory: str = None):
+        # groups maps each group name to the positions of its columns within a row, as for UniqueGroupIndex
+        # expected_rows sizes the partitions; when it isn't known, partitions that turn out too big are split again
+        self.groups = groups
+        self.group_positions = list(groups.values())
+        self.group_names = list(groups)
+        self.memory_budget = memory_budget
+        self.directory = tempfile.mkdtemp(prefix='unique-groups-', dir=directory)
+        # Buffered records take at most a quarter of the budget
+        self.buffer_size = max(1, memory_budget // 4 // ENTRY_BYTES)
+        self.files = _SpillFiles(os.path.join(self.directory, 'keys'), self.partition_count(index_bytes(expected_rows or 0, len(groups))),
+                                 self.buffer_size)
+
+    def close(self) -> None:
+        """
+        Removes the spill files. Safe to call more than once, and must be called if duplicates() is never run to the end
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def partition_count(self, size: int) -> int:
+        return min(MAX_PARTITIONS, max(1, math.ceil(size / self.memory_budget)))
+
+    def keys(self, values: list):
+        # (group position, key) for every group of a row, keys being tuples as in UniqueGroupIndex
+        return [(position, tuple([values[i] for i in positions])) for position, positions in enumerate(self.group_positions)]
+
+    def add(self, row_num: int, values: list) -> None:
+        """
+        Spills the keys of a row. Any duplicates are found by duplicates()
+        """
+        files = self.files
+        count = len(files.paths)
+        for position, key in self.keys(values):
+            files.add(hash((position, key)) % count, (row_num, position, key))
+
+    def add_columns(self, columns: list[list], first_row_num: int = 0, prefilter: bool = True):
+        """
+        Feeds whole columns through the index, yielding (row, group, key, first row) for each duplicate in row order.
+        With prefilter the columns are read twice: first through a pair of Bloom filters that pick out the keys that
+        may repeat, then to spill only those, so keys that are clearly unique never reach the disk
+        """
+        if not prefilter:
+            for row_num, values in enumerate(zip(*columns), first_row_num):
+                self.add(row_num, values)
+            yield from self.duplicates()
+            return
+
+        key_count = (len(columns[0]) if columns else 0) * len(self.groups)
+        # A key is in repeated once it has been seen twice, so any key missing from it after the pass is unique
+        seen = BloomFilter(self.memory_budget // 4, key_count)
+        repeated = BloomFilter(self.memory_budget // 4, key_count)
+        for values in zip(*columns):
+            for group_key in self.keys(values):
+                if seen.add(group_key):
+                    repeated.add(group_key)
+        del seen
+
+        files = self.files
+        count = len(files.paths)
+        for row_num, values in enumerate(zip(*columns), first_row_num):
+            for group_key in self.keys(values):
+                if group_key in repeated:
+                    files.add(hash(group_key) % count, (row_num,) + group_key)
+        del repeated
+        yield from self.duplicates()
+
+    def duplicates(self):
+        """
+        Checks each spill file in turn and yields (row, group, key, first row) for every duplicate, in row order.
+        The spill files are removed afterwards
+        """
+        try:
+            self.files.flush()
+            duplicate_paths = []
+            for path, count in self.files.partitions():
+                duplicate_paths.extend(self.check_partition(path, count, 0))
+            # Each file's duplicates are in row order already, (row, group position) is unique so keys are never compared
+            for row_num, position, key, first_row in heapq.merge(*[_read_batches(path) for path in duplicate_paths]):
+                yield row_num, self.group_names[position], key, first_row
+        finally:
+            self.close()
+
+    def check_partition(self, path: str, count: int, splits: int) -> list[str]:
+        """
+        Finds the duplicates in one spill file and returns the files they were written to.
+        A file whose keys wouldn't fit in the budget is split by a differently salted hash and each part checked instead
+        """
+        if index_bytes(count, 1) > self.memory_budget and splits < MAX_SPLITS:
+            files = _SpillFiles(f'{path}.{splits}', self.partition_count(index_bytes(count, 1)), self.buffer_size)
+            parts = len(files.paths)
+            for record in _read_batches(path):
+                files.add(hash((splits,) + record[1:]) % parts, record)
+            files.flush()
+            os.remove(path)
+            duplicate_paths = []
+            for part_path, part_count in files.partitions():
+                duplicate_paths.extend(self.check_partition(part_path, part_count, splits + 1))
+            return duplicate_paths
+
+        first_seen = [{} for _ in self.group_names]
+        duplicate_path = path + '.duplicates'
+        with open(duplicate_path, 'wb') as file:
+            batch = []
+            for row_num, position, key in _read_batches(path):
+                first_row = first_seen[position].setdefault(key, row_num)
+                if first_row != row_num:
+                    batch.append((row_num, position, key, first_row))
+                    if len(batch) >= BATCH_SIZE:
+                        pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+                        batch = []
+            if batch:
+                pickle.dump(batch, file, pickle.HIGHEST_PROTOCOL)
+        os.remove(path)
+        return [duplicate_path]
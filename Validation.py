@@ -0,0 +1,127 @@
+"""
+Library API for checking one CSV file against one rules file.
+Importing it has no side effects and only loads the light modules: NumPy is imported the first time the numpy engine
+or a mapped file needs it, the process pool the first time more than one worker is asked for. Main.py (prompts),
+GUI.py (Tk) and BatchValidation.py (many files) are front ends over the same call.
+
+    result = Validation.validate_file('sales.csv', 'sales.json')
+    print(result.error_count, result.errors[:10])
+
+    python Validation.py sales.json sales.csv [--engine numpy] [--workers 4] [--mode stream] [--encoding auto] [--output DIR]
+    python Validation.py --gui
+"""
+import argparse
+import dataclasses
+import os
+import sys
+
+import ConstraintModule
+import CSVWrapper
+import Encodings
+import ErrorLogging
+
+# 'loaded' reads the whole file into columns, 'mapped' memory-maps it, 'stream' reads it row by row without holding it
+# and 'fused' checks a loaded file in one row-major pass, see ConstraintSet.validateFused
+MODES = ('loaded', 'mapped', 'stream', 'fused')
+
+
+@dataclasses.dataclass
+class ValidationResult:
+    csv_path: str
+    rules_path: str
+    # False if the file couldn't be read, in which case the records say why
+    loaded: bool
+    # Every ErrorRecord, in the order it was logged
+    records: list
+    # The RunStats of the run if stats were asked for
+    stats: object = None
+
+    @property
+    def error_count(self) -> int:
+        return len(self.records)
+
+    @property
+    def errors(self) -> list[str]:
+        return [ErrorLogging.render(record) for record in self.records]
+
+    def write_log(self, directory: str = '.', output_format: str = 'text') -> str:
+        """
+        Writes the error log the way Main.py always has and returns its path
+        """
+        name = os.path.basename(self.csv_path)
+        extension = {'text': '.txt', 'jsonl': '.jsonl', 'csv': '.csv'}[output_format]
+        file_name = ErrorLogging.logFileName(name.lower().split('.csv')[0] + ' ', directory, extension)
+        with ErrorLogging.FileSink(file_name, header='Error log for ' + name + ' using ' + os.path.basename(self.rules_path) + '\n',
+                                   outputFormat=output_format) as sink:
+            for record in self.records:
+                sink.record(record)
+        return file_name
+
+
+def validate_file(csv_path: str, rules_path: str, delimiter: str = '|', encoding: str = 'UTF-8', quotechar: str = '"', mode: str = 'loaded',
+                  engine: str = 'python', workers: int = 1, stats: bool = False, group_memory: int = None, fallbacks: tuple = Encodings.FALLBACKS,
+                  categorical: bool = False, **limits) -> ValidationResult:
+    """
+    Checks csv_path against rules_path and returns everything that was logged.
+    encoding='auto' uses the first of fallbacks that the start of the file decodes in.
+    group_memory is a budget in bytes for the unique group keys, beyond which they are spilled to disk.
+    categorical dictionary-encodes loaded columns with few distinct values, see EncodedColumns.
+    limits are passed on to validateAll or validateStream: failFast, maxErrors, maxErrorsPerColumn
+    """
+    if mode not in MODES:
+        raise ValueError('mode must be one of ' + ', '.join(MODES))
+    # Errors are collected in a sink of their own, so calls from several threads never mix their logs
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        if stats:
+            constraint_set.enableStats()
+        if group_memory is not None:
+            constraint_set.spillGroups(group_memory)
+        with constraint_set.measure('load'):
+            wrapper = CSVWrapper.CSVWrapper(csv_path, delimiter, encoding, streaming=mode == 'stream', quotechar=quotechar, mapped=mode == 'mapped',
+                                      fallbacks=fallbacks, categorical=categorical)
+        if wrapper.loaded:
+            if mode in ('stream', 'fused'):
+                constraint_set.validateStream(wrapper, **limits)
+            else:
+                with constraint_set.measure('split'):
+                    wrapper.loadColumns()
+                constraint_set.matchToColumns(wrapper)
+                constraint_set.validateAll(engine, workers, **limits)
+    return ValidationResult(csv_path, rules_path, wrapper.loaded, sink.records, constraint_set.collectStats())
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Validate a CSV file against a JSON rules file.')
+    parser.add_argument('rules', nargs='?', help='rules file')
+    parser.add_argument('csv', nargs='?', help='CSV file')
+    parser.add_argument('--gui', action='store_true', help='open the window instead, with the rules files in this directory')
+    parser.add_argument('-o', '--output', default='.', help='directory for the error log')
+    parser.add_argument('--delimiter', default='|')
+    parser.add_argument('--encoding', default='UTF-8', help="the file's encoding, or 'auto' to work it out from its first few KB")
+    parser.add_argument('--fallback-encodings', default=','.join(Encodings.FALLBACKS), metavar='LIST',
+                        help='comma-separated encodings --encoding auto tries in turn')
+    parser.add_argument('--mode', choices=MODES, default='loaded', help='how the file is read and checked')
+    parser.add_argument('--engine', choices=('python', 'numpy'), default='python', help='engine used for the column checks')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='processes used for the checks, 0 for every core')
+    parser.add_argument('--format', choices=('text', 'jsonl', 'csv'), default='text', help='format of the error log')
+    parser.add_argument('--group-memory', type=int, metavar='MB', help='spill unique group keys to disk when they would take more than this')
+    parser.add_argument('--categorical', action='store_true', help='dictionary-encode columns with few distinct values so each value is checked once')
+    args = parser.parse_args(argv)
+    if args.gui:
+        # tkinter is only imported when the window is asked for
+        import GUI
+        GUI.main()
+        return 0
+    if args.rules is None or args.csv is None:
+        parser.error('a rules file and a CSV file are needed, or --gui')
+
+    result = validate_file(args.csv, args.rules, args.delimiter, args.encoding, mode=args.mode, engine=args.engine, workers=args.workers or None,
+                           group_memory=args.group_memory and args.group_memory << 20, fallbacks=tuple(args.fallback_encodings.split(',')),
+                           categorical=args.categorical)
+    print(str(result.error_count) + ' errors, log written to ' + result.write_log(args.output, args.format))
+    return 1 if result.error_count else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,352 @@
+"""
+Long-running validation service, so that each upload doesn't pay for starting Python and parsing its rules again.
+
+    python ValidationService.py --rule-sets rule_sets.json --port 8765 --workers 4
+    python ValidationService.py --rule-sets rule_sets.json --socket /run/csvalidator.sock
+
+The rule sets file maps a name to a rules file, or to an object with the rules file and the settings of the CSV
+files checked against it. The settings are read by FileHandler.Handler, either from the object itself or from the
+FileHandler rules file named under "handler", so the delimiter, encoding, encoding fallbacks and quotechar keys mean
+the same as there. The delimiter defaults to | as for every ConstraintSet rules file:
+    {"sales": "sales.json", "stock": {"rules": "stock.json", "delimiter": ",", "encoding": "cp1252"},
+     "orders": {"rules": "orders.json", "handler": "orders_handler.json"}}
+
+Clients send one JSON object per line: {"file": "/data/upload.csv", "rules": "sales"}, optionally with "mode"
+("loaded", "stream" or "fused"), "max_errors" and "stats". The reply is also one JSON object per line:
+"accepted" once the job is queued, one "error" per error as the job finds them, then "done" with the error count,
+or "rejected" / "failed". A connection can send any number of jobs, each is answered in full before the next.
+
+Every worker is a process that runs one job at a time, so the number of workers caps the number of jobs running at
+once. It compiles each rule set the first time a job uses it and keeps it for later jobs; a rules file that can't be
+compiled fails only the jobs that use it. At most --queue-size more jobs wait for a worker; beyond that clients wait
+to be accepted. A worker stops when the errors it has sent haven't been read yet, so a slow client slows its own job
+down instead of filling the service's memory.
+When a client goes away its job is cancelled. The worker only notices at the next batch of errors it sends, so a job
+that finds no more errors still runs to the end before the worker takes the next one
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import FileHandler
+
+MODES = ('loaded', 'stream', 'fused')
+# Errors are sent from a worker in batches of this many
+BATCH_SIZE = 500
+# Events held for a client that hasn't read them yet before the worker is made to wait
+RESULT_BUFFER = 8
+# Workers are started fresh rather than forked from a process that is running an event loop and reader threads
+CONTEXT = multiprocessing.get_context('spawn')
+
+
+def load_rule_sets(path: str) -> dict[str, dict]:
+    """
+    Reads a rule sets file, filling in the CSV settings each rule set doesn't give
+    """
+    with open(path, encoding='UTF-8') as file:
+        entries = json.load(file)
+    # Relative rules paths are relative to the rule sets file, not to wherever the service is run from
+    directory = os.path.dirname(os.path.abspath(path))
+    rule_sets = {}
+    for name, entry in entries.items():
+        if isinstance(entry, str):
+            entry = {'rules': entry}
+        rules_path = os.path.join(directory, entry['rules'])
+        handler = FileHandler.Handler(rules_path)
+        handler.file_rules['delimiter'] = '|'
+        if 'handler' in entry:
+            handler.load_rules(os.path.join(directory, entry['handler']))
+        else:
+            handler.raw_rules, handler.file_rules = handler.compile_rules(entry, path, '')
+        rule_sets[name] = {'rules': rules_path, 'delimiter': handler.file_rules['delimiter'], 'encoding': handler.file_rules['encoding'],
+                           'fallbacks': tuple(handler.file_rules['encoding fallbacks']), 'quotechar': handler.file_rules['quotechar']}
+    return rule_sets
+
+
+class JobCancelled(Exception):
+    # Raised in a worker when the service has given up on the job it is running
+    pass
+
+
+class PipeSink(ErrorLogging.ErrorSink):
+    # Sends errors from a worker back to the service in batches, as JSON-ready dicts with the log's text added
+    def __init__(self, connection, job=None, batchSize=BATCH_SIZE):
+        super().__init__()
+        self.connection = connection
+        # The number of the job being run, which a cancel message has to name
+        self.job = job
+        self.batchSize = batchSize
+        self.batch = []
+
+    def write(self, errorRecord):
+        self.batch.append(dict(ErrorLogging.jsonable(errorRecord), text=ErrorLogging.render(errorRecord)))
+        if len(self.batch) >= self.batchSize:
+            self.flush()
+            self.checkCancelled()
+
+    def checkCancelled(self):
+        # Cancels for jobs that have already finished are dropped
+        while self.connection.poll():
+            if self.connection.recv() == ('cancel', self.job):
+                raise JobCancelled()
+
+    def flush(self):
+        if self.batch:
+            self.connection.send(('errors', self.batch))
+            self.batch = []
+
+    def close(self):
+        self.flush()
+
+
+class CompiledRuleSet:
+    # A ConstraintSet kept in a worker between jobs, along with the problems found in its rules file
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.modified = os.stat(settings['rules']).st_mtime_ns
+        with ErrorLogging.MemorySink() as sink:
+            self.constraint_set = ConstraintModule.ConstraintSet(settings['rules'])
+        self.problems = [ErrorLogging.render(record) for record in sink.records]
+
+    def current(self) -> bool:
+        try:
+            return os.stat(self.settings['rules']).st_mtime_ns == self.modified
+        except OSError:
+            return False
+
+
+def _worker_main(connection, rule_sets: dict[str, dict]) -> None:
+    compiled = {}
+    while True:
+        job = connection.recv()
+        if job is None:
+            return
+        if not isinstance(job, dict):
+            # A cancel that came after its job had finished
+            continue
+        try:
+            rule_set = compiled.get(job['rules'])
+            if rule_set is None or not rule_set.current():
+                # Compiled on first use and again whenever the rules file is edited. One that can't be compiled
+                # fails this job, and is tried again for the next one that uses it
+                rule_set = compiled[job['rules']] = CompiledRuleSet(rule_sets[job['rules']])
+            summary = _run_job(connection, job, rule_set)
+        except JobCancelled:
+            connection.send(('cancelled', {}))
+        except Exception as error:
+            connection.send(('failed', {'reason': f'{type(error).__name__}: {error}'}))
+        else:
+            connection.send(('done', summary))
+
+
+def _run_job(connection, job: dict, rule_set: CompiledRuleSet) -> dict:
+    start = time.perf_counter()
+    settings = rule_set.settings
+    constraint_set = rule_set.constraint_set
+    mode = job.get('mode', 'loaded')
+    limits = {'maxErrors': job.get('max_errors')}
+    if job.get('stats'):
+        constraint_set.enableStats()
+    try:
+        with PipeSink(connection, job.get('job')) as sink:
+            for problem in rule_set.problems:
+                ErrorLogging.log(problem, rule='rules file')
+            wrapper = CSVWrapper.CSVWrapper(job['file'], settings['delimiter'], settings['encoding'], streaming=mode == 'stream',
+                                            quotechar=settings['quotechar'], fallbacks=settings['fallbacks'])
+            if wrapper.loaded:
+                try:
+                    if mode == 'loaded':
+                        wrapper.loadColumns()
+                        constraint_set.matchToColumns(wrapper)
+                        constraint_set.validateAll(**limits)
+                    else:
+                        constraint_set.validateStream(wrapper, **limits)
+                finally:
+                    # The set is kept for the next job, but its columns are not
+                    for constraint in constraint_set.constraints:
+                        constraint.column = []
+        summary = {'errors': sink.count, 'loaded': wrapper.loaded, 'seconds': time.perf_counter() - start}
+        if job.get('stats'):
+            summary['stats'] = constraint_set.collectStats().to_dict()
+        return summary
+    finally:
+        # Nor are its stats, even when the job failed
+        if job.get('stats'):
+            constraint_set.disableStats()
+
+
+class Job:
+    def __init__(self, request: dict, number: int):
+        self.request = request
+        self.number = number
+        self.results = asyncio.Queue(RESULT_BUFFER)
+        # Set when the client goes away, so the rest of the job's results are dropped instead of queued
+        self.abandoned = False
+
+    async def put(self, event: dict) -> None:
+        if not self.abandoned:
+            await self.results.put(dict(event, job=self.number))
+
+    def abandon(self) -> None:
+        self.abandoned = True
+        # Frees a worker that is waiting for room in the queue
+        while not self.results.empty():
+            self.results.get_nowait()
+
+
+class ValidationService:
+    def __init__(self, rule_sets: dict[str, dict], workers: int = None, queue_size: int = 16):
+        self.rule_sets = rule_sets
+        self.workers = workers or os.cpu_count()
+        self.jobs: asyncio.Queue = None
+        self.queue_size = queue_size
+        self.job_count = 0
+        self.processes = []
+        self.dispatchers = []
+        # Each worker's replies are waited for on a thread of its own, so the event loop never blocks on a pipe
+        self.readers = concurrent.futures.ThreadPoolExecutor(self.workers)
+
+    def spawn_worker(self):
+        connection, worker_connection = CONTEXT.Pipe()
+        process = CONTEXT.Process(target=_worker_main, args=(worker_connection, self.rule_sets), daemon=True)
+        process.start()
+        worker_connection.close()
+        self.processes.append(process)
+        return process, connection
+
+    async def start(self) -> None:
+        self.jobs = asyncio.Queue(self.queue_size)
+        self.dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+
+    async def dispatch(self) -> None:
+        """
+        Feeds jobs to one worker process, one at a time, passing its results on as they arrive
+        """
+        loop = asyncio.get_running_loop()
+        process, connection = self.spawn_worker()
+        while True:
+            job = await self.jobs.get()
+            if job.abandoned:
+                continue
+            try:
+                connection.send(dict(job.request, job=job.number))
+                cancelled = False
+                while True:
+                    kind, payload = await loop.run_in_executor(self.readers, connection.recv)
+                    if kind != 'errors':
+                        await job.put(dict(payload, event=kind))
+                        break
+                    if job.abandoned and not cancelled:
+                        # Nobody is waiting for the rest, so the worker is told to stop at its next batch of errors
+                        connection.send(('cancel', job.number))
+                        cancelled = True
+                    for error in payload:
+                        await job.put(dict(error, event='error'))
+            except (EOFError, OSError):
+                await job.put({'event': 'failed', 'reason': 'the worker stopped unexpectedly'})
+                connection.close()
+                process, connection = self.spawn_worker()
+
+    def check_request(self, request) -> str:
+        # The reason a request can't be run, or None if it can
+        if not isinstance(request, dict) or 'file' not in request or 'rules' not in request:
+            return 'a job needs "file" and "rules"'
+        if request['rules'] not in self.rule_sets:
+            return 'unknown rule set: ' + str(request['rules'])
+        if not os.path.isfile(request['file']):
+            return 'file not found: ' + str(request['file'])
+        if request.get('mode', 'loaded') not in MODES:
+            return 'mode must be one of ' + ', '.join(MODES)
+        return None
+
+    async def submit(self, request: dict):
+        """
+        Queues a job and yields its events as they are produced, ending with "done", "rejected" or "failed"
+        """
+        reason = self.check_request(request)
+        if reason is not None:
+            yield {'event': 'rejected', 'reason': reason}
+            return
+        self.job_count += 1
+        job = Job(request, self.job_count)
+        # Waits while the queue is full, which is the backpressure on clients
+        await self.jobs.put(job)
+        try:
+            yield {'event': 'accepted', 'job': job.number, 'queued': self.jobs.qsize()}
+            while True:
+                event = await job.results.get()
+                yield event
+                if event['event'] in ('done', 'failed'):
+                    return
+        finally:
+            job.abandon()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                events = self.submit(request)
+                try:
+                    async for event in events:
+                        writer.write(json.dumps(event).encode('UTF-8') + b'\n')
+                        await writer.drain()
+                finally:
+                    # Abandons the job straight away if the client went while its results were being sent
+                    await events.aclose()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, path: str = None) -> None:
+        await self.start()
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        for process in self.processes:
+            process.terminate()
+        self.readers.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Serve validation jobs over a local socket.')
+    parser.add_argument('--rule-sets', required=True, help='JSON file mapping rule set names to rules files')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of a port')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='jobs run at once, each in its own process, 0 for every core')
+    parser.add_argument('--queue-size', type=int, default=16, help='jobs that can wait for a worker before clients are held back')
+    args = parser.parse_args(argv)
+
+    service = ValidationService(load_rule_sets(args.rule_sets), args.workers or None, args.queue_size)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
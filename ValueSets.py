@@ -0,0 +1,21 @@
+import functools
+
+# How many distinct value lists are kept. A long-running service loading many rule files would otherwise keep every
+# set it ever built
+CACHE_SIZE = 256
+
+
+def compile_values(values: list, case_sensitive: bool = True) -> frozenset:
+    """
+    Turns a list of allowed values into a frozenset for constant time membership checks.
+    Identical lists (e.g. the same rule file loaded again) share one set instead of rebuilding it
+    """
+    return _compile(tuple(values), case_sensitive)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _compile(values: tuple, case_sensitive: bool) -> frozenset:
+    if case_sensitive:
+        return frozenset(values)
+    # Case insensitive columns are upper-cased before they are checked, so the allowed values must be too
+    return frozenset(value.upper() for value in values)
@@ -0,0 +1,134 @@
+"""
+Batched NumPy implementation of the Constraint column checks.
+Each function takes a whole column and returns the indices of the rows that fail, so error
+messages only need to be built for those rows. The verdicts match the per-value methods on Constraint
+"""
+import numpy as np
+
+def as_array(column: list[str]) -> np.ndarray:
+    if isinstance(column, np.ndarray):
+        return column
+    # Sizing the dtype up front lets fromiter copy the strings in a single pass
+    width = max(map(len, column), default=0) or 1
+    return np.fromiter(column, dtype=f'U{width}', count=len(column))
+
+
+# Rows are parsed in blocks so the per-character work arrays stay a few MB whatever the column size
+BLOCK_SIZE = 1 << 16
+# Plain decimals with at most this many digits are exact in a float64, and so is every power of ten they
+# are divided by, so the division below gives exactly the same float as float() does
+MAX_EXACT_DIGITS = 15
+POWERS_OF_TEN = 10.0 ** np.arange(MAX_EXACT_DIGITS + 1)
+
+
+def parse_numbers(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a string array to floats, with NaN wherever float() would raise a ValueError.
+    Also returns the number of characters after the first '.' in each value, or -1 if there is no '.'.
+    NaN fails every range comparison, so unparseable values drop out of the range check on their own
+    """
+    parsed = np.empty(len(values), dtype=np.float64)
+    decimals = np.empty(len(values), dtype=np.int64)
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = values[start:start + BLOCK_SIZE]
+        plain = _parse_plain_block(block, parsed[start:start + BLOCK_SIZE], decimals[start:start + BLOCK_SIZE])
+        # Anything that isn't a plain signed decimal (blanks, spaces, exponents, junk) goes through float()
+        for i in np.flatnonzero(~plain).tolist():
+            value = str(block[i])
+            parsed[start + i] = _parse_float(value)
+            decimals[start + i] = len(value.split('.')[1]) if '.' in value else -1
+    return parsed, decimals
+
+
+def _parse_plain_block(block: np.ndarray, parsed: np.ndarray, decimals: np.ndarray) -> np.ndarray:
+    """
+    Parses the values made only of digits with an optional leading sign and at most one '.',
+    writing into parsed and decimals. Returns the mask of values that were handled
+    """
+    if len(block) == 0 or block.dtype.itemsize == 0:
+        return np.zeros(len(block), dtype=bool)
+    width = block.dtype.itemsize // 4
+    # One row per character position, so every step below works on a contiguous vector
+    positions = np.ascontiguousarray(block).view(np.uint32).reshape(len(block), width).T.copy()
+
+    mantissa = np.zeros(len(block), dtype=np.int64)
+    digit_count = np.zeros(len(block), dtype=np.int64)
+    after_dot = np.zeros(len(block), dtype=np.int64)
+    dots = np.zeros(len(block), dtype=np.int64)
+    ended = np.zeros(len(block), dtype=bool)
+    plain = np.ones(len(block), dtype=bool)
+    for j in range(width):
+        codes = positions[j]
+        digits = codes - 48
+        is_digit = digits <= 9
+        is_dot = codes == 46
+        is_end = codes == 0
+        allowed = is_digit | is_dot | is_end
+        if j == 0:
+            allowed |= (codes == 45) | (codes == 43)
+        # Anything after the end of the string would mean an embedded NUL, which float() rejects
+        plain &= allowed & ~(ended & ~is_end)
+        ended |= is_end
+        mantissa = np.where(is_digit, mantissa * 10 + digits, mantissa)
+        digit_count += is_digit
+        dots += is_dot
+        after_dot += is_digit & (dots > 0)
+    plain &= (dots <= 1) & (digit_count > 0) & (digit_count <= MAX_EXACT_DIGITS)
+
+    value = mantissa[plain] / POWERS_OF_TEN[after_dot[plain]]
+    value[positions[0][plain] == 45] *= -1
+    parsed[plain] = value
+    decimals[plain] = np.where(dots > 0, after_dot, -1)[plain]
+    return plain
+
+
+def _parse_float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def number_failures(constraint, column) -> np.ndarray:
+    values = as_array(column)
+    parsed, decimals = parse_numbers(values)
+    # NaN compares False, which also catches the values that could not be parsed
+    passed = (parsed >= constraint.minimum) & (parsed <= constraint.maximum)
+    if constraint.decimalPlaces != 0:
+        passed &= decimals >= constraint.decimalPlaces
+
+    if not constraint.essential:
+        passed |= values == ''
+    return np.flatnonzero(~passed)
+
+
+def string_failures(constraint, column) -> np.ndarray:
+    values = as_array(column)
+    lengths = np.char.str_len(values)
+    passed = (lengths >= constraint.minimum) & (lengths <= constraint.maximum)
+    if not constraint.essential:
+        passed |= values == ''
+    if constraint.hashable:
+        passed |= values == '#'
+    return np.flatnonzero(~passed)
+
+
+def possibilities_failures(constraint, column) -> np.ndarray:
+    values = as_array(column)
+    allowed = as_array(list(constraint.allowedValues))
+    return np.flatnonzero(~np.isin(values, allowed))
+
+
+def failing_rows(constraint, column) -> np.ndarray:
+    """
+    Picks the batched check matching the constraint's validateList method
+    """
+    kind = constraint.ruleKind()
+    if kind == 'values':
+        return possibilities_failures(constraint, column)
+    if kind == 'number':
+        return number_failures(constraint, column)
+    if kind == 'string':
+        return string_failures(constraint, column)
+    # Types from the RuleTypes registry bring their own batched check
+    return np.asarray(constraint.ruleType.failing_rows(column, constraint.essential), dtype=np.int64)
@@ -0,0 +1,84 @@
+"""
+Compares the shared CSVReader parser with the two parsers it replaced, on a long narrow file and a short wide one.
+Usage: python benchmarks/csv_reader.py [rows]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import CSVReader
+import ErrorLogging
+
+
+def write_file(path, rows, columns, delimiter, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='UTF-8', newline='') as file:
+        file.write(delimiter.join('col' + str(i) for i in range(columns)) + '\n')
+        for _ in range(rows):
+            file.write(delimiter.join(rng.choice((str(rng.randint(0, 99999)), f'{rng.random():.4f}', 'ABC', ''))
+                                      for _ in range(columns)) + '\n')
+
+
+def old_wrapper_columns(path, delimiter):
+    # The split based loader CSVWrapper used before it moved onto CSVReader
+    lines = open(path, encoding='UTF-8').read().split('\n')
+    while lines[-1].replace(delimiter, '') == '':
+        lines.pop()
+    header = lines[0].split(delimiter)
+    columns = [[] for _ in header]
+    for line in lines[1:]:
+        fields = line.split(delimiter)
+        while len(fields) > len(header) and fields[-1] == '':
+            fields.pop()
+        if len(fields) == len(header):
+            for column, field in zip(columns, fields):
+                column.append(field)
+    return columns
+
+
+def old_handler_columns(path, delimiter):
+    # The csv.DictReader loader FileHandler.Handler used
+    with open(path, newline='', encoding='UTF-8') as file:
+        reader = csv.DictReader(file, delimiter=delimiter)
+        rows = list(reader)
+        return [[row[field] for row in rows] for field in reader.fieldnames]
+
+
+def new_columns(path, delimiter):
+    with open(path, newline='', encoding='UTF-8') as file:
+        return CSVReader.Reader(delimiter).read_columns(file)[1]
+
+
+def time_parser(parser, path, delimiter, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        columns = parser(path, delimiter)
+        best = min(best, time.perf_counter() - start)
+    return best, columns
+
+
+def main(rows=200_000):
+    with tempfile.TemporaryDirectory() as directory, ErrorLogging.MemorySink():
+        for label, row_count, column_count in (('long', rows, 6), ('wide', rows // 50, 300)):
+            path = os.path.join(directory, label + '.csv')
+            write_file(path, row_count, column_count, '|')
+            megabytes = os.path.getsize(path) / 1e6
+            print(f'{label}: {row_count} rows x {column_count} columns, {megabytes:.1f} MB')
+            baseline = None
+            for name, parser in (('old CSVWrapper split', old_wrapper_columns), ('old DictReader', old_handler_columns),
+                                 ('CSVReader', new_columns)):
+                seconds, columns = time_parser(parser, path, '|')
+                if baseline is None:
+                    baseline = columns
+                elif columns != baseline:
+                    print(f'  {name} disagrees with the split loader')
+                print(f'  {name:22} {seconds:7.3f}s  {row_count / seconds:12,.0f} rows/s  {megabytes / seconds:7.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
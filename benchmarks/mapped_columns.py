@@ -0,0 +1,61 @@
+"""
+Compares the memory held by list columns with memory-mapped columns, after loading and after matchToColumns.
+Usage: python benchmarks/mapped_columns.py [rows] [columns]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+
+
+def write_files(directory, rows, columns, seed=0):
+    rng = random.Random(seed)
+    csv_path = os.path.join(directory, 'wide.csv')
+    rules_path = os.path.join(directory, 'wide.json')
+    with open(csv_path, 'w', encoding='UTF-8', newline='') as file:
+        file.write('|'.join('col' + str(i) for i in range(columns)) + '\n')
+        for _ in range(rows):
+            file.write('|'.join(f' {rng.randint(0, 99999)} ' for _ in range(columns)) + '\n')
+    rules = [{'Column': 'col' + str(i), 'Type': 'String', 'Maximum': '10', 'Trimmed': 'True', 'Case Sensitive': 'False'} for i in range(columns)]
+    with open(rules_path, 'w', encoding='UTF-8') as file:
+        json.dump(rules, file)
+    return csv_path, rules_path
+
+
+def measure(csv_path, rules_path, mapped):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        tracemalloc.start()
+        start = time.perf_counter()
+        wrapper = CSVWrapper.CSVWrapper(csv_path, mapped=mapped)
+        wrapper.loadColumns()
+        loaded = tracemalloc.get_traced_memory()[0]
+        constraint_set.matchToColumns(wrapper)
+        matched = tracemalloc.get_traced_memory()[0]
+        constraint_set.validateAll()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return loaded, matched, peak, seconds, len(sink.records)
+
+
+def main(rows=50_000, columns=50):
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path, rules_path = write_files(directory, rows, columns)
+        print(f'{rows} rows x {columns} columns, {os.path.getsize(csv_path) / 1e6:.1f} MB')
+        for mapped in (False, True):
+            loaded, matched, peak, seconds, errors = measure(csv_path, rules_path, mapped)
+            print(f'  {"mapped" if mapped else "lists":6}  loaded {loaded / 1e6:7.1f} MB  matched {matched / 1e6:7.1f} MB'
+                  f'  peak {peak / 1e6:7.1f} MB  {seconds:6.2f}s  {errors} errors')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,42 @@
+"""
+Measures how long the entry points take to start, each in a fresh interpreter, and which heavy optional modules
+they load before any work is done.
+Usage: python benchmarks/startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that should only be loaded when the feature that needs them is used
+HEAVY = ('numpy', 'tkinter', 'concurrent.futures.process', 'multiprocessing.pool')
+ENTRY_POINTS = ('Validation', 'BatchValidation', 'Main', 'GUI', 'ValidationService', 'ConstraintModule')
+
+
+def time_import(module: str, runs: int) -> tuple[float, list[str]]:
+    """
+    Median seconds for a fresh interpreter to import module and exit, and the heavy modules it loaded
+    """
+    code = f'import sys, {module}; print(",".join(name for name in {HEAVY!r} if name in sys.modules))'
+    timings = []
+    loaded = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        loaded = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), [name for name in loaded.split(',') if name]
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baseline, _ = time_import('sys', runs)
+    print(f'Bare interpreter: {baseline * 1000:.0f} ms (median of {runs})')
+    for module in ENTRY_POINTS:
+        seconds, loaded = time_import(module, runs)
+        print(f'{module:<20} {seconds * 1000:6.0f} ms  +{(seconds - baseline) * 1000:4.0f} ms  heavy modules: {", ".join(loaded) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
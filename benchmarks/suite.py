@@ -0,0 +1,220 @@
+"""
+Runs every stage of validation over synthetic files of several shapes and reports the time, throughput and peak memory
+of each stage. Results can be saved as JSON and compared with an earlier run to catch regressions.
+Usage: python benchmarks/suite.py [--scenario NAME ...] [--scale X] [--repeat N] [--no-memory]
+                                  [--output results.json] [--compare earlier.json] [--threshold 0.1]
+
+Timings come from runs without tracemalloc, which slows allocation heavy code down a lot. Peak memory comes from a
+separate run with it, so turning it off with --no-memory only saves time. The exit status is 1 if --compare found a
+stage that got slower by more than the threshold, or that logged a different number of errors
+"""
+import argparse
+import contextlib
+import dataclasses
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import FileHandler
+import RuleHandler
+import RulePlan
+import synthetic
+
+SCENARIOS = {
+    'narrow': synthetic.Spec(rows=200_000, columns=6),
+    'wide': synthetic.Spec(rows=20_000, columns=120),
+    'low cardinality': synthetic.Spec(rows=200_000, columns=12, cardinality=4),
+    'high cardinality': synthetic.Spec(rows=100_000, columns=8, cardinality=5000),
+    'error heavy': synthetic.Spec(rows=100_000, columns=8, error_rate=0.05),
+    'groups and pairs': synthetic.Spec(rows=200_000, columns=10, unique_groups=3, one_to_one=2),
+}
+
+
+class CountingSink(ErrorLogging.ErrorSink):
+    # Only counts, so that keeping the errors doesn't add to the time or memory of the stages
+    def write(self, errorRecord):
+        pass
+
+
+class StageRecorder:
+    def __init__(self, sink: CountingSink, trace_memory: bool):
+        self.sink = sink
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        errors = self.sink.count
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        yield
+        result = {'seconds': time.perf_counter() - start, 'cpu_seconds': time.process_time() - cpu_start, 'errors': self.sink.count - errors}
+        if self.trace_memory:
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        self.stages[name] = result
+
+
+def run_stages(paths: dict, recorder: StageRecorder) -> None:
+    """
+    The ConstraintSet path one check at a time, then fused into a single pass, then the FileHandler and RuleHandler path
+    """
+    with recorder.stage('rules'):
+        constraint_set = ConstraintModule.ConstraintSet(paths['constraints.json'])
+    with recorder.stage('load'):
+        wrapper = CSVWrapper.CSVWrapper(paths['data.csv'])
+        wrapper.loadColumns()
+    with recorder.stage('match'):
+        constraint_set.matchToColumns(wrapper)
+    with recorder.stage('columns'):
+        constraint_set.validateColumns()
+    with recorder.stage('unique groups'):
+        constraint_set.validateGroups()
+    with recorder.stage('one to one'):
+        constraint_set.validateOneToOne()
+    del wrapper
+
+    with recorder.stage('fused'):
+        ConstraintModule.ConstraintSet(paths['constraints.json']).validateFused(CSVWrapper.CSVWrapper(paths['data.csv']))
+
+    with recorder.stage('handler load'):
+        handler = FileHandler.Handler(paths['handler.json'])
+        handler.load_rules(paths['handler.json'])
+        handler.load_csv(paths['data.csv'])
+    with recorder.stage('handler checks'):
+        rule_set = RuleHandler.RuleSet({name: rule for name, rule in handler.raw_rules.items() if isinstance(rule, dict)})
+        for rule in rule_set.rules:
+            for check in rule.checks:
+                check(handler.data[rule.name])
+        rule_set.validate_unique_groups(handler.data)
+        rule_set.validate_one_to_one(handler.data)
+
+
+def measure(paths: dict, repeat: int, trace_memory: bool) -> dict:
+    """
+    The fastest of repeat runs for each stage, with the peak memory of an extra traced run
+    """
+    best = {}
+    for _ in range(repeat):
+        with CountingSink() as sink:
+            recorder = StageRecorder(sink, False)
+            run_stages(paths, recorder)
+        for name, result in recorder.stages.items():
+            if name not in best or result['seconds'] < best[name]['seconds']:
+                best[name] = result
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            with CountingSink() as sink:
+                recorder = StageRecorder(sink, True)
+                run_stages(paths, recorder)
+        finally:
+            tracemalloc.stop()
+        for name, result in recorder.stages.items():
+            best[name]['peak_mb'] = result['peak_mb']
+    return best
+
+
+def run_scenario(name: str, spec: synthetic.Spec, directory: str, repeat: int, trace_memory: bool) -> dict:
+    paths = synthetic.write_files(os.path.join(directory, name.replace(' ', '_')), spec)
+    size = os.path.getsize(paths['data.csv'])
+    stages = measure(paths, repeat, trace_memory)
+    for result in stages.values():
+        seconds = max(result['seconds'], 1e-9)
+        result['rows_per_second'] = spec.rows / seconds
+        result['mb_per_second'] = size / 1e6 / seconds
+    return {'spec': dataclasses.asdict(spec), 'bytes': size, 'stages': stages}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict) -> None:
+    print(f'{"scenario":<18} {"stage":<15} {"seconds":>9} {"rows/s":>12} {"MB/s":>9} {"peak MB":>9} {"errors":>8}')
+    for scenario, scenario_results in results['scenarios'].items():
+        for stage, result in scenario_results['stages'].items():
+            peak = f'{result["peak_mb"]:9.1f}' if 'peak_mb' in result else f'{"-":>9}'
+            print(f'{scenario:<18} {stage:<15} {result["seconds"]:9.3f} {result["rows_per_second"]:12,.0f} '
+                  f'{result["mb_per_second"]:9.1f} {peak} {result["errors"]:8}')
+
+
+def compare(earlier: dict, results: dict, threshold: float) -> bool:
+    """
+    Prints how each stage's time changed since earlier. Returns True if any stage regressed
+    """
+    print(f'\nCompared with {earlier["meta"].get("commit") or "an earlier run"} from {earlier["meta"]["date"]}')
+    regressed = False
+    for scenario, scenario_results in results['scenarios'].items():
+        earlier_scenario = earlier['scenarios'].get(scenario)
+        if earlier_scenario is None:
+            continue
+        if earlier_scenario['spec'] != scenario_results['spec']:
+            print(f'{scenario}: skipped, the data differs (was --scale changed?)')
+            continue
+        for stage, result in scenario_results['stages'].items():
+            earlier_result = earlier_scenario['stages'].get(stage)
+            if earlier_result is None:
+                continue
+            change = result['seconds'] / max(earlier_result['seconds'], 1e-9) - 1
+            notes = []
+            if change > threshold:
+                notes.append('SLOWER')
+            if result['errors'] != earlier_result['errors']:
+                notes.append(f'ERRORS {earlier_result["errors"]} -> {result["errors"]}')
+            regressed = regressed or bool(notes)
+            print(f'{scenario:<18} {stage:<15} {earlier_result["seconds"]:9.3f} -> {result["seconds"]:9.3f} {change:+8.1%} {" ".join(notes)}')
+    return regressed
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark every validation stage over synthetic data.')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Run only these scenarios (repeatable)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply the rows of every scenario')
+    parser.add_argument('--repeat', type=int, default=1, help='Keep the fastest of this many timed runs')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run that measures peak memory')
+    parser.add_argument('--output', help='Save the results to this JSON file')
+    parser.add_argument('--compare', help='Compare with results saved by an earlier --output')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slow down, as a fraction, counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = {'meta': {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(), 'platform': platform.platform(), 'scale': args.scale},
+               'scenarios': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        # Keeps the rule plans the benchmark compiles out of the real cache
+        RulePlan.CACHE_DIR = os.path.join(directory, 'cache')
+        for name in args.scenario or SCENARIOS:
+            spec = dataclasses.replace(SCENARIOS[name], rows=max(int(SCENARIOS[name].rows * args.scale), 1))
+            results['scenarios'][name] = run_scenario(name, spec, directory, args.repeat, not args.no_memory)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            json.dump(results, file, indent=1)
+    if args.compare:
+        with open(args.compare, encoding='UTF-8') as file:
+            earlier = json.load(file)
+        if compare(earlier, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Generates synthetic CSV files with matching rule files for the benchmarks.
+Usage: python benchmarks/synthetic.py <output directory> [--rows N] [--columns N] [--cardinality N]
+                                      [--error-rate R] [--groups N] [--pairs N] [--seed N]
+
+Three files are written: data.csv (pipe delimited), constraints.json for ConstraintModule.ConstraintSet and
+handler.json for FileHandler.Handler and RuleHandler.RuleSet. Every unique group is a pair of columns that is
+unique on every row, and every one to one pair links a code column to a name column; errors break these too
+"""
+import argparse
+import dataclasses
+import json
+import os
+import random
+
+# The kinds of the columns that aren't part of a unique group or one to one pair, used in turn
+FILLER_KINDS = ('int', 'float', 'code', 'text')
+
+
+@dataclasses.dataclass(frozen=True)
+class Spec:
+    rows: int = 100_000
+    # At least two per unique group and two per one to one pair
+    columns: int = 8
+    # Distinct values in the code columns
+    cardinality: int = 20
+    # Chance of each cell being made invalid
+    error_rate: float = 0.001
+    unique_groups: int = 1
+    one_to_one: int = 1
+    seed: int = 0
+
+    def layout(self) -> list[tuple[str, str, str]]:
+        """
+        (column name, kind, group or pair name) for every column, in file order
+        """
+        columns = []
+        for group in range(self.unique_groups):
+            columns.append((f'g{group}_key', 'key', f'g{group}'))
+            columns.append((f'g{group}_part', 'code', f'g{group}'))
+        for pair in range(self.one_to_one):
+            columns.append((f'p{pair}_code', 'pair code', f'p{pair}'))
+            columns.append((f'p{pair}_name', 'pair name', f'p{pair}'))
+        for i in range(max(self.columns - len(columns), 0)):
+            kind = FILLER_KINDS[i % len(FILLER_KINDS)]
+            columns.append((f'{kind}{i}', kind, None))
+        return columns
+
+
+def codes(cardinality: int) -> list[str]:
+    return [f'C{i:03d}' for i in range(cardinality)]
+
+
+def write_csv(path: str, spec: Spec) -> None:
+    rng = random.Random(spec.seed)
+    layout = spec.layout()
+    values = codes(spec.cardinality)
+    # Unique group keys count up, so only the errors repeat them
+    cells = {
+        'int': lambda row: str(rng.randint(0, 99999)),
+        'float': lambda row: f'{rng.uniform(0, 10000):.2f}',
+        'code': lambda row: rng.choice(values),
+        'text': lambda row: ' ' + 'x' * rng.randint(1, 12) + ' ',
+        'key': lambda row: str(row),
+        'pair code': lambda row: values[row % spec.cardinality],
+        'pair name': lambda row: 'name of ' + values[row % spec.cardinality],
+    }
+    errors = {
+        'int': lambda row: 'x' + str(row),
+        'float': lambda row: '1.2.3',
+        'code': lambda row: 'ZZZ',
+        'text': lambda row: 'x' * 20,
+        'key': lambda row: str(max(row - 1, 0)),
+        'pair code': lambda row: values[(row + 1) % spec.cardinality],
+        'pair name': lambda row: 'another name',
+    }
+    generators = [(cells[kind], errors[kind]) for _, kind, _ in layout]
+    with open(path, 'w', encoding='UTF-8', newline='') as file:
+        file.write('|'.join(name for name, _, _ in layout) + '\n')
+        for row in range(spec.rows):
+            file.write('|'.join(error(row) if rng.random() < spec.error_rate else cell(row) for cell, error in generators) + '\n')
+
+
+def constraint_rules(spec: Spec) -> list[dict]:
+    rules = []
+    for name, kind, link in spec.layout():
+        rule = {'Column': name}
+        if kind in ('int', 'key'):
+            rule.update({'Type': 'INT', 'Minimum': '0', 'Maximum': str(max(spec.rows, 100000))})
+        elif kind == 'float':
+            rule.update({'Type': 'FLOAT', 'Decimal Places': '2', 'Minimum': '0', 'Maximum': '10000'})
+        elif kind in ('code', 'pair code'):
+            rule.update({'Type': 'TEXT', 'Values': [value.lower() for value in codes(spec.cardinality)], 'Case Sensitive': 'False'})
+        else:
+            rule.update({'Type': 'TEXT', 'Minimum': '1', 'Maximum': '16', 'Trimmed': 'True'})
+        if kind in ('key', 'code') and link is not None:
+            rule['Unique Group'] = link
+        if kind in ('pair code', 'pair name'):
+            rule['One To One'] = link
+        rules.append(rule)
+    return rules
+
+
+def handler_rules(spec: Spec) -> dict:
+    # File settings for FileHandler.Handler, then one entry per column for RuleHandler.RuleSet
+    rules = {'delimiter': '|', 'encoding': 'utf-8'}
+    for name, kind, link in spec.layout():
+        rule = {'type': {'int': 'int', 'key': 'int', 'float': 'float'}.get(kind, 'str')}
+        if kind in ('code', 'pair code'):
+            rule['values'] = codes(spec.cardinality)
+        if kind in ('key', 'code') and link is not None:
+            rule['unique group'] = link
+        if kind == 'pair code':
+            rule['one to one'] = name.replace('_code', '_name')
+        rules[name] = rule
+    return rules
+
+
+def write_files(directory: str, spec: Spec) -> dict[str, str]:
+    """
+    Writes the CSV and both rule files into directory and returns their paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, name) for name in ('data.csv', 'constraints.json', 'handler.json')}
+    write_csv(paths['data.csv'], spec)
+    with open(paths['constraints.json'], 'w', encoding='UTF-8') as file:
+        json.dump(constraint_rules(spec), file, indent=1)
+    with open(paths['handler.json'], 'w', encoding='UTF-8') as file:
+        json.dump(handler_rules(spec), file, indent=1)
+    return paths
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='Write a synthetic CSV file and matching rule files.')
+    parser.add_argument('directory')
+    parser.add_argument('--rows', type=int, default=Spec.rows)
+    parser.add_argument('--columns', type=int, default=Spec.columns)
+    parser.add_argument('--cardinality', type=int, default=Spec.cardinality)
+    parser.add_argument('--error-rate', type=float, default=Spec.error_rate)
+    parser.add_argument('--groups', type=int, default=Spec.unique_groups)
+    parser.add_argument('--pairs', type=int, default=Spec.one_to_one)
+    parser.add_argument('--seed', type=int, default=Spec.seed)
+    args = parser.parse_args(argv)
+    spec = Spec(args.rows, args.columns, args.cardinality, args.error_rate, args.groups, args.pairs, args.seed)
+    for path in write_files(args.directory, spec).values():
+        print('Wrote ' + path)
+
+
+if __name__ == '__main__':
+    main()
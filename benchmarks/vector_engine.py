@@ -0,0 +1,86 @@
+"""
+Compares the row by row column checks with the batched NumPy engine on numeric-heavy data.
+Usage: python benchmarks/vector_engine.py [rows] [error rate]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ConstraintModule
+import ErrorLogging
+
+
+def make_constraint(name, col_type, decimal_places=0, minimum=-float('inf'), maximum=float('inf'), values=None):
+    constraint = ConstraintModule.Constraint()
+    constraint.colName = name
+    constraint.colType = col_type
+    constraint.decimalPlaces = decimal_places
+    constraint.minimum = minimum
+    constraint.maximum = maximum
+    if col_type in (int, float):
+        constraint.validate = constraint.validateNumber
+        constraint.validateList = constraint.validateNumList
+    if values is not None:
+        constraint.possibleValues = values
+        constraint.validate = constraint.validateFinitePossibilities
+        constraint.validateList = constraint.validatePossibilitiesList
+        constraint.compileValues()
+    return constraint
+
+
+def make_columns(rows, error_rate=0.001, seed=0):
+    rng = random.Random(seed)
+
+    def maybe_bad(value):
+        return rng.choice(('x', '', '1.2.3', '-5')) if rng.random() < error_rate else value
+
+    return {
+        'id': [maybe_bad(str(i)) for i in range(rows)],
+        'amount': [maybe_bad(f'{rng.uniform(0, 10000):.2f}') for _ in range(rows)],
+        'rate': [maybe_bad(f'{rng.random():.4f}') for _ in range(rows)],
+        'qty': [maybe_bad(str(rng.randint(0, 500))) for _ in range(rows)],
+        'ccy': [maybe_bad(rng.choice(('USD', 'EUR', 'GBP'))) for _ in range(rows)],
+        'note': [maybe_bad('n' * rng.randint(1, 10)) for _ in range(rows)],
+    }
+
+
+def build_set(columns):
+    constraint_set = ConstraintModule.ConstraintSet.__new__(ConstraintModule.ConstraintSet)
+    constraint_set.uniqueGroups = {}
+    constraint_set.oneToOnePairs = {}
+    constraint_set.constraints = [
+        make_constraint('id', int, minimum=0),
+        make_constraint('amount', float, decimal_places=2, minimum=0, maximum=10000),
+        make_constraint('rate', float, decimal_places=4, minimum=0, maximum=1),
+        make_constraint('qty', int, minimum=0, maximum=500),
+        make_constraint('ccy', str, values=['USD', 'EUR', 'GBP']),
+        make_constraint('note', str, minimum=1, maximum=10),
+    ]
+    for constraint in constraint_set.constraints:
+        constraint.column = columns[constraint.colName]
+    return constraint_set
+
+
+def run(constraint_set, engine):
+    with ErrorLogging.MemorySink() as sink:
+        start = time.perf_counter()
+        constraint_set.validateColumns(engine)
+        elapsed = time.perf_counter() - start
+    return elapsed, sorted(sink.errors)
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    error_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+    constraint_set = build_set(make_columns(rows, error_rate))
+
+    python_time, python_errors = run(constraint_set, 'python')
+    numpy_time, numpy_errors = run(constraint_set, 'numpy')
+
+    assert python_errors == numpy_errors, 'The engines disagree'
+    print(f'{rows} rows x {len(constraint_set.constraints)} columns, {len(python_errors)} errors')
+    print(f'python: {python_time:.2f}s ({rows / python_time:,.0f} rows/s)')
+    print(f'numpy:  {numpy_time:.2f}s ({rows / numpy_time:,.0f} rows/s)')
+    print(f'speedup: {python_time / numpy_time:.1f}x')
@@ -0,0 +1,27 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import BatchValidation
+import RulePlan
+
+
+def test_failing_file_does_not_stop_the_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    (tmp_path / 'good.json').write_text(json.dumps([{'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '100'}]))
+    (tmp_path / 'broken.json').write_text('[{"Column": "ID",')
+    (tmp_path / 'mapping.json').write_text(json.dumps({'bad*.csv': 'broken.json', '*.csv': 'good.json'}))
+    for name in ('bad.csv', 'ok.csv'):
+        (tmp_path / name).write_text('ID\n1\n2\n')
+    output = tmp_path / 'logs'
+    output.mkdir()
+
+    code = BatchValidation.main(['-m', str(tmp_path / 'mapping.json'), '-o', str(output), str(tmp_path / 'bad.csv'), str(tmp_path / 'ok.csv')])
+    assert code == 1
+    summary, = [path for path in output.iterdir() if path.name.startswith('validation summary')]
+    lines = summary.read_text(encoding='UTF-8').splitlines()
+    assert lines[0] == 'Validated 2 files'
+    assert lines[1].startswith(str(tmp_path / 'bad.csv') + ': failed: JSONDecodeError')
+    assert lines[2].startswith(str(tmp_path / 'ok.csv') + ': 0 errors')
@@ -0,0 +1,120 @@
+import codecs
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+
+def run_incremental(csv_path, rules_path):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        wrapper = CSVWrapper.CSVWrapper(csv_path, streaming=True)
+        constraint_set.validateIncremental(wrapper)
+    return sink.errors
+
+
+def test_multi_line_record_split_across_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '100', 'Unique Group': 'g1'},
+        {'Column': 'Text', 'Type': 'TEXT', 'Maximum': '50'},
+    ]))
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_bytes(b'ID|Text\n1|a\n2|"multi\nline"\n')
+    assert run_incremental(str(csv_path), str(rules_path)) == []
+
+    # The record is only half written when the next run starts, so it has to be left for the run after
+    with open(csv_path, 'ab') as file:
+        file.write(b'3|"another\nmulti')
+    assert run_incremental(str(csv_path), str(rules_path)) == []
+
+    with open(csv_path, 'ab') as file:
+        file.write(b' line"\n1|dup\n')
+    assert run_incremental(str(csv_path), str(rules_path)) == [
+        'Row: 5 contains the same information as row 2 for the unique group: g1.\n',
+    ]
+
+
+def test_bad_byte_is_logged_and_the_run_carries_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '100'},
+        {'Column': 'Text', 'Type': 'TEXT', 'Maximum': '5'},
+    ]))
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_bytes(b'ID|Text\n1|a\n')
+    assert run_incremental(str(csv_path), str(rules_path)) == []
+
+    with open(csv_path, 'ab') as file:
+        file.write(b'2|caf\xe9\n300|b\n')
+    assert run_incremental(str(csv_path), str(rules_path)) == [
+        'Row: 3 has a byte at offset 17 that is not valid UTF-8. It was read as �.\n',
+        'Entry at Column: ID, Row: 4 has value: 300. This column must be a number between 0.0 and 100.0 with at least 0 decimal places.\n',
+    ]
+    # The rows after the bad byte were taken in, so the next run has nothing new
+    assert run_incremental(str(csv_path), str(rules_path)) == []
+
+
+def test_utf16_file_split_across_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '100', 'Unique Group': 'g1'},
+    ]))
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_bytes('ID\n1\n'.encode('utf-16-be').join([codecs.BOM_UTF16_BE, b'']))
+
+    def run():
+        with ErrorLogging.MemorySink() as sink:
+            constraint_set = ConstraintModule.ConstraintSet(str(rules_path))
+            constraint_set.validateIncremental(CSVWrapper.CSVWrapper(str(csv_path), encoding='auto', streaming=True))
+        return sink.errors
+
+    assert run() == []
+    with open(csv_path, 'ab') as file:
+        file.write('2\n1\n'.encode('utf-16-be'))
+    assert run() == ['Row: 4 contains the same information as row 2 for the unique group: g1.\n']
+
+
+def test_runs_over_appended_rows_match_one_loaded_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Unique Group': 'g1', 'One To One': 'p1'},
+        {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'Trimmed': 'True', 'One To One': 'p1'},
+        {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR'], 'Case Sensitive': 'False'},
+    ]))
+    csv_path = tmp_path / 'data.csv'
+    rows = [f'{i % 60}|{" abcd"[:i % 6]}|{["USD", "eur", "GBP"][i % 3]}\n' for i in range(200)]
+    csv_path.write_text('ID|Name|Ccy\n')
+    errors = []
+    for start in range(0, len(rows), 70):
+        with open(csv_path, 'a') as file:
+            file.writelines(rows[start:start + 70])
+        errors += run_incremental(str(csv_path), str(rules_path))
+
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(str(rules_path))
+        wrapper = CSVWrapper.CSVWrapper(str(csv_path))
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll()
+
+    def split(errors):
+        # A one to one value is logged again whenever it gains a partner, the last of its errors has all of them
+        conflicts = {error.split(' has multiple')[0]: error for error in errors if ' one to one ' in error}
+        return sorted(error for error in errors if ' one to one ' not in error), sorted(conflicts.values())
+
+    assert len(sink.errors) > 0
+    assert split(errors) == split(sink.errors)
+    # A fresh run over the whole file checks it all at once
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'other cache'))
+    assert sorted(run_incremental(str(csv_path), str(rules_path))) == sorted(sink.errors)
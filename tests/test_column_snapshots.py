@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '250', 'Unique Group': 'g1', 'One To One': 'p1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '6', 'Trimmed': 'True', 'One To One': 'p1'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR'], 'Case Sensitive': 'False'},
+    {'Column': 'Note', 'Type': 'TEXT', 'Maximum': '8'},
+]
+
+
+def write_files(tmp_path):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    # An integer column, a repetitive one, a low-cardinality one and one with a different value on every row
+    rows = [f'{i % 260}|{" abcdefg"[:i % 9]}|{["USD", "eur", "GBP"][i % 3]}|note {i}é'.encode() for i in range(300)]
+    rows.insert(100, b'short|row')
+    rows.insert(200, b'7|caf\xe9|USD|x')
+    csv_path.write_bytes(b'ID|Name|Ccy|Note\n' + b'\n'.join(rows) + b'\n')
+    return str(rules_path), str(csv_path)
+
+
+def run(rules_path, csv_path, **options):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        wrapper = CSVWrapper.CSVWrapper(csv_path, **options)
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll()
+    return wrapper.snapshotFile is not None, sink.errors
+
+
+def test_snapshot_runs_match_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    errors = run(rules_path, csv_path)[1]
+    assert any('not valid UTF-8' in error for error in errors)
+    assert any('columns but the header has' in error for error in errors)
+    for categorical in (False, True):
+        # The first run saves the snapshot and the second reads everything from it
+        assert run(rules_path, csv_path, snapshot=True, categorical=categorical) == (False, errors)
+        assert run(rules_path, csv_path, snapshot=True, categorical=categorical) == (True, errors)
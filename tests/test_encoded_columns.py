@@ -0,0 +1,56 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import EncodedColumns
+import ErrorLogging
+import RulePlan
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Unique Group': 'g1', 'One To One': 'p1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'One To One': 'p1'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR']},
+]
+
+
+def write_files(tmp_path):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    rows = [f'{i % 60}|{"abcd"[:i % 5]}|{["USD", "EUR", "GBP"][i % 3]}' for i in range(200)]
+    csv_path.write_text('ID|Name|Ccy\n' + '\n'.join(rows) + '\nshort\n')
+    return str(rules_path), str(csv_path)
+
+
+def run(rules_path, csv_path, **options):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        wrapper = CSVWrapper.CSVWrapper(csv_path, **options)
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll()
+    return wrapper.columns, sink.errors
+
+
+def test_categorical_is_opt_in_and_matches_plain_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    columns, errors = run(rules_path, csv_path)
+    assert all(type(column) is list for column in columns)
+    assert len(errors) > 0
+    encoded, encoded_errors = run(rules_path, csv_path, categorical=True)
+    assert all(isinstance(column, EncodedColumns.EncodedColumn) for column in encoded)
+    assert [list(column) for column in encoded] == columns
+    assert encoded_errors == errors
+
+
+def test_encode_gives_up_on_many_distinct_values():
+    few = [str(i % 256) for i in range(10000)]
+    assert list(EncodedColumns.encode(few)) == few
+    # The values only become too many long after the probe
+    late = few + [str(i) for i in range(EncodedColumns.BLOCK_ROWS * 2)]
+    assert EncodedColumns.encode(late) is late
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ErrorLogging
+
+
+def test_default_sink_writes_through_and_keeps_nothing(capsys):
+    ErrorLogging.log('Logged outside of a run.', rule='rules file')
+    assert capsys.readouterr().err == 'Logged outside of a run.\n'
+    assert not hasattr(ErrorLogging.defaultSink, 'records')
+    with ErrorLogging.MemorySink() as sink:
+        ErrorLogging.log('Logged in a run.')
+    assert sink.errors == ['Logged in a run.\n']
+    assert capsys.readouterr().err == ''
+
+
+def test_write_log_needs_a_memory_sink(tmp_path):
+    with pytest.raises(ValueError):
+        ErrorLogging.write_log(directory=str(tmp_path))
+    with ErrorLogging.MemorySink():
+        ErrorLogging.log('An error.')
+        ErrorLogging.write_log(header='Header\n', directory=str(tmp_path))
+    [log_path] = tmp_path.iterdir()
+    assert log_path.read_text(encoding='UTF-8') == 'Header\nAn error.\n'
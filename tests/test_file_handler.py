@@ -0,0 +1,35 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ErrorLogging
+import FileHandler
+import RulePlan
+
+
+def load(tmp_path, content: bytes):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps({'encoding': 'utf-8', 'Name': {'type': 'str'}}))
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_bytes(content)
+    handler = FileHandler.Handler(str(rules_path))
+    handler.load_rules(str(rules_path))
+    with ErrorLogging.MemorySink() as sink:
+        handler.load_csv(str(csv_path))
+    return handler.data, sink.errors
+
+
+def test_bad_bytes_are_logged_with_their_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    data, errors = load(tmp_path, b'ID,Name\n1,"caf\xe9\nbar"\n\n2,ok\n')
+    assert data == {'ID': ['1', '2'], 'Name': ['caf�\nbar', 'ok']}
+    assert errors == ['Row 2 has a byte at offset 14 that is not valid utf-8, it was read as �\n']
+
+
+def test_file_in_another_encoding_is_not_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    data, errors = load(tmp_path, 'ID,Name\n1,àéîõü\n'.encode('cp1252') * 20)
+    assert data == {}
+    assert len(errors) == 1 and 'does not appear to be encoded in utf-8' in errors[0]
@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Essential': 'True', 'Unique Group': 'g1', 'One To One': 'p1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'Trimmed': 'True', 'One To One': 'p1', 'Unique Group': 'g2'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR'], 'Case Sensitive': 'False', 'Unique Group': 'g2'},
+    {'Column': 'Amount', 'Type': 'FLOAT', 'Minimum': '-10', 'Maximum': '1000', 'Decimal Places': '2'},
+]
+
+
+def write_files(tmp_path):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    # Loaded runs number the rows after one with the wrong number of columns differently, so there are none here
+    rows = [f'{["", i % 60, "x"][i % 7 % 3]}|{" abcd"[:i % 6]}|{["USD", "eur", "GBP", ""][i % 4]}|{["1.5", "12.345", "-20", "abc", "999.99"][i % 5]}' for i in range(300)]
+    csv_path.write_text('ID|Name|Ccy|Amount\n' + '\n'.join(rows) + '\n')
+    return str(rules_path), str(csv_path)
+
+
+def test_fused_matches_validate_all(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        wrapper = CSVWrapper.CSVWrapper(csv_path)
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll()
+    assert len(sink.errors) > 0
+    # The same errors, logged row by row rather than column by column
+    for streaming in (False, True):
+        with ErrorLogging.MemorySink() as fused:
+            ConstraintModule.ConstraintSet(rules_path).validateFused(CSVWrapper.CSVWrapper(csv_path, streaming=streaming))
+        assert sorted(fused.errors) == sorted(sink.errors)
@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Unique Group': 'g1', 'One To One': 'p1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '4', 'Trimmed': 'True', 'One To One': 'p1'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR'], 'Case Sensitive': 'False', 'Unique Group': 'g1'},
+]
+NAMES = ['ab', ' café ', '"q|uo"', '"a ""b"""', 'naïve', '']
+
+
+def write_files(tmp_path, quoted):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    names = NAMES if quoted else [name for name in NAMES if '"' not in name]
+    rows = [f'{i % 60}|{names[i % len(names)]}|{["USD", "eur", "GBP"][i % 3]}' for i in range(200)]
+    rows.insert(120, 'short|row')
+    csv_path.write_text('ID|Name|Ccy\n' + '\n'.join(rows) + '\n|\n', encoding='UTF-8')
+    return str(rules_path), str(csv_path)
+
+
+def run(rules_path, csv_path, mapped):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        wrapper = CSVWrapper.CSVWrapper(csv_path, mapped=mapped)
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll()
+    return [list(constraint.column) for constraint in constraint_set.constraints], sink.errors
+
+
+def test_mapped_columns_match_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    # Quote-free files and files with quoted records are indexed in different ways
+    for quoted in (False, True):
+        rules_path, csv_path = write_files(tmp_path, quoted)
+        columns, errors = run(rules_path, csv_path, False)
+        assert len(errors) > 0
+        assert run(rules_path, csv_path, True) == (columns, errors)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import OneToOne
+
+
+def test_complete_only_when_no_partner_was_left_out():
+    exact = OneToOne.PairIndex(max_examples=3).add_columns(['x'] * 3, ['1', '2', '3'])
+    assert list(exact.conflicts()) == [(0, 'x', ['1', '2', '3'], True)]
+    over = OneToOne.PairIndex(max_examples=3).add_columns(['x'] * 4, ['1', '2', '3', '4'])
+    assert list(over.conflicts()) == [(0, 'x', ['1', '2', '3'], False)]
+
+
+def test_changed_only_reports_a_partner_past_the_cap():
+    index = OneToOne.PairIndex(max_examples=3).add_columns(['x'] * 3, ['1', '2', '3'])
+    index.reset_changes()
+    index.add('x', '2')
+    assert list(index.conflicts(changed_only=True)) == []
+    index.add('x', '4')
+    assert list(index.conflicts(changed_only=True)) == [(0, 'x', ['1', '2', '3'], False)]
+
+
+def test_merged_shards_match_one_index():
+    a_column = ['x', 'x', 'y', 'x', 'x', 'y', 'x']
+    b_column = ['1', '2', '3', '3', '4', '5', '5']
+    whole = OneToOne.PairIndex(max_examples=3).add_columns(a_column, b_column)
+    merged = OneToOne.PairIndex(max_examples=3).add_columns(a_column[:2], b_column[:2])
+    merged.merge(OneToOne.PairIndex(max_examples=3).add_columns(a_column[2:], b_column[2:]))
+    assert list(merged.conflicts()) == list(whole.conflicts())
+    # The overflow is carried over even when the later shard alone had it
+    merged = OneToOne.PairIndex(max_examples=3).add_columns(['z'], ['9'])
+    merged.merge(OneToOne.PairIndex(max_examples=3).add_columns(a_column, b_column))
+    assert list(merged.conflicts()) == list(whole.conflicts())
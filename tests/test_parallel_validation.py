@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import ParallelValidation
+import RulePlan
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Unique Group': 'g1', 'One To One': 'p1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'One To One': 'p1'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR']},
+]
+
+
+def write_files(tmp_path):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    rows = [f'{i % 60}|{"abcd"[:i % 5]}|{["USD", "EUR", "GBP"][i % 3]}' for i in range(200)]
+    csv_path.write_text('ID|Name|Ccy\n' + '\n'.join(rows) + '\n')
+    return str(rules_path), str(csv_path)
+
+
+def run(rules_path, csv_path, pool=None, wrapper_options=None, **options):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        constraint_set.useWorkerPool(pool)
+        wrapper = CSVWrapper.CSVWrapper(csv_path, **(wrapper_options or {}))
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        if 'shard_size' in options:
+            ParallelValidation.validate_all(constraint_set, 2, shard_size=options.pop('shard_size'), pool=pool)
+        else:
+            constraint_set.validateAll(**options)
+    return sink.errors
+
+
+def test_shared_pool_matches_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    serial = run(rules_path, csv_path)
+    assert len(serial) > 0
+    with ParallelValidation.create_pool(2) as pool:
+        # The same pool checks one file after another, each cut into several shards
+        for _ in range(2):
+            assert run(rules_path, csv_path, pool, shard_size=37) == serial
+        assert run(rules_path, csv_path, pool, workers=2) == serial
+
+
+def test_workers_match_serial_on_mapped_and_encoded_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    serial = run(rules_path, csv_path)
+    # Each call starts its own pool, and the columns are sent to it as shards of their own types
+    for wrapper_options in ({'mapped': True}, {'categorical': True}):
+        assert run(rules_path, csv_path, wrapper_options=wrapper_options, workers=2) == serial
+        assert run(rules_path, csv_path, wrapper_options=wrapper_options, shard_size=37) == serial
@@ -0,0 +1,61 @@
+import importlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+
+def test_plan_with_missing_plugin_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'Code', 'Type': 'Custom', 'Check': 'late_plugin:valid_code'},
+    ]))
+    plan = RulePlan.load(str(rules_path))
+    assert plan.columns[0].col_type == 'str'
+    assert plan.unresolved_types == ('Code',)
+
+    # Once the plugin exists the same, unchanged rule file has to pick it up
+    (tmp_path / 'late_plugin.py').write_text('def valid_code(value):\n    return value.isdigit()\n')
+    importlib.invalidate_caches()
+    plan = RulePlan.load(str(rules_path))
+    assert plan.columns[0].col_type == 'custom'
+    assert plan.unresolved_types == ()
+    assert RulePlan.load(str(rules_path)) == plan
+
+
+def test_cached_plan_whose_plugin_was_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    plugin_path = tmp_path / 'gone_plugin.py'
+    plugin_path.write_text('def ok(value):\n    return value == "ok"\n')
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'Code', 'Type': 'Custom', 'Check': 'gone_plugin:ok'},
+        {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '2'},
+    ]))
+    importlib.invalidate_caches()
+    assert RulePlan.load(str(rules_path)).columns[0].col_type == 'custom'
+
+    plugin_path.unlink()
+    monkeypatch.delitem(sys.modules, 'gone_plugin')
+    importlib.invalidate_caches()
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_text('Code|Name\nbad|abc\n')
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(str(rules_path))
+        wrapper = CSVWrapper.CSVWrapper(str(csv_path))
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll()
+    assert 'gone_plugin' in sink.errors[0] and 'checked as a string' in sink.errors[0]
+    # Code is only held to a string's unlimited length, Name still to its own
+    assert len(sink.errors) == 2
+    assert 'Column: Name' in sink.errors[1]
@@ -0,0 +1,18 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Sampling
+
+
+def test_sample_of_empty_file():
+    for stratified in (False, True):
+        assert Sampling.sample_rows(0, 100, stratified) == []
+        assert Sampling.sample_rows(50, 0, stratified) == []
+
+
+def test_stratified_sample_takes_one_row_per_block():
+    rows = Sampling.sample_rows(1000, 10, True, random.Random(1))
+    assert [row // 100 for row in rows] == list(range(10))
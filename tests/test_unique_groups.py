@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+
+def test_spill_files_removed_at_error_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '10', 'Unique Group': 'g1'},
+    ]))
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_text('ID\n' + ''.join(f'{i}\n' for i in range(100)))
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(str(rules_path))
+        constraint_set.spillGroups(1, str(spill_dir))
+        constraint_set.validateStream(CSVWrapper.CSVWrapper(str(csv_path), streaming=True), maxErrors=3)
+    assert len(sink.errors) > 0
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_spilled_groups_match_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps([
+        {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Unique Group': 'g1'},
+        {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'Trimmed': 'True', 'Unique Group': 'g2'},
+        {'Column': 'Ccy', 'Type': 'TEXT', 'Case Sensitive': 'False', 'Unique Group': 'g2'},
+    ]))
+    csv_path = tmp_path / 'data.csv'
+    rows = [f'{i % 60}|{" abcd"[:i % 6]}|{["USD", "eur", "EUR"][i % 3]}\n' for i in range(300)]
+    csv_path.write_text('ID|Name|Ccy\n' + ''.join(rows))
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+
+    def run(streaming, spill, **wrapper_options):
+        with ErrorLogging.MemorySink() as sink:
+            constraint_set = ConstraintModule.ConstraintSet(str(rules_path))
+            if spill:
+                constraint_set.spillGroups(1, str(spill_dir))
+            wrapper = CSVWrapper.CSVWrapper(str(csv_path), streaming=streaming, **wrapper_options)
+            if streaming:
+                constraint_set.validateStream(wrapper)
+            else:
+                wrapper.loadColumns()
+                constraint_set.matchToColumns(wrapper)
+                constraint_set.validateAll()
+        return sink.errors
+
+    errors = run(False, False)
+    assert any('unique group: g2' in error for error in errors)
+    assert run(False, True) == errors
+    assert run(False, True, categorical=True) == errors
+    # A stream only logs its spilled duplicates once the whole file has been read
+    assert sorted(run(True, True)) == sorted(run(True, False)) == sorted(errors)
+    assert list(spill_dir.iterdir()) == []
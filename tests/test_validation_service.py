@@ -0,0 +1,47 @@
+import json
+import multiprocessing
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import RulePlan
+import ValidationService
+
+
+def run_jobs(rule_sets, jobs):
+    # Runs a worker on a thread and returns the last event of each job
+    connection, worker_connection = multiprocessing.Pipe()
+    worker = threading.Thread(target=ValidationService._worker_main, args=(worker_connection, rule_sets), daemon=True)
+    worker.start()
+    results = []
+    for number, job in enumerate(jobs, 1):
+        connection.send(dict(job, job=number))
+        while (event := connection.recv())[0] == 'errors':
+            pass
+        results.append(event)
+    connection.send(None)
+    worker.join()
+    return results
+
+
+def test_broken_rule_set_only_fails_its_own_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    (tmp_path / 'good.json').write_text(json.dumps([{'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '10'}]))
+    (tmp_path / 'broken.json').write_text('[{"Column": "ID",')
+    (tmp_path / 'settings.json').write_text(json.dumps({'delimiter': ',', 'encoding': 'auto'}))
+    (tmp_path / 'sets.json').write_text(json.dumps({'good': 'good.json', 'broken': 'broken.json',
+                                                    'comma': {'rules': 'good.json', 'handler': 'settings.json'}}))
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_text('ID\n1\n20\n')
+    rule_sets = ValidationService.load_rule_sets(str(tmp_path / 'sets.json'))
+    assert rule_sets['good']['delimiter'] == '|'
+    assert (rule_sets['comma']['delimiter'], rule_sets['comma']['encoding']) == (',', 'auto')
+
+    file = str(csv_path)
+    results = run_jobs(rule_sets, [{'rules': 'broken', 'file': file}, {'rules': 'good', 'file': file, 'stats': True},
+                                   {'rules': 'comma', 'file': file}])
+    assert results[0][0] == 'failed' and 'JSONDecodeError' in results[0][1]['reason']
+    assert results[1][0] == 'done' and results[1][1]['errors'] == 1 and 'stats' in results[1][1]
+    assert results[2][0] == 'done' and results[2][1]['errors'] == 1
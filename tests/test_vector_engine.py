@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+pytest.importorskip('numpy')
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Essential': 'True', 'Unique Group': 'g1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'Trimmed': 'True'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR'], 'Case Sensitive': 'False'},
+    {'Column': 'Amount', 'Type': 'FLOAT', 'Minimum': '-10', 'Maximum': '1000', 'Decimal Places': '2'},
+]
+AMOUNTS = ['1.5', '12.345', '-20', 'abc', '999.99', '1e3', ' 7.25', '-0.10', '1000.001', '']
+
+
+def write_files(tmp_path):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    rows = [f'{["", i % 60, "x", f" {i}"][i % 4]}|{" abcd"[:i % 6]}|{["USD", "eur", "GBP", ""][i % 4]}|{AMOUNTS[i % len(AMOUNTS)]}' for i in range(300)]
+    csv_path.write_text('ID|Name|Ccy|Amount\n' + '\n'.join(rows) + '\n')
+    return str(rules_path), str(csv_path)
+
+
+def run(rules_path, csv_path, engine):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        wrapper = CSVWrapper.CSVWrapper(csv_path)
+        wrapper.loadColumns()
+        constraint_set.matchToColumns(wrapper)
+        constraint_set.validateAll(engine)
+    return sink.errors
+
+
+def test_numpy_engine_matches_python(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    errors = run(rules_path, csv_path, 'python')
+    assert len(errors) > 0
+    assert run(rules_path, csv_path, 'numpy') == errors
@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ConstraintModule
+import CSVWrapper
+import ErrorLogging
+import RulePlan
+
+RULES = [
+    {'Column': 'ID', 'Type': 'INT', 'Minimum': '0', 'Maximum': '50', 'Essential': 'True', 'Unique Group': 'g1'},
+    {'Column': 'Name', 'Type': 'TEXT', 'Maximum': '3', 'Trimmed': 'True'},
+    {'Column': 'Ccy', 'Type': 'TEXT', 'Values': ['USD', 'EUR'], 'Case Sensitive': 'False'},
+    {'Column': 'Amount', 'Type': 'FLOAT', 'Minimum': '-10', 'Maximum': '1000', 'Decimal Places': '2'},
+]
+
+
+def write_files(tmp_path):
+    rules_path = tmp_path / 'rules.json'
+    rules_path.write_text(json.dumps(RULES))
+    csv_path = tmp_path / 'data.csv'
+    rows = [f'{["", i % 60, "x"][i % 7 % 3]}|{" abcd"[:i % 6]}|{["USD", "eur", "GBP", ""][i % 4]}|{["1.5", "12.345", "-20", "abc", "999.99"][i % 5]}' for i in range(300)]
+    csv_path.write_text('ID|Name|Ccy|Amount\n' + '\n'.join(rows) + '\n')
+    return str(rules_path), str(csv_path)
+
+
+def run(rules_path, csv_path, cache_size=None, streaming=False):
+    with ErrorLogging.MemorySink() as sink:
+        constraint_set = ConstraintModule.ConstraintSet(rules_path)
+        if cache_size is not None:
+            constraint_set.enableVerdictCache(cache_size)
+        wrapper = CSVWrapper.CSVWrapper(csv_path, streaming=streaming)
+        if streaming:
+            constraint_set.validateStream(wrapper)
+        else:
+            wrapper.loadColumns()
+            constraint_set.matchToColumns(wrapper)
+            constraint_set.validateAll()
+    return sink.errors, constraint_set.verdictCacheStats()
+
+
+def test_cached_verdicts_match_uncached(tmp_path, monkeypatch):
+    monkeypatch.setattr(RulePlan, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rules_path, csv_path = write_files(tmp_path)
+    for streaming in (False, True):
+        errors, no_stats = run(rules_path, csv_path, streaming=streaming)
+        assert len(errors) > 0 and no_stats == {}
+        # ID has more distinct values than the smaller cache holds, so some verdicts are dropped and worked out again
+        for cache_size in (8, 4096):
+            cached, stats = run(rules_path, csv_path, cache_size, streaming)
+            assert cached == errors
+            assert set(stats) == {'ID', 'Name', 'Amount'}
+            assert stats['ID']['hits'] > 0 and stats['ID']['size'] <= cache_size